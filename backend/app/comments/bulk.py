@@ -0,0 +1,292 @@
+"""
+Потоковый импорт и экспорт комментариев (NDJSON и CSV).
+
+Строка файла - один комментарий:
+id, parent_id, user, email, text, created_at, updated_at, attachments
+(attachments - список {"file", "media_type"}; в CSV - JSON строкой).
+
+Экспорт читает комментарии серверным курсором (.iterator()) пачками,
+вложения подгружаются одним запросом на пачку. Импорт вставляет пачки
+через bulk_create в топологическом порядке: строка, чей родитель еще не
+вставлен, ждет его, после вставки родителя id в файле заменяется новым id.
+Сигналы при bulk_create не вызываются, поэтому после импорта счетчики
+пересчитываются командой rebuild_comment_counters.
+"""
+import csv
+import gzip
+import json
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from itertools import batched
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from app.comments.models import Comment, CommentAttachment
+from app.core.json import dumps_text, loads
+
+
+FIELDS = ["id", "parent_id", "user", "email", "text", "created_at", "updated_at", "attachments"]
+FORMATS = ("ndjson", "csv")
+
+
+class BulkFormatError(ValueError):
+    """Некорректная строка во входном файле"""
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path.removesuffix(".gz")
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+@contextmanager
+def open_text(path, mode):
+    """Файл, .gz файл или stdin/stdout ("-") в текстовом режиме"""
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, mode + "t", encoding="utf-8", newline="") as stream:
+        yield stream
+
+
+# ============================================
+# ЭКСПОРТ
+# ============================================
+def iter_export_rows(batch_size=1000):
+    """Комментарии в порядке id вместе с вложениями"""
+    rows = (
+        Comment.objects.order_by("id")
+        .values_list(
+            "id", "reply_id", "user__username", "user__email", "text", "created_at", "updated_at"
+        )
+        .iterator(chunk_size=batch_size)
+    )
+    for batch in batched(rows, batch_size):
+        attachments = {}
+        for comment_id, file, media_type in (
+            CommentAttachment.objects.filter(comment_id__in=[row[0] for row in batch])
+            .order_by("comment_id", "id")
+            .values_list("comment_id", "file", "media_type")
+        ):
+            attachments.setdefault(comment_id, []).append({"file": file, "media_type": media_type})
+
+        for pk, parent_id, username, email, text, created_at, updated_at in batch:
+            yield {
+                "id": pk,
+                "parent_id": parent_id,
+                "user": username,
+                "email": email,
+                "text": text,
+                "created_at": created_at.isoformat(),
+                "updated_at": updated_at.isoformat(),
+                "attachments": attachments.get(pk, []),
+            }
+
+
+def write_rows(rows, stream, fmt):
+    """Пишет строки в stream, возвращает их число"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, "attachments": dumps_text(row["attachments"])})
+            count += 1
+    else:
+        for row in rows:
+            stream.write(dumps_text(row))
+            stream.write("\n")
+            count += 1
+    return count
+
+
+# ============================================
+# ИМПОРТ
+# ============================================
+def read_rows(stream, fmt):
+    """Строки файла, приведенные к типам (BulkFormatError с номером строки)"""
+    if fmt == "csv":
+        source, start = csv.DictReader(stream), 2
+    else:
+        source, start = stream, 1
+
+    for number, raw in enumerate(source, start=start):
+        if fmt != "csv" and not raw.strip():
+            continue
+        try:
+            yield parse_row(raw if fmt == "csv" else loads(raw))
+        except (KeyError, TypeError, ValueError) as exc:
+            raise BulkFormatError(f"Row {number}: {exc!r}") from exc
+
+
+def _parse_int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def _parse_datetime(value):
+    if not value:
+        return timezone.now()
+    value = datetime.fromisoformat(value)
+    return value if timezone.is_aware(value) else timezone.make_aware(value, dt_timezone.utc)
+
+
+def parse_row(raw):
+    attachments = raw.get("attachments") or []
+    if isinstance(attachments, str):
+        attachments = json.loads(attachments)
+    if not raw["user"] or not raw["text"]:
+        raise ValueError("user and text are required")
+
+    return {
+        "id": _parse_int(raw.get("id")),
+        "parent_id": _parse_int(raw.get("parent_id")),
+        "user": raw["user"],
+        "email": raw.get("email") or "",
+        "text": raw["text"],
+        "created_at": _parse_datetime(raw.get("created_at")),
+        "updated_at": _parse_datetime(raw.get("updated_at") or raw.get("created_at")),
+        "attachments": [(item["file"], item.get("media_type", "")) for item in attachments],
+    }
+
+
+@contextmanager
+def preserve_timestamps():
+    """Отключает auto_now/auto_now_add, чтобы сохранить даты из файла"""
+    fields = [Comment._meta.get_field("created_at"), Comment._meta.get_field("updated_at")]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class CommentImporter:
+    """
+    Вставляет комментарии пачками, сохраняя дерево.
+
+    importer = CommentImporter(batch_size=1000)
+    for row in read_rows(stream, "ndjson"):
+        importer.add(row)
+    importer.finish()
+    """
+
+    def __init__(self, batch_size=1000, clean_text=None, orphans="skip"):
+        self.batch_size = batch_size
+        self.clean_text = clean_text
+        self.orphans = orphans
+
+        self.id_map = {}  # id в файле -> новый id
+        self.waiting = {}  # id родителя в файле -> строки, ждущие его вставки
+        self.waiting_count = 0
+        self.ready = []
+        self.flush_at = batch_size
+        self.users = {}  # username -> id
+
+        self.comments = 0
+        self.attachments = 0
+        self.skipped = 0
+
+    def add(self, row):
+        parent_id = row["parent_id"]
+        if parent_id is None or parent_id in self.id_map:
+            self.ready.append(row)
+        else:
+            self.waiting.setdefault(parent_id, []).append(row)
+            self.waiting_count += 1
+
+        # Ответы обычно ждут родителя из той же пачки, поэтому считаем и их:
+        # вставка родителей освобождает детей, и так поколение за поколением.
+        # Строки, чьи родители в файле еще не встречались, порог не сдвигают.
+        if len(self.ready) + self.waiting_count >= self.flush_at:
+            self.flush()
+            self.flush_at = self.waiting_count + self.batch_size
+
+    def flush(self):
+        while self.ready:
+            batch = self.ready[:self.batch_size]
+            del self.ready[:self.batch_size]
+            self._insert(batch)
+
+    def finish(self):
+        self.flush()
+
+        if self.orphans == "root" and self.waiting:
+            # Строки, чьих родителей нет в файле, становятся корнями вместе с поддеревом
+            waiting_ids = {row["id"] for rows in self.waiting.values() for row in rows}
+            for parent_id in [key for key in self.waiting if key not in waiting_ids]:
+                for row in self.waiting.pop(parent_id):
+                    row["parent_id"] = None
+                    self.ready.append(row)
+                    self.waiting_count -= 1
+            self.flush()
+
+        # Остались строки без родителя (или циклы)
+        self.skipped = self.waiting_count
+        self.waiting.clear()
+        self.waiting_count = 0
+
+    def _insert(self, batch):
+        user_ids = self._resolve_users(batch)
+        comments = []
+        for row in batch:
+            text = self.clean_text(row["text"]) if self.clean_text else row["text"]
+            comments.append(
+                Comment(
+                    user_id=user_ids[row["user"]],
+                    text=text,
+                    reply_id=self.id_map.get(row["parent_id"]),
+                    created_at=row["created_at"],
+                    updated_at=row["updated_at"],
+                    last_activity_at=row["updated_at"],
+                    attachment_count=len(row["attachments"]),
+                )
+            )
+
+        with transaction.atomic(), preserve_timestamps():
+            Comment.objects.bulk_create(comments)
+            attachments = [
+                CommentAttachment(comment_id=comment.pk, file=file, media_type=media_type)
+                for row, comment in zip(batch, comments)
+                for file, media_type in row["attachments"]
+            ]
+            CommentAttachment.objects.bulk_create(attachments)
+
+        self.comments += len(comments)
+        self.attachments += len(attachments)
+        for row, comment in zip(batch, comments):
+            if row["id"] is not None:
+                self.id_map[row["id"]] = comment.pk
+                children = self.waiting.pop(row["id"], ())
+                self.ready.extend(children)
+                self.waiting_count -= len(children)
+
+    def _resolve_users(self, batch):
+        missing = {row["user"]: row["email"] for row in batch if row["user"] not in self.users}
+        if missing:
+            User = get_user_model()
+            found = dict(
+                User.objects.filter(username__in=missing).values_list("username", "id")
+            )
+            new_users = []
+            for username, email in missing.items():
+                if username not in found:
+                    user = User(username=username, email=email)
+                    user.set_unusable_password()
+                    new_users.append(user)
+            if new_users:
+                User.objects.bulk_create(new_users, ignore_conflicts=True)
+                found.update(
+                    User.objects.filter(username__in=[user.username for user in new_users])
+                    .values_list("username", "id")
+                )
+            self.users.update(found)
+        return self.users
@@ -1,5 +1,12 @@
-import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from app.comments.events import EVENT_ID_RE, get_event_log, parse_event_id
+from app.comments.presence import get_presence_tracker
+from app.core.json import dumps_text
+from app.core.metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_GROUPS
 
 
 class ReplyConsumer(AsyncWebsocketConsumer):
@@ -14,25 +21,69 @@ class ReplyConsumer(AsyncWebsocketConsumer):
         # Получаем ID комментария из URL
         self.comment_id = self.scope["url_route"]["kwargs"]["comment_name"]
         self.room_group_name = f"comment_{self.comment_id}"
+        self.last_event_id = None
 
         # Присоединяемся к группе
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
-        
+
+        # Учитываем зрителя ветки (счетчик обновится при ближайшем flush)
+        tracker = get_presence_tracker()
+        tracker.join(self.room_group_name, self.channel_name, self.channel_layer)
+        WEBSOCKET_CONNECTIONS.inc()
+        if tracker.count_local(self.room_group_name) == 1:
+            WEBSOCKET_GROUPS.inc()
+
+        # Догружаем события, пропущенные за время отключения (?since=<event_id>)
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since", [None])[0]
+        if since and EVENT_ID_RE.match(since):
+            await self.replay_missed_events(since)
+
         print(f"✅ WebSocket connected: user={user.username}, comment={self.comment_id}")
 
     async def disconnect(self, close_code):
         # Безопасная отписка (только если connect завершился успешно)
         if hasattr(self, "room_group_name") and hasattr(self, "comment_id"):
+            tracker = get_presence_tracker()
+            tracker.leave(self.room_group_name, self.channel_name)
+            WEBSOCKET_CONNECTIONS.dec()
+            if tracker.count_local(self.room_group_name) == 0:
+                WEBSOCKET_GROUPS.dec()
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
             print(f"🔌 WebSocket disconnected: comment={self.comment_id}, code={close_code}")
         else:
             print(f"🔌 WebSocket disconnected early: code={close_code}")
 
+    async def replay_missed_events(self, since):
+        """Отправляет события из журнала ветки, появившиеся после `since`"""
+        missed = await get_event_log().read_since(
+            self.comment_id, since, settings.EVENT_LOG_REPLAY_LIMIT
+        )
+        if missed is None:
+            # Журнал уже не содержит since - клиент должен перезагрузить ветку
+            await self.send(text_data=dumps_text({"type": "resync_required"}))
+            return
+
+        for event_id, event in missed:
+            await self.new_reply({**event, "event_id": event_id})
+
     async def new_reply(self, event):
         """Отправляет новый ответ всем подключенным клиентам"""
+        event_id = event.get("event_id")
+        if event_id is not None:
+            # Событие могло прийти и из журнала, и из группы - отправляем один раз
+            if self.last_event_id and parse_event_id(event_id) <= parse_event_id(self.last_event_id):
+                return
+            self.last_event_id = event_id
+
         reply_data = event["reply"]
         await self.send(
-            text_data=json.dumps({"type": "new_reply", "data": reply_data})
+            text_data=dumps_text({"type": "new_reply", "id": event_id, "data": reply_data})
         )
         print(f"📨 Sent reply notification for comment {self.comment_id}")
+
+    async def presence(self, event):
+        """Отправляет актуальное число зрителей ветки"""
+        await self.send(
+            text_data=dumps_text({"type": "presence", "data": {"viewers": event["viewers"]}})
+        )
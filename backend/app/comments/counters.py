@@ -0,0 +1,165 @@
+"""
+Денормализованные счетчики веток комментариев.
+
+reply_count - число прямых ответов, descendant_count - число всех потомков,
+attachment_count - число вложений, last_activity_at - время последней
+активности в поддереве (включая смену username/email авторов, которые
+встраиваются в ответы). Счетчики обновляются атомарными F() выражениями
+из сигналов (app.comments.signals), так что параллельные ответы не теряют
+инкременты, а списки могут показывать сводку ветки без чтения ответов.
+"""
+from django.db import connections, router
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from app.comments.models import Comment, CommentAttachment
+
+
+ANCESTORS_SQL = """
+WITH RECURSIVE ancestors (id, reply_id) AS (
+    SELECT id, reply_id FROM {table} WHERE {seed} = %s
+    UNION
+    SELECT parent.id, parent.reply_id FROM {table} parent
+    JOIN ancestors child ON parent.id = child.reply_id
+)
+SELECT id FROM ancestors
+"""
+
+
+def _select_ancestors(seed, value):
+    """
+    id комментариев, где seed = value, и всех их предков одним рекурсивным
+    запросом (primary). UNION отбрасывает повторы, поэтому цикл в reply_id
+    не зацикливает запрос.
+    """
+    connection = connections[router.db_for_write(Comment)]
+    sql = ANCESTORS_SQL.format(table=connection.ops.quote_name(Comment._meta.db_table), seed=seed)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_ancestor_ids(parent_id):
+    """id родителя и всех его предков"""
+    return _select_ancestors("id", parent_id)
+
+
+def _apply_to_ancestors(parent_id, replies_delta, descendants_delta, activity_at):
+    ancestor_ids = get_ancestor_ids(parent_id)
+    if not ancestor_ids:
+        return
+
+    # Счетчики не уходят ниже нуля, даже если разошлись с данными
+    # (PositiveIntegerField: отрицательное значение - IntegrityError в Postgres)
+    Comment.objects.filter(pk__in=ancestor_ids).update(
+        reply_count=Greatest(
+            F("reply_count")
+            + Case(When(pk=parent_id, then=Value(replies_delta)), default=Value(0)),
+            Value(0),
+        ),
+        descendant_count=Greatest(F("descendant_count") + descendants_delta, Value(0)),
+        last_activity_at=Greatest(F("last_activity_at"), Value(activity_at)),
+    )
+
+
+def comment_created(comment):
+    if comment.reply_id is not None:
+        _apply_to_ancestors(comment.reply_id, 1, 1, comment.created_at)
+
+
+def comment_updated(comment, previous_reply_id):
+    now = timezone.now()
+    subtree_size = 1 + comment.descendant_count
+
+    if previous_reply_id != comment.reply_id:
+        # Комментарий перенесен в другую ветку вместе со своим поддеревом
+        if previous_reply_id is not None:
+            _apply_to_ancestors(previous_reply_id, -1, -subtree_size, now)
+        if comment.reply_id is not None:
+            _apply_to_ancestors(comment.reply_id, 1, subtree_size, now)
+    elif comment.reply_id is not None:
+        _apply_to_ancestors(comment.reply_id, 0, 0, now)
+
+    Comment.objects.filter(pk=comment.pk).update(
+        last_activity_at=Greatest(F("last_activity_at"), Value(now))
+    )
+
+
+def comment_deleted(comment):
+    # Прямые ответы удаленного комментария становятся корневыми (SET_NULL),
+    # поэтому предки теряют все поддерево целиком
+    if comment.reply_id is not None:
+        _apply_to_ancestors(
+            comment.reply_id, -1, -(1 + comment.descendant_count), timezone.now()
+        )
+
+
+def user_changed(user_id):
+    """
+    Профиль автора встраивается в ответы: его комментарии и их предки
+    получают новую last_activity_at, а с ней и новый ETag
+    """
+    comment_ids = _select_ancestors("user_id", user_id)
+    if comment_ids:
+        Comment.objects.filter(pk__in=comment_ids).update(
+            last_activity_at=Greatest(F("last_activity_at"), Value(timezone.now()))
+        )
+
+
+def attachment_added(attachment):
+    Comment.objects.filter(pk=attachment.comment_id).update(
+        attachment_count=F("attachment_count") + 1
+    )
+
+
+def attachment_removed(attachment):
+    Comment.objects.filter(pk=attachment.comment_id, attachment_count__gt=0).update(
+        attachment_count=F("attachment_count") - 1
+    )
+
+
+def compute_counters():
+    """
+    Считает правильные значения счетчиков для всех комментариев.
+    Возвращает {id: (reply_count, descendant_count, attachment_count, last_activity_at)}.
+    """
+    parents = {}
+    children = {}
+    activity = {}
+    for comment_id, parent_id, updated_at in Comment.objects.values_list(
+        "id", "reply_id", "updated_at"
+    ).iterator(chunk_size=5000):
+        parents[comment_id] = parent_id
+        activity[comment_id] = updated_at
+        children.setdefault(parent_id, []).append(comment_id)
+
+    attachments = dict(
+        CommentAttachment.objects.values("comment_id")
+        .annotate(total=Count("id"))
+        .values_list("comment_id", "total")
+    )
+
+    # Обход в обратном порядке BFS: потомки считаются раньше предков
+    order = []
+    queue = [comment_id for comment_id in children.get(None, ())]
+    while queue:
+        order.extend(queue)
+        queue = [child for comment_id in queue for child in children.get(comment_id, ())]
+
+    descendants = {}
+    for comment_id in reversed(order):
+        kids = children.get(comment_id, ())
+        descendants[comment_id] = sum(1 + descendants[kid] for kid in kids)
+        for kid in kids:
+            activity[comment_id] = max(activity[comment_id], activity[kid])
+
+    return {
+        comment_id: (
+            len(children.get(comment_id, ())),
+            descendants[comment_id],
+            attachments.get(comment_id, 0),
+            activity[comment_id],
+        )
+        for comment_id in order
+    }
@@ -0,0 +1,194 @@
+"""
+Журнал событий веток комментариев для догрузки пропущенных событий.
+
+Каждое событие, рассылаемое в группу `comment_<root_id>`, сначала
+записывается в ограниченный по длине и времени жизни журнал (Redis stream)
+и получает id. Клиент, переподключаясь, передает `?since=<event_id>`
+и получает только пропущенные события вместо полной перезагрузки ветки.
+"""
+import asyncio
+import re
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from app.core.json import dumps, loads
+from app.core.metrics import timed_group_send
+from app.core.redis import get_async_redis, get_sync_redis
+from app.core.timing import timed
+
+
+EVENT_ID_RE = re.compile(r"^\d+-\d+$")
+
+
+def parse_event_id(event_id):
+    """Преобразует id события ("<ms>-<seq>") в кортеж для сравнения"""
+    ms, seq = event_id.split("-")
+    return int(ms), int(seq)
+
+
+def group_name_for(root_id):
+    return f"comment_{root_id}"
+
+
+class LocalEventLog:
+    """Журнал в памяти процесса (для тестов и разработки без Redis)"""
+
+    def __init__(self, maxlen, ttl):
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self._streams = {}
+        self._last_id = (0, 0)
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_id
+        self._last_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        return "%d-%d" % self._last_id
+
+    def append(self, root_id, events):
+        return self.append_many({root_id: events})[root_id]
+
+    def append_many(self, events_by_root):
+        min_ms = int((time.time() - self.ttl) * 1000)
+        ids_by_root = {}
+        with self._lock:
+            for root_id, events in events_by_root.items():
+                stream = self._streams.setdefault(str(root_id), [])
+                ids = ids_by_root[root_id] = []
+                for event in events:
+                    event_id = self._next_id()
+                    stream.append((event_id, event))
+                    ids.append(event_id)
+
+                stream[:] = [
+                    entry for entry in stream[-self.maxlen:]
+                    if parse_event_id(entry[0])[0] >= min_ms
+                ]
+        return ids_by_root
+
+    async def read_since(self, root_id, since, limit):
+        with self._lock:
+            stream = list(self._streams.get(str(root_id), ()))
+        if not stream or parse_event_id(stream[0][0]) > parse_event_id(since):
+            return None
+        since_key = parse_event_id(since)
+        missed = [entry for entry in stream if parse_event_id(entry[0]) > since_key]
+        return missed[:limit]
+
+
+class RedisEventLog:
+    """Журнал на Redis streams: XADD с MAXLEN и отсечением по MINID"""
+
+    def __init__(self, url, maxlen, ttl, key_prefix="events"):
+        self.url = url
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def _key(self, root_id):
+        return f"{self.key_prefix}:comment_{root_id}"
+
+    def append(self, root_id, events):
+        return self.append_many({root_id: events})[root_id]
+
+    def append_many(self, events_by_root):
+        """Записывает события нескольких веток одним pipeline"""
+        min_id = "%d-0" % int((time.time() - self.ttl) * 1000)
+
+        pipe = get_sync_redis(self.url).pipeline(transaction=False)
+        for root_id, events in events_by_root.items():
+            key = self._key(root_id)
+            for event in events:
+                pipe.xadd(
+                    key,
+                    {"data": dumps(event)},
+                    maxlen=self.maxlen,
+                    approximate=True,
+                )
+            pipe.xtrim(key, minid=min_id, approximate=True)
+            pipe.expire(key, self.ttl)
+        results = iter(pipe.execute())
+
+        ids_by_root = {}
+        for root_id, events in events_by_root.items():
+            ids_by_root[root_id] = [next(results).decode() for _ in events]
+            next(results), next(results)
+        return ids_by_root
+
+    async def read_since(self, root_id, since, limit):
+        """
+        Возвращает события после `since` или None, если журнал уже не
+        содержит `since` (истек или обрезан) и клиенту нужна полная
+        перезагрузка ветки.
+        """
+        client = get_async_redis(self.url)
+        key = self._key(root_id)
+
+        pipe = client.pipeline(transaction=False)
+        pipe.xrange(key, count=1)
+        pipe.xrange(key, min=f"({since}", count=limit)
+        oldest, missed = await pipe.execute()
+
+        if not oldest or parse_event_id(oldest[0][0].decode()) > parse_event_id(since):
+            return None
+        return [
+            (event_id.decode(), loads(fields[b"data"]))
+            for event_id, fields in missed
+        ]
+
+
+_event_log = None
+
+
+def get_event_log():
+    global _event_log
+    if _event_log is None:
+        if settings.EVENT_LOG_BACKEND == "redis":
+            _event_log = RedisEventLog(
+                settings.EVENT_LOG_REDIS_URL,
+                maxlen=settings.EVENT_LOG_MAXLEN,
+                ttl=settings.EVENT_LOG_TTL,
+            )
+        else:
+            _event_log = LocalEventLog(
+                maxlen=settings.EVENT_LOG_MAXLEN,
+                ttl=settings.EVENT_LOG_TTL,
+            )
+    return _event_log
+
+
+def publish_events(events_by_root):
+    """
+    Записывает события в журналы веток и рассылает их в группы.
+    Все рассылки выполняются конкурентно за один переход в event loop.
+    """
+    with timed("channels"):
+        ids_by_root = get_event_log().append_many(events_by_root)
+    channel_layer = get_channel_layer()
+
+    messages = [
+        (group_name_for(root_id), {**event, "event_id": event_id})
+        for root_id, events in events_by_root.items()
+        for event, event_id in zip(events, ids_by_root[root_id])
+    ]
+
+    async def send_all():
+        await asyncio.gather(
+            *(timed_group_send(channel_layer, group, message) for group, message in messages)
+        )
+
+    with timed("channels"):
+        async_to_sync(send_all)()
+    return ids_by_root
+
+
+def publish_reply(root_id, reply_data):
+    """Записывает событие new_reply в журнал ветки и рассылает его в группу"""
+    event = {"type": "new_reply", "reply": reply_data}
+    (event_id,) = publish_events({root_id: [event]})[root_id]
+    return event_id
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.comments.bulk import FORMATS, detect_format, iter_export_rows, open_text, write_rows
+
+
+class Command(BaseCommand):
+    help = "Export all comments with parent links and attachments to NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Output file (.ndjson, .csv, optionally .gz) or - for stdout")
+        parser.add_argument("--format", choices=FORMATS, help="Default: by file extension, ndjson for -")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options["output"], options["format"])
+        # Отчет в stderr, если данные идут в stdout
+        report = self.stderr if options["output"] == "-" else self.stdout
+
+        started = time.monotonic()
+        with open_text(options["output"], "w") as stream:
+            count = write_rows(iter_export_rows(options["batch_size"]), stream, fmt)
+        elapsed = time.monotonic() - started
+
+        report.write(
+            f"Exported {count} comments in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)"
+        )
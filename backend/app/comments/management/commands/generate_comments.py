@@ -0,0 +1,148 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.comments.bulk import CommentImporter
+from app.comments.models import Comment
+
+
+WORDS = (
+    "comment reply thread django channels redis cache query index latency "
+    "queue worker socket stream tree depth page cursor token event model "
+    "agree disagree thanks great question answer idea issue fix test"
+).split()
+TAGS = ("<strong>{}</strong>", "<i>{}</i>", "<code>{}</code>", '<a href="https://example.com" title="link">{}</a>')
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic comments for benchmarks: thread sizes follow a power law "
+        "(Pareto), replies form deep chains, some comments have attachments, "
+        "authors are picked from many users with a skewed activity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=1000, help="Number of top-level comments")
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument(
+            "--alpha",
+            type=float,
+            default=1.2,
+            help="Pareto shape of thread sizes: smaller means heavier tail",
+        )
+        parser.add_argument("--max-thread-size", type=int, default=5000)
+        parser.add_argument(
+            "--chain-probability",
+            type=float,
+            default=0.35,
+            help="Probability that a reply answers the previous reply (builds deep chains)",
+        )
+        parser.add_argument("--attachment-rate", type=float, default=0.05)
+        parser.add_argument("--days", type=int, default=90, help="Spread of created_at")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--clear", action="store_true", help="Delete existing comments first")
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1 or options["users"] < 1 or options["alpha"] <= 0:
+            raise CommandError("--threads and --users must be positive, --alpha greater than zero")
+
+        if options["clear"]:
+            Comment.objects.all().delete()
+
+        started = time.monotonic()
+        importer = CommentImporter(batch_size=options["batch_size"])
+        stats = {"threads": 0, "max_thread_size": 0, "max_depth": 0}
+        for row in generate_rows(stats=stats, **options):
+            importer.add(row)
+        importer.finish()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            f"Generated {importer.comments} comments in {stats['threads']} threads "
+            f"({importer.comments / max(elapsed, 1e-9):.0f} rows/s), attachments: {importer.attachments}"
+        )
+        self.stdout.write(
+            f"Largest thread: {stats['max_thread_size']} comments, deepest chain: {stats['max_depth']}"
+        )
+
+        call_command("rebuild_comment_counters", stdout=self.stdout)
+        cache.delete("comment_preview_list")
+        self.stdout.write(self.style.SUCCESS("Generation finished"))
+
+
+def generate_rows(threads, users, alpha, max_thread_size, chain_probability,
+                  attachment_rate, days, seed, stats=None, **kwargs):
+    """Строки в формате app.comments.bulk.parse_row, родитель всегда раньше ответа"""
+    rng = random.Random(seed)
+    stats = stats if stats is not None else {}
+    stats.update(threads=0, max_thread_size=0, max_depth=0)
+
+    # Активность пользователей тоже неравномерна: вес i-го ~ 1 / (i + 1)
+    usernames = [f"user{i}" for i in range(users)]
+    cum_weights = list(accumulate(1 / (i + 1) for i in range(users)))
+
+    now = timezone.now()
+    next_id = 1
+    for _ in range(threads):
+        size = min(max_thread_size, int(rng.paretovariate(alpha)))
+        created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+
+        root_id = last_id = next_id
+        ids, depths = [root_id], {root_id: 0}
+        for position in range(size):
+            pk = next_id
+            next_id += 1
+            if position == 0:
+                parent_id = None
+            else:
+                roll = rng.random()
+                if roll < chain_probability:
+                    parent_id = last_id
+                elif roll < chain_probability + (1 - chain_probability) / 2:
+                    parent_id = root_id
+                else:
+                    parent_id = rng.choice(ids)
+                ids.append(pk)
+                depths[pk] = depths[parent_id] + 1
+                created_at += timedelta(seconds=rng.expovariate(1 / 600))
+            last_id = pk
+
+            username = rng.choices(usernames, cum_weights=cum_weights)[0]
+            yield {
+                "id": pk,
+                "parent_id": parent_id,
+                "user": username,
+                "email": f"{username}@example.com",
+                "text": _text(rng),
+                "created_at": created_at,
+                "updated_at": created_at,
+                "attachments": _attachments(rng, pk) if rng.random() < attachment_rate else [],
+            }
+
+        stats["threads"] += 1
+        stats["max_thread_size"] = max(stats["max_thread_size"], size)
+        stats["max_depth"] = max(stats["max_depth"], max(depths.values()))
+
+
+def _text(rng):
+    words = rng.choices(WORDS, k=max(1, int(rng.lognormvariate(2.5, 0.8))))
+    if rng.random() < 0.2:
+        index = rng.randrange(len(words))
+        words[index] = rng.choice(TAGS).format(words[index])
+    return " ".join(words).capitalize()
+
+
+def _attachments(rng, pk):
+    if rng.random() < 0.8:
+        return [
+            (f"https://res.cloudinary.com/demo/image/upload/comments/{pk}_{index}.jpg", "image")
+            for index in range(rng.randint(1, 3))
+        ]
+    return [(f"https://res.cloudinary.com/demo/raw/upload/comments/{pk}.txt", "file")]
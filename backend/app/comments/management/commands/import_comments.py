@@ -0,0 +1,76 @@
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from app.comments.bulk import (
+    FORMATS,
+    BulkFormatError,
+    CommentImporter,
+    detect_format,
+    open_text,
+    read_rows,
+)
+from app.comments.sanitizer import clean_html
+
+
+class Command(BaseCommand):
+    help = (
+        "Import comments from NDJSON or CSV (see app.comments.bulk) with batched bulk_create. "
+        "Parent ids are remapped, missing users are created without a password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Input file (.ndjson, .csv, optionally .gz) or - for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Default: by file extension, ndjson for -")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--orphans",
+            choices=["skip", "root"],
+            default="skip",
+            help="What to do with comments whose parent is not in the file",
+        )
+        parser.add_argument(
+            "--no-clean",
+            action="store_true",
+            help="Do not sanitize text with bleach (trusted dumps made by export_comments)",
+        )
+        parser.add_argument(
+            "--skip-counters",
+            action="store_true",
+            help="Do not run rebuild_comment_counters after the import",
+        )
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options["input"], options["format"])
+        clean_text = None if options["no_clean"] else clean_html
+        importer = CommentImporter(
+            batch_size=options["batch_size"], clean_text=clean_text, orphans=options["orphans"]
+        )
+
+        started = reported = time.monotonic()
+        try:
+            with open_text(options["input"], "r") as stream:
+                for row in read_rows(stream, fmt):
+                    importer.add(row)
+                    if time.monotonic() - reported >= 5:
+                        reported = time.monotonic()
+                        self._report("Imported", importer.comments, reported - started)
+                importer.finish()
+        except BulkFormatError as exc:
+            raise CommandError(f"{exc} ({importer.comments} comments imported before the error)")
+
+        elapsed = time.monotonic() - started
+        self._report("Imported", importer.comments, elapsed)
+        self.stdout.write(f"Attachments: {importer.attachments}, skipped orphans: {importer.skipped}")
+
+        if not options["skip_counters"]:
+            call_command("rebuild_comment_counters", stdout=self.stdout)
+        cache.delete("comment_preview_list")
+        self.stdout.write(self.style.SUCCESS("Import finished"))
+
+    def _report(self, action, count, elapsed):
+        self.stdout.write(
+            f"{action} {count} comments in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)"
+        )
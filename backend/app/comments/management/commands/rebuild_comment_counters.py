@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.comments.counters import compute_counters
+from app.comments.models import Comment
+
+
+COUNTER_FIELDS = ["reply_count", "descendant_count", "attachment_count"]
+
+
+class Command(BaseCommand):
+    help = "Check and rebuild denormalized comment counters (replies, descendants, attachments, activity)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report comments with wrong counters; exit with an error if any",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expected = compute_counters()
+
+        stale = []
+        current = Comment.objects.only(
+            "id", "last_activity_at", *COUNTER_FIELDS
+        ).iterator(chunk_size=options["batch_size"])
+        for comment in current:
+            if comment.id not in expected:
+                continue
+            reply_count, descendant_count, attachment_count, activity_at = expected[comment.id]
+            if (
+                (comment.reply_count, comment.descendant_count, comment.attachment_count)
+                != (reply_count, descendant_count, attachment_count)
+                # Удаления сдвигают активность вперед, поэтому ошибкой считаем только отставание
+                or comment.last_activity_at < activity_at
+            ):
+                comment.reply_count = reply_count
+                comment.descendant_count = descendant_count
+                comment.attachment_count = attachment_count
+                comment.last_activity_at = max(comment.last_activity_at, activity_at)
+                stale.append(comment)
+
+        self.stdout.write(f"Checked {len(expected)} comments, {len(stale)} with stale counters")
+
+        if options["check"]:
+            for comment in stale[:20]:
+                self.stdout.write(f"  comment {comment.id}")
+            if stale:
+                raise CommandError(f"{len(stale)} comments have stale counters")
+            return
+
+        with transaction.atomic():
+            Comment.objects.bulk_update(
+                stale,
+                COUNTER_FIELDS + ["last_activity_at"],
+                batch_size=options["batch_size"],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {len(stale)} comments"))
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.comments.outbox import relay_outbox_events
+
+
+class Command(BaseCommand):
+    help = "Publish outbox events (new replies) to the channel layer in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Relay all pending events and exit",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.OUTBOX_RELAY_BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.OUTBOX_RELAY_INTERVAL,
+            help="Seconds to sleep when the outbox is drained",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Outbox relay started (batch size {batch_size})")
+
+        while True:
+            close_old_connections()
+            relayed = relay_outbox_events(batch_size)
+
+            if relayed < batch_size:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
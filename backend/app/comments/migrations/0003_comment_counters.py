@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    # Самодостаточная копия app.comments.counters.compute_counters на исторических
+    # моделях: миграция не должна зависеть от кода приложения, который меняется
+    Comment = apps.get_model("comments", "Comment")
+    CommentAttachment = apps.get_model("comments", "CommentAttachment")
+
+    children = {}
+    activity = {}
+    for comment_id, parent_id, updated_at in Comment.objects.values_list(
+        "id", "reply_id", "updated_at"
+    ).iterator(chunk_size=5000):
+        activity[comment_id] = updated_at
+        children.setdefault(parent_id, []).append(comment_id)
+
+    attachments = dict(
+        CommentAttachment.objects.values("comment_id")
+        .annotate(total=models.Count("id"))
+        .values_list("comment_id", "total")
+    )
+
+    # Обход в обратном порядке BFS: потомки считаются раньше предков
+    order = []
+    queue = list(children.get(None, ()))
+    while queue:
+        order.extend(queue)
+        queue = [child for comment_id in queue for child in children.get(comment_id, ())]
+
+    descendants = {}
+    comments = []
+    for comment_id in reversed(order):
+        kids = children.get(comment_id, ())
+        descendants[comment_id] = sum(1 + descendants[kid] for kid in kids)
+        for kid in kids:
+            activity[comment_id] = max(activity[comment_id], activity[kid])
+        comments.append(
+            Comment(
+                id=comment_id,
+                reply_count=len(kids),
+                descendant_count=descendants[comment_id],
+                attachment_count=attachments.get(comment_id, 0),
+                last_activity_at=activity[comment_id],
+            )
+        )
+    Comment.objects.bulk_update(
+        comments,
+        ["reply_count", "descendant_count", "attachment_count", "last_activity_at"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0002_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='attachment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from app.users.models import User
 
@@ -17,6 +18,22 @@ class Comment(models.Model):
         related_name="replies",
     )
 
+    # Денормализованные счетчики ветки. Поддерживаются атомарными F()
+    # обновлениями в app.comments.counters, пересчитываются командой
+    # `manage.py rebuild_comment_counters`.
+    reply_count = models.PositiveIntegerField(default=0)
+    descendant_count = models.PositiveIntegerField(default=0)
+    attachment_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем родителя, чтобы отследить перенос комментария в другую ветку
+        if "reply_id" in instance.__dict__:
+            instance._loaded_reply_id = instance.reply_id
+        return instance
+
     def get_root_comment(self):
         current = self
         while current.reply is not None:
@@ -30,3 +47,14 @@ class CommentAttachment(models.Model):
     )
     file = models.URLField()
     media_type = models.CharField(max_length=50)
+
+
+class OutboxEvent(models.Model):
+    """
+    Событие, записанное в той же транзакции, что и изменение комментария.
+    Публикуется в channel layer отдельным relay процессом после коммита.
+    """
+
+    comment_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
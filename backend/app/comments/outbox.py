@@ -0,0 +1,101 @@
+"""
+Transactional outbox для рассылки событий веток.
+
+Запрос на создание ответа только записывает OutboxEvent в той же транзакции,
+что и сам комментарий. Отдельный relay процесс (`manage.py relay_outbox`)
+пачками забирает события после коммита, сериализует комментарии одним
+набором запросов и публикует их в журнал событий и channel layer.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from app.comments.events import publish_events
+from app.comments.models import Comment, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+NEW_REPLY = "new_reply"
+
+
+def record_reply_created(comment):
+    """Записывает событие new_reply. Вызывать внутри транзакции создания ответа."""
+    OutboxEvent.objects.create(comment_id=comment.id, event_type=NEW_REPLY)
+
+    if settings.OUTBOX_RELAY_ON_COMMIT:
+        # Режим без relay процесса (разработка): публикуем сразу после коммита
+        transaction.on_commit(relay_outbox_events)
+
+
+def get_root_ids(comments):
+    """
+    Находит id корневых комментариев для набора комментариев,
+    поднимаясь по дереву одним запросом на уровень (а не на комментарий).
+    """
+    parents = {comment.id: comment.reply_id for comment in comments}
+    pending = {parent_id for parent_id in parents.values() if parent_id is not None}
+
+    while pending:
+        rows = Comment.objects.filter(id__in=pending).values_list("id", "reply_id")
+        pending = set()
+        for comment_id, parent_id in rows:
+            parents[comment_id] = parent_id
+            if parent_id is not None and parent_id not in parents:
+                pending.add(parent_id)
+
+    root_ids = {}
+    for comment in comments:
+        current = comment.id
+        while parents.get(current) is not None:
+            current = parents[current]
+        root_ids[comment.id] = current
+    return root_ids
+
+
+def relay_outbox_events(batch_size=None):
+    """
+    Публикует одну пачку событий из outbox и удаляет их.
+    Возвращает количество обработанных событий.
+    """
+    # Импорт внутри функции: serializers сам импортирует этот модуль
+    from app.comments.serializers import CommentSerializer
+
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        comments = list(
+            Comment.objects.filter(id__in={event.comment_id for event in events})
+            .select_related("user")
+            .prefetch_related("attachments")
+        )
+        serialized = dict(
+            zip(
+                (comment.id for comment in comments),
+                CommentSerializer(comments, many=True).data,
+            )
+        )
+        root_ids = get_root_ids(comments)
+
+        events_by_root = {}
+        for event in events:
+            # Комментарий мог быть удален до публикации события
+            if event.comment_id not in serialized:
+                continue
+            events_by_root.setdefault(root_ids[event.comment_id], []).append(
+                {"type": event.event_type, "reply": serialized[event.comment_id]}
+            )
+
+        if events_by_root:
+            publish_events(events_by_root)
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+    logger.info("Relayed %d outbox events", len(events))
+    return len(events)
@@ -0,0 +1,206 @@
+"""
+Учет зрителей веток комментариев (presence).
+
+Каждый процесс Daphne хранит локальный список своих WebSocket подключений
+по группам и раз в PRESENCE_FLUSH_INTERVAL секунд синхронизирует его с Redis
+одним pipeline: продлевает heartbeat всех своих подключений, удаляет
+отключившиеся и просроченные записи и получает актуальные счетчики.
+Если процесс упал, его записи истекают через PRESENCE_TTL секунд.
+
+Изменившиеся счетчики рассылаются в группу событием `presence`. Событие
+отправляет только один процесс на каждое изменение значения, а все
+подключения/отключения за интервал схлопываются в одно событие.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from app.core.metrics import timed_group_send
+from app.core.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPresenceStore:
+    """Хранилище в памяти процесса (для тестов и разработки без Redis)"""
+
+    def __init__(self):
+        self._members = {}
+        self._published = {}
+
+    async def sync(self, refresh, removed, now, ttl):
+        counts = {}
+        for group in set(refresh) | set(removed):
+            members = self._members.setdefault(group, {})
+            for channel_name in removed.get(group, ()):
+                members.pop(channel_name, None)
+            for channel_name in refresh.get(group, ()):
+                members[channel_name] = now + ttl
+            for channel_name, expires_at in list(members.items()):
+                if expires_at <= now:
+                    del members[channel_name]
+            counts[group] = len(members)
+        return counts
+
+    async def claim_broadcast(self, counts, ttl):
+        claimed = []
+        for group, count in counts.items():
+            if self._published.get(group) != count:
+                self._published[group] = count
+                claimed.append(group)
+        return claimed
+
+
+class RedisPresenceStore:
+    """
+    Хранилище в Redis: sorted set на группу, где score - время истечения
+    heartbeat подключения.
+    """
+
+    def __init__(self, url, key_prefix="presence"):
+        self.url = url
+        self.key_prefix = key_prefix
+
+    def _members_key(self, group):
+        return f"{self.key_prefix}:{group}"
+
+    def _published_key(self, group):
+        return f"{self.key_prefix}:published:{group}"
+
+    async def sync(self, refresh, removed, now, ttl):
+        groups = list(set(refresh) | set(removed))
+        if not groups:
+            return {}
+
+        pipe = get_async_redis(self.url).pipeline(transaction=False)
+        for group in groups:
+            key = self._members_key(group)
+            if removed.get(group):
+                pipe.zrem(key, *removed[group])
+            if refresh.get(group):
+                expires_at = now + ttl
+                pipe.zadd(key, {name: expires_at for name in refresh[group]})
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            pipe.expire(key, ttl)
+        results = await pipe.execute()
+
+        counts = {}
+        position = 0
+        for group in groups:
+            position += bool(removed.get(group)) + bool(refresh.get(group)) + 1
+            counts[group] = results[position]
+            position += 2
+        return counts
+
+    async def claim_broadcast(self, counts, ttl):
+        """
+        Атомарно запоминает опубликованное значение счетчика (SET ... GET)
+        и возвращает группы, для которых значение действительно изменилось.
+        Так несколько процессов не рассылают одно и то же событие.
+        """
+        if not counts:
+            return []
+
+        pipe = get_async_redis(self.url).pipeline(transaction=False)
+        groups = list(counts)
+        for group in groups:
+            pipe.set(self._published_key(group), counts[group], ex=ttl, get=True)
+        previous = await pipe.execute()
+
+        return [
+            group
+            for group, old in zip(groups, previous)
+            if old is None or int(old) != counts[group]
+        ]
+
+
+class PresenceTracker:
+    """Локальный (на процесс) учет подключений с пакетной синхронизацией"""
+
+    def __init__(self, store, ttl, flush_interval):
+        self.store = store
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._members = {}
+        self._removed = {}
+        self._flusher = None
+
+    def join(self, group, channel_name, channel_layer):
+        self._members.setdefault(group, set()).add(channel_name)
+        self._removed.get(group, set()).discard(channel_name)
+        self._ensure_flusher(channel_layer)
+
+    def leave(self, group, channel_name):
+        members = self._members.get(group)
+        if members is None or channel_name not in members:
+            return
+        members.discard(channel_name)
+        if not members:
+            del self._members[group]
+        self._removed.setdefault(group, set()).add(channel_name)
+
+    def count_local(self, group):
+        return len(self._members.get(group, ()))
+
+    async def flush(self, channel_layer):
+        """
+        Синхронизирует локальное состояние с хранилищем и рассылает
+        событие `presence` в группы, где изменилось число зрителей.
+        """
+        refresh = {group: set(members) for group, members in self._members.items()}
+        removed, self._removed = self._removed, {}
+        if not refresh and not removed:
+            return {}
+
+        counts = await self.store.sync(refresh, removed, time.time(), self.ttl)
+        changed = await self.store.claim_broadcast(counts, self.ttl)
+
+        for group in changed:
+            await timed_group_send(
+                channel_layer, group, {"type": "presence", "viewers": counts[group]}
+            )
+        return counts
+
+    def stop(self):
+        """Останавливает фоновую синхронизацию (например, при завершении процесса)"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+
+    def _ensure_flusher(self, channel_layer):
+        loop = asyncio.get_running_loop()
+        flusher = self._flusher
+        if flusher is not None and not flusher.done() and flusher.get_loop() is loop:
+            return
+        self._flusher = loop.create_task(self._run_flusher(channel_layer))
+
+    async def _run_flusher(self, channel_layer):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(channel_layer)
+            except Exception:
+                logger.exception("Presence flush failed")
+            if not self._members and not self._removed:
+                return
+
+
+_tracker = None
+
+
+def get_presence_tracker():
+    global _tracker
+    if _tracker is None:
+        if settings.PRESENCE_BACKEND == "redis":
+            store = RedisPresenceStore(settings.PRESENCE_REDIS_URL)
+        else:
+            store = LocalPresenceStore()
+        _tracker = PresenceTracker(
+            store,
+            ttl=settings.PRESENCE_TTL,
+            flush_interval=settings.PRESENCE_FLUSH_INTERVAL,
+        )
+    return _tracker
@@ -0,0 +1,207 @@
+"""
+Быстрое чтение деревьев комментариев для GET эндпоинтов.
+
+CommentTreeReader отдает тот же результат, что и CommentSerializer
+(с учетом depth, replies_limit и fields), но без полей DRF: строки берутся
+из .values(), узлы дерева - объекты со __slots__, а набор полей один раз
+компилируется в план из функций. Ответы загружаются по уровням - один запрос
+на уровень дерева вместо запроса на каждый узел.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField
+from rest_framework.settings import api_settings
+
+from app.comments.models import Comment, CommentAttachment
+from app.comments.serializers import CommentSerializer
+from app.core.utils import KeysetCursorPagination
+
+
+# Размер пачки id в запросах с IN (ограничение числа параметров SQLite)
+IN_BATCH_SIZE = 2000
+
+# Колонки .values(), нужные полям ответа
+FIELD_COLUMNS = {
+    "user": ["user_id", "user__username", "user__email"],
+    "reply": ["reply_id"],
+    "replies": [],
+    "has_more": [],
+    "next_cursor": [],
+    "attachments": [],
+}
+# Колонки, без которых не построить дерево и курсоры
+REQUIRED_COLUMNS = ["id", "reply_id", "created_at", "reply_count", "attachment_count"]
+
+
+def datetime_formatter():
+    """Форматирование datetime как у DateTimeField в DRF (ISO 8601, UTC как Z)"""
+    field = DateTimeField()
+    output_format = api_settings.DATETIME_FORMAT
+    if not settings.USE_TZ or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if value is None or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return format_datetime
+
+
+def _batches(values):
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        yield values[start:start + IN_BATCH_SIZE]
+
+
+class _Node:
+    __slots__ = ("row", "data")
+
+    def __init__(self, row, data):
+        self.row = row
+        self.data = data
+
+
+class CommentTreeReader:
+    """
+    Read-only replacement for CommentSerializer(many=True).data.
+
+    reader = CommentTreeReader(depth=1, replies_limit=10, fields=None)
+    rows = reader.prepare(queryset)   # values() queryset, can be paginated
+    data = reader.render(rows)
+    """
+
+    def __init__(self, depth=None, replies_limit=None, fields=None):
+        self.depth = depth
+        self.replies_limit = replies_limit
+        self.fields = list(CommentSerializer.Meta.fields if fields is None else fields)
+        self.columns = self._compile_columns()
+        self.plan = self._compile_plan()
+
+        self.with_replies = "replies" in self.fields
+        self.with_attachments = "attachments" in self.fields
+        self.load_children = bool({"replies", "has_more", "next_cursor"} & set(self.fields))
+
+    def _compile_columns(self):
+        columns = list(REQUIRED_COLUMNS)
+        for name in self.fields:
+            for column in FIELD_COLUMNS.get(name, [name]):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def _compile_plan(self):
+        format_datetime = datetime_formatter()
+
+        def datetime_getter(column):
+            return lambda row: format_datetime(row[column])
+
+        def get_user(row):
+            return {
+                "id": row["user_id"],
+                "username": row["user__username"],
+                "email": row["user__email"],
+            }
+
+        getters = {
+            "id": itemgetter("id"),
+            "user": get_user,
+            "text": itemgetter("text"),
+            "created_at": datetime_getter("created_at"),
+            "updated_at": datetime_getter("updated_at"),
+            "reply": itemgetter("reply_id"),
+            "reply_count": itemgetter("reply_count"),
+            "descendant_count": itemgetter("descendant_count"),
+            "attachment_count": itemgetter("attachment_count"),
+            "last_activity_at": datetime_getter("last_activity_at"),
+        }
+        # Поля дерева (replies, has_more, ...) заполняются после загрузки детей,
+        # а в плане резервируют место, чтобы сохранить порядок ключей
+        return [(name, getters.get(name)) for name in self.fields]
+
+    def prepare(self, queryset):
+        """Превращает queryset комментариев в .values() с нужными колонками"""
+        return queryset.select_related(None).prefetch_related(None).values(*self.columns)
+
+    def render(self, rows):
+        nodes = [self._make_node(row) for row in rows]
+
+        level, depth = nodes, self.depth
+        while level:
+            children = {}
+            if self.load_children and depth != 0:
+                children = self._load_children(
+                    [node.row["id"] for node in level if node.row["reply_count"]]
+                )
+            if self.with_attachments:
+                self._fill_attachments(level)
+
+            next_level = []
+            for node in level:
+                replies = children.get(node.row["id"], [])
+                self._fill_tree_fields(node, replies)
+                next_level.extend(replies)
+
+            level = next_level if self.with_replies else []
+            depth = depth - 1 if depth is not None else None
+
+        return [node.data for node in nodes]
+
+    def _make_node(self, row):
+        return _Node(row, {name: get(row) if get else None for name, get in self.plan})
+
+    def _fill_tree_fields(self, node, replies):
+        data = node.data
+        has_more = node.row["reply_count"] > len(replies)
+        if self.with_replies:
+            data["replies"] = [reply.data for reply in replies]
+        if "has_more" in data:
+            data["has_more"] = has_more
+        if "next_cursor" in data:
+            data["next_cursor"] = (
+                KeysetCursorPagination.encode_cursor(replies[-1].row)
+                if replies and has_more
+                else None
+            )
+
+    def _load_children(self, parent_ids):
+        children = {}
+        for batch in _batches(parent_ids):
+            queryset = Comment.objects.filter(reply_id__in=batch)
+            if self.replies_limit:
+                queryset = queryset.annotate(
+                    position=Window(
+                        RowNumber(),
+                        partition_by=F("reply_id"),
+                        order_by=[F("created_at").asc(), F("pk").asc()],
+                    )
+                ).filter(position__lte=self.replies_limit)
+            rows = queryset.order_by("reply_id", "created_at", "pk").values(*self.columns)
+            for row in rows:
+                children.setdefault(row["reply_id"], []).append(self._make_node(row))
+        return children
+
+    def _fill_attachments(self, level):
+        for node in level:
+            node.data["attachments"] = []
+
+        by_id = {node.row["id"]: node for node in level if node.row["attachment_count"]}
+        for batch in _batches(list(by_id)):
+            rows = (
+                CommentAttachment.objects.filter(comment_id__in=batch)
+                .order_by("comment_id", "id")
+                .values_list("comment_id", "id", "file", "media_type")
+            )
+            for comment_id, attachment_id, file, media_type in rows:
+                by_id[comment_id].data["attachments"].append(
+                    {"id": attachment_id, "file": file, "media_type": media_type}
+                )
@@ -0,0 +1,59 @@
+"""
+Очистка HTML текста комментариев (bleach).
+
+bleach.clean() и bleach.linkify() на каждый вызов собирают новый Cleaner /
+Linker (парсер html5lib, токенизатор, цепочку фильтров). Здесь пара
+Cleaner + Linker создается один раз на поток (экземпляры bleach не
+потокобезопасны, а sync_to_async и ASGI_THREADS выполняют запросы в разных
+потоках) и переиспользуется.
+
+Результат для одного и того же текста не меняется, поэтому sanitize_text
+кеширует его в LRU на SANITIZE_CACHE_SIZE записей: предпросмотр
+(/api/comments/preview-text/) и последующее создание комментария с тем же
+текстом очищают его один раз.
+"""
+import functools
+import threading
+
+from django.conf import settings
+
+from app.core.timing import timed
+
+
+ALLOWED_TAGS = ["a", "code", "i", "strong", "p", "br", "em", "b"]
+ALLOWED_ATTRIBUTES = {"a": ["href", "title"]}
+
+_local = threading.local()
+
+
+def get_sanitizers():
+    """(Cleaner, Linker) текущего потока; bleach импортируется при первом вызове"""
+    sanitizers = getattr(_local, "sanitizers", None)
+    if sanitizers is None:
+        from bleach.linkifier import Linker
+        from bleach.sanitizer import Cleaner
+
+        # Те же параметры, что у bleach.clean(..., strip=True) и
+        # bleach.linkify(..., parse_email=False, callbacks=[])
+        sanitizers = _local.sanitizers = (
+            Cleaner(tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True),
+            Linker(callbacks=[], parse_email=False),
+        )
+    return sanitizers
+
+
+def clean_html(text):
+    """Удаляет неразрешенные теги и атрибуты и превращает URL в ссылки (без кеша)"""
+    cleaner, linker = get_sanitizers()
+    return linker.linkify(cleaner.clean(text))
+
+
+@functools.lru_cache(maxsize=settings.SANITIZE_CACHE_SIZE)
+def _cached_clean_html(text):
+    return clean_html(text)
+
+
+def sanitize_text(text):
+    """clean_html с LRU кешем (для текста из запросов)"""
+    with timed("sanitize"):
+        return _cached_clean_html(text)
@@ -1,51 +1,59 @@
+import functools
 import io
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import requests
-from PIL import Image
 from django.core.files.base import ContentFile
 from django.conf import settings
-import bleach
+from django.db import transaction
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-import cloudinary.uploader
-
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from app.comments.models import Comment, CommentAttachment
+from app.comments.outbox import record_reply_created
+from app.comments.sanitizer import sanitize_text
 from app.comments.tasks import send_reply_notification_email
+from app.core.timing import timed
+from app.core.utils import KeysetCursorPagination
 from app.users.serializers import UserSerializer
 
 
+@functools.cache
+def get_cloudinary():
+    """
+    cloudinary импортируется и настраивается при первой загрузке файла,
+    а не в каждом процессе (Celery, relay) при загрузке настроек
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+    )
+    return cloudinary
+
+
 class CommentPreviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ["id", "text", "created_at"]
+        fields = [
+            "id",
+            "text",
+            "created_at",
+            "reply_count",
+            "descendant_count",
+            "last_activity_at",
+        ]
 
 
 class CommentTextPreviewSerializer(serializers.Serializer):
     text = serializers.CharField(required=True)
 
-    ALLOWED_TAGS = ["a", "code", "i", "strong", "p", "br", "em", "b"]
-    ALLOWED_ATTRIBUTES = {"a": ["href", "title"]}
-
     def validate_text(self, value):
-        cleaned_text = bleach.clean(
-            value,
-            tags=self.ALLOWED_TAGS,
-            attributes=self.ALLOWED_ATTRIBUTES,
-            strip=True,
-        )
-
-        cleaned_text = bleach.linkify(
-            cleaned_text,
-            parse_email=False,
-            callbacks=[],
-        )
-
-        return cleaned_text
+        return sanitize_text(value)
 
 
 class CommentTextPreviewResponseSerializer(serializers.Serializer):
@@ -54,9 +62,31 @@ class CommentTextPreviewResponseSerializer(serializers.Serializer):
 
 
 class CommentSerializer(serializers.ModelSerializer):
+    """
+    Comment with its reply tree.
+
+    Context options (set by the views from query params):
+    - depth: how many reply levels to embed below this comment (None - all)
+    - replies_limit: max replies embedded per comment (None - all)
+    - fields: names of fields to return (None - all), applied to nested replies too
+    Truncated comments have has_more=true and next_cursor for the
+    /api/comments/<id>/replies/ endpoint.
+    """
+
+    # Model columns each response field needs (for .only() in optimize_queryset)
+    FIELD_COLUMNS = {
+        "user": ["user__id", "user__username", "user__email"],
+        "replies": ["reply_count"],
+        "has_more": ["reply_count"],
+        "next_cursor": ["reply_count"],
+        "attachments": ["attachment_count"],
+    }
+
     user = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
     attachments = serializers.SerializerMethodField()
+    has_more = serializers.SerializerMethodField()
+    next_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
@@ -68,9 +98,52 @@ class CommentSerializer(serializers.ModelSerializer):
             "updated_at",
             "reply",
             "replies",
+            "has_more",
+            "next_cursor",
             "attachments",
+            "reply_count",
+            "descendant_count",
+            "attachment_count",
+            "last_activity_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at", "user", "attachments"]
+        read_only_fields = [
+            "id",
+            "created_at",
+            "updated_at",
+            "user",
+            "attachments",
+            "reply_count",
+            "descendant_count",
+            "attachment_count",
+            "last_activity_at",
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None):
+        """
+        Loads only the columns and relations needed for the requested fields:
+        user is joined only when returned, attachments are prefetched only when returned.
+        """
+        if fields is None:
+            return queryset.select_related("user").prefetch_related("attachments")
+
+        columns = {"id", "created_at"}
+        for name in fields:
+            columns.update(cls.FIELD_COLUMNS.get(name, [name]))
+
+        if "user" in fields:
+            queryset = queryset.select_related("user")
+        if "attachments" in fields:
+            queryset = queryset.prefetch_related("attachments")
+        return queryset.only(*columns)
 
     @extend_schema_field(
         field={
@@ -86,6 +159,8 @@ class CommentSerializer(serializers.ModelSerializer):
         }
     )
     def get_attachments(self, obj) -> List[Dict[str, Any]]:
+        if not obj.attachment_count:
+            return []
         return [
             {"id": a.id, "file": a.file, "media_type": a.media_type}
             for a in obj.attachments.all()
@@ -110,16 +185,45 @@ class CommentSerializer(serializers.ModelSerializer):
         }
     )
     def get_replies(self, obj) -> List[Dict[str, Any]]:
-        """Get all replies to this comment"""
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True).data
-        return []
+        """Get replies to this comment, limited by depth and replies_limit"""
+        replies = self._get_embedded_replies(obj)
+        if not replies:
+            return []
+
+        depth = self.context.get("depth")
+        child_context = {
+            **self.context,
+            "depth": depth - 1 if depth is not None else None,
+        }
+        return CommentSerializer(replies, many=True, context=child_context).data
+
+    def get_has_more(self, obj) -> bool:
+        """True if the comment has replies that were not embedded"""
+        return obj.reply_count > len(self._get_embedded_replies(obj))
+
+    def get_next_cursor(self, obj) -> Optional[str]:
+        """Cursor for /replies/ continuing after the last embedded reply"""
+        replies = self._get_embedded_replies(obj)
+        if replies and self.get_has_more(obj):
+            return KeysetCursorPagination.encode_cursor(replies[-1])
+        return None
+
+    def _get_embedded_replies(self, obj):
+        # Один и тот же экземпляр сериализатора обслуживает все элементы many=True
+        embedded = self.__dict__.setdefault("_embedded_replies", {})
+        if obj.pk not in embedded:
+            replies = []
+            if obj.reply_count and self.context.get("depth") != 0:
+                queryset = self.optimize_queryset(
+                    obj.replies.order_by("created_at", "pk"), self.context.get("fields")
+                )
+                limit = self.context.get("replies_limit")
+                replies = list(queryset[:limit] if limit else queryset)
+            embedded[obj.pk] = replies
+        return embedded[obj.pk]
 
 
 class CommentCreateSerializer(serializers.ModelSerializer):
-    ALLOWED_TAGS = ["a", "code", "i", "strong", "p", "br", "em", "b"]
-    ALLOWED_ATTRIBUTES = {"a": ["href", "title"]}
-
     user = UserSerializer(read_only=True)
     files = serializers.ListField(
         child=serializers.FileField(), write_only=True, required=False
@@ -141,20 +245,7 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at", "updated_at", "user"]
 
     def validate_text(self, value):
-        cleaned_text = bleach.clean(
-            value,
-            tags=self.ALLOWED_TAGS,
-            attributes=self.ALLOWED_ATTRIBUTES,
-            strip=True,
-        )
-
-        cleaned_text = bleach.linkify(
-            cleaned_text,
-            parse_email=False,
-            callbacks=[],
-        )
-
-        return cleaned_text
+        return sanitize_text(value)
 
     def validate_recaptcha_token(self, value):
         """Validate reCAPTCHA token with Google's API"""
@@ -163,14 +254,15 @@ class CommentCreateSerializer(serializers.ModelSerializer):
                 "reCAPTCHA is not configured on the server"
             )
 
-        response = requests.post(
-            "https://www.google.com/recaptcha/api/siteverify",
-            data={
-                "secret": settings.RECAPTCHA_PRIVATE_KEY,
-                "response": value,
-            },
-            timeout=10,
-        )
+        with timed("recaptcha"):
+            response = requests.post(
+                "https://www.google.com/recaptcha/api/siteverify",
+                data={
+                    "secret": settings.RECAPTCHA_PRIVATE_KEY,
+                    "response": value,
+                },
+                timeout=10,
+            )
 
         result = response.json()
 
@@ -208,6 +300,8 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         return files
 
     def _process_image(self, file, ext):
+        from PIL import Image
+
         try:
             image = Image.open(file)
 
@@ -236,24 +330,38 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         user = self.context["request"].user
         validated_data["user"] = user
 
-        comment = super().create(validated_data)
-
-        for idx, file in enumerate(attachments_data):
+        # Загружаем файлы до транзакции, чтобы не держать ее открытой
+        cloudinary = get_cloudinary() if attachments_data else None
+        uploaded = []
+        for file in attachments_data:
             ext = os.path.splitext(file.name)[1].lower()
             media_type = "image" if ext in [".jpg", ".jpeg", ".png", ".gif"] else "file"
 
             try:
-                cloudinary_file = cloudinary.uploader.upload(
-                    file,
-                    resource_type="auto",
-                )
+                with timed("cloudinary"):
+                    cloudinary_file = cloudinary.uploader.upload(
+                        file,
+                        resource_type="auto",
+                    )
                 file_url = cloudinary_file["secure_url"]
             except cloudinary.exceptions.Error:
                 raise serializers.ValidationError("Failed to upload file to Cloudinary")
 
-            CommentAttachment.objects.create(
-                comment=comment, file=file_url, media_type=media_type
-            )
+            uploaded.append((file_url, media_type))
+
+        with transaction.atomic():
+            comment = super().create(validated_data)
+
+            for file_url, media_type in uploaded:
+                CommentAttachment.objects.create(
+                    comment=comment, file=file_url, media_type=media_type
+                )
+            # Счетчик обновлен в БД через F(), синхронизируем объект для ответа
+            comment.attachment_count = len(uploaded)
+
+            # Рассылка в WebSocket идет через outbox после коммита транзакции
+            if comment.reply:
+                record_reply_created(comment)
 
         if comment.reply:
             self._send_reply_notification(comment, user)
@@ -268,16 +376,8 @@ class CommentCreateSerializer(serializers.ModelSerializer):
 
     def _send_reply_notification(self, comment, user):
         root_comment = comment.get_root_comment()
-        channel_layer = get_channel_layer()
-        serialized_reply = CommentSerializer(comment).data
-
-        group_name = f"comment_{root_comment.id}"
-        async_to_sync(channel_layer.group_send)(
-            group_name, {"type": "new_reply", "reply": serialized_reply}
-        )
-
         if user != root_comment.user:
             send_reply_notification_email.delay(
                 user_email=root_comment.user.email,
-                comment_text_short=serialized_reply["text"][:200],
-            )
\ No newline at end of file
+                comment_text_short=comment.text[:200],
+            )
@@ -1,8 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
 
-from app.comments.models import Comment
+from app.comments import counters
+from app.comments.models import Comment, CommentAttachment
+from app.core.timing import timed
+from app.users.models import User
+
+# Поля пользователя, которые встраиваются в ответы с комментариями
+EMBEDDED_USER_FIELDS = {"username", "email"}
 
 
 @receiver(post_save, sender=Comment)
@@ -11,4 +17,45 @@ def notify_reply_created(sender, instance, created, **kwargs):
     Очищает кэш при создании любого нового комментария
     """
     if created:
-        cache.delete("comment_preview_list")
\ No newline at end of file
+        with timed("cache"):
+            cache.delete("comment_preview_list")
+
+
+@receiver(post_save, sender=Comment)
+def update_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики предков при создании, изменении и переносе комментария"""
+    if raw:
+        return
+
+    if created:
+        counters.comment_created(instance)
+    else:
+        counters.comment_updated(instance, getattr(instance, "_loaded_reply_id", instance.reply_id))
+    instance._loaded_reply_id = instance.reply_id
+
+
+@receiver(post_delete, sender=Comment)
+def update_counters_on_delete(sender, instance, **kwargs):
+    counters.comment_deleted(instance)
+
+
+@receiver(post_save, sender=User)
+def update_activity_on_user_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Смена username/email меняет версию веток с комментариями пользователя"""
+    if created or raw:
+        return
+    # Например, save(update_fields=["last_login"]) при входе ветки не трогает
+    if update_fields is not None and not EMBEDDED_USER_FIELDS & set(update_fields):
+        return
+    counters.user_changed(instance.pk)
+
+
+@receiver(post_save, sender=CommentAttachment)
+def update_counters_on_attachment_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.attachment_added(instance)
+
+
+@receiver(post_delete, sender=CommentAttachment)
+def update_counters_on_attachment_delete(sender, instance, **kwargs):
+    counters.attachment_removed(instance)
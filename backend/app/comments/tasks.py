@@ -8,7 +8,11 @@ from config.celery import app
 from app.comments.exceptions import EmailSendingError
 
 
-@app.task(autoretry_for=(EmailSendingError,), max_retries=3, retry_backoff=True)
+# acks_late=False: письмо нельзя отправить повторно, если воркер умер после
+# отправки. Задача подтверждается при получении; потеря воркера теряет письмо
+@app.task(
+    autoretry_for=(EmailSendingError,), max_retries=3, retry_backoff=True, ignore_result=True, acks_late=False
+)
 def send_reply_notification_email(*args, **kwargs):
     user_email = kwargs.get("user_email")
     comment_text_short = kwargs.get("comment_text_short")
@@ -35,6 +39,6 @@ def send_reply_notification_email(*args, **kwargs):
 
 @app.task
 def cleanup_failed_email_tasks():
-    failed_tasks = TaskResult.objects.filter(status="FAILURE")
-    for task in failed_tasks:
-        task.delete()
+    # Результаты пишут только задачи с backend=database_backend(); строки
+    # от прежнего хранения всех результатов в БД удаляются здесь же
+    TaskResult.objects.filter(status="FAILURE").delete()
@@ -3,6 +3,7 @@ from .views import (
     CommentListCreateAPIView,
     CommentDetailAPIView,
     CommentPreviewAPIView,
+    CommentRepliesAPIView,
     comment_text_preview,
     health_check
 )
@@ -11,6 +12,7 @@ urlpatterns = [
     path("", CommentListCreateAPIView.as_view(), name="comment-list-create"),
 
     path("<int:pk>/", CommentDetailAPIView.as_view(), name="comment-detail"),
+    path("<int:pk>/replies/", CommentRepliesAPIView.as_view(), name="comment-replies"),
     path("preview/", CommentPreviewAPIView.as_view(), name="comment-preview"),
     path("preview-text/", comment_text_preview, name="comment-text-preview"),
     path("health/", health_check, name="health-check"),
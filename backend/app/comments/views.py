@@ -1,13 +1,25 @@
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from rest_framework.parsers import MultiPartParser, FormParser
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiResponse
 
+from django.conf import settings
 from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Sum
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 from app.comments.models import Comment
+from app.comments.readers import CommentTreeReader
 from app.comments.serializers import (
     CommentSerializer,
     CommentCreateSerializer,
@@ -15,10 +27,321 @@ from app.comments.serializers import (
     CommentTextPreviewSerializer,
     CommentTextPreviewResponseSerializer,
 )
-from app.core.utils import StandardResultsSetPagination
+from app.core.db_router import bind_routing
+from app.core.json import FastJSONParser, dumps
+from app.core.metrics import count_cache_lookup
+from app.core.throttling import TokenBucketThrottle
+from app.core.timing import timed
+from app.core.utils import KeysetCursorPagination, StandardResultsSetPagination
+
+
+TREE_PARAMETERS = [
+    OpenApiParameter(
+        "depth", int,
+        description="Number of reply levels to embed (0 - none). Truncated comments have has_more=true.",
+    ),
+    OpenApiParameter(
+        "replies_limit", int,
+        description="Maximum number of replies embedded per comment.",
+    ),
+]
+
+FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        "fields", str,
+        description="Comma-separated fields to return, e.g. fields=id,created_at (default - all). "
+                    "Applied to embedded replies too.",
+    ),
+    OpenApiParameter(
+        "expand", str,
+        description="Comma-separated related fields added to fields: user, replies, attachments.",
+    ),
+]
+
+STREAM_PARAMETER = OpenApiParameter(
+    "stream", bool,
+    description="Stream the page: roots are written as they are rendered instead of buffering the whole response.",
+)
+
+
+class CommentFieldsMixin:
+    """
+    Sparse fieldsets (?fields=, ?expand=) for CommentSerializer.
+    Unrequested fields are dropped from the response, and on GET the queryset
+    loads only the columns they need: user is joined and attachments are
+    prefetched only when returned.
+    """
+
+    expandable_fields = ("user", "replies", "attachments")
+
+    def get_requested_fields(self):
+        if not hasattr(self, "_requested_fields"):
+            self._requested_fields = self._parse_requested_fields()
+        return self._requested_fields
+
+    def _parse_requested_fields(self):
+        params = self.request.query_params if self.request else {}
+        if "fields" not in params:
+            return None
+
+        allowed = CommentSerializer.Meta.fields
+        fields = self._split_param(params, "fields", allowed)
+        fields |= self._split_param(params, "expand", self.expandable_fields)
+        # Сохраняем порядок полей сериализатора
+        return [name for name in allowed if name in fields]
+
+    def _split_param(self, params, name, allowed):
+        names = {item.strip() for item in params.get(name, "").split(",") if item.strip()}
+        unknown = names - set(allowed)
+        if unknown:
+            raise ValidationError(
+                {name: f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}."}
+            )
+        return names
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = CommentSerializer.optimize_queryset(queryset, self.get_requested_fields())
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request and self.request.method == "GET":
+            context["fields"] = self.get_requested_fields()
+        return context
+
+
+class CommentTreeMixin:
+    """
+    Passes the reply tree limits (?depth=, ?replies_limit=) to CommentSerializer.
+    Values are capped by COMMENT_TREE_MAX_DEPTH / COMMENT_TREE_MAX_REPLIES_LIMIT.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["depth"] = self._get_tree_param(
+            "depth", settings.COMMENT_TREE_DEFAULT_DEPTH, settings.COMMENT_TREE_MAX_DEPTH, minimum=0
+        )
+        context["replies_limit"] = self._get_tree_param(
+            "replies_limit",
+            settings.COMMENT_TREE_DEFAULT_REPLIES_LIMIT,
+            settings.COMMENT_TREE_MAX_REPLIES_LIMIT,
+            minimum=1,
+        )
+        return context
+
+    def _get_tree_param(self, name, default, maximum, minimum):
+        value = self.request.query_params.get(name) if self.request else None
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+        if value < minimum:
+            raise ValidationError({name: f"Ensure this value is greater than or equal to {minimum}."})
+        return min(value, maximum)
+
+
+class CommentFastReadMixin:
+    """
+    Serves GET through CommentTreeReader instead of CommentSerializer when
+    COMMENT_FAST_READS is on. Uses the same context (depth, replies_limit, fields),
+    so the JSON is identical; the serializer still describes the schema.
+    """
+
+    def get_tree_reader(self):
+        if not settings.COMMENT_FAST_READS:
+            return None
+        context = self.get_serializer_context()
+        return CommentTreeReader(
+            depth=context.get("depth"),
+            replies_limit=context.get("replies_limit"),
+            fields=context.get("fields"),
+        )
+
+    def render_comments(self, comments, reader):
+        """Response data for reader rows or model instances, timed as serializer"""
+        with timed("serializer"):
+            if reader is not None:
+                return reader.render(comments)
+            return self.get_serializer(comments, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_tree_reader()
+        queryset = self.filter_queryset(self.get_queryset())
+        if reader is not None:
+            queryset = reader.prepare(queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.render_comments(page, reader))
+        return Response(self.render_comments(queryset, reader))
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self.get_tree_reader()
+        if reader is None:
+            instance = self.get_object()
+            with timed("serializer"):
+                data = self.get_serializer(instance).data
+            return Response(data)
+
+        if self._has_object_permissions():
+            # Объектные права читают атрибуты модели (obj.user), а строки
+            # reader'а - dict из .values(): проверяем на экземпляре модели
+            self.get_object()
+
+        rows = reader.prepare(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(rows, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return Response(self.render_comments([row], reader)[0])
+
+    def _has_object_permissions(self):
+        """Переопределяет ли какой-либо permission has_object_permission"""
+        return any(
+            type(permission).has_object_permission is not permissions.BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+
+def conditional_get(request, version, respond):
+    """
+    Adds an ETag built from version (values read by one query over the
+    denormalized counters) to a GET response and answers 304 to a matching
+    If-None-Match before respond() reads or serializes the comments.
+
+    Only the ETag is a validator: Last-Modified has one-second resolution,
+    so If-Modified-Since would hide an edit made in the same second.
+    """
+    # Представление зависит от параметров запроса и выбранного рендерера
+    key = "|".join(
+        str(value)
+        for value in (request.get_full_path(), request.accepted_media_type, *version)
+    )
+    etag = f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+
+    response.headers["ETag"] = etag
+    # Клиенты могут хранить ответ, но обязаны перепроверять его
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+class CommentVersionMixin:
+    """
+    Conditional GET for a single comment subtree (detail and replies endpoints):
+    last_activity_at changes on any create/edit/move/delete in the subtree
+    and on a username/email change of any author in it.
+    """
+
+    def get(self, request, *args, **kwargs):
+        version = (
+            Comment.objects.filter(pk=self.kwargs["pk"])
+            .values_list("last_activity_at", "reply_count", "descendant_count", "attachment_count")
+            .first()
+        )
+        if version is None:
+            # Нет комментария - 404 и для detail, и для списка его ответов
+            raise Http404
+        return conditional_get(request, version, functools.partial(super().get, request, *args, **kwargs))
 
 
-class CommentListCreateAPIView(generics.ListCreateAPIView):
+class CommentListVersionMixin:
+    """Conditional GET for the filtered list: newest activity, number of threads and their sizes"""
+
+    def get(self, request, *args, **kwargs):
+        version = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .aggregate(
+                last_activity_at=Max("last_activity_at"),
+                count=Count("id"),
+                descendants=Sum("descendant_count"),
+            )
+        )
+        return conditional_get(
+            request, version.values(), functools.partial(super().get, request, *args, **kwargs)
+        )
+
+
+class CommentStreamMixin:
+    """
+    ?stream=1 on the list: writes the page envelope first and then the root
+    comments as they are rendered (COMMENT_STREAM_BATCH_SIZE roots at a time),
+    so memory per request does not grow with page size times thread size.
+    The bytes are the same as the buffered JSON response.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("stream") not in ("1", "true"):
+            return super().list(request, *args, **kwargs)
+
+        reader = self.get_tree_reader()
+        queryset = self.filter_queryset(self.get_queryset())
+        if reader is not None:
+            queryset = reader.prepare(queryset)
+
+        roots = self.paginate_queryset(queryset)
+        envelope = None
+        if roots is not None:
+            envelope = self.get_paginated_response([]).data
+        else:
+            roots = list(queryset)
+
+        # Ответы читаются при отдаче ответа: с той же БД, что и страница
+        content = bind_routing(self._stream_roots(roots, envelope, reader))
+        if isinstance(request._request, ASGIRequest):
+            # Синхронный итератор ASGI handler прочитал бы целиком
+            content = _iterate_in_thread(content)
+
+        response = StreamingHttpResponse(content, content_type="application/json")
+        # Не буферизовать ответ в nginx
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    def _stream_roots(self, roots, envelope, reader):
+        if envelope is None:
+            yield b"["
+        else:
+            head = dumps({key: value for key, value in envelope.items() if key != "results"})
+            yield head[:-1] + (b"," if len(head) > 2 else b"") + b'"results":['
+
+        batch_size = settings.COMMENT_STREAM_BATCH_SIZE
+        separator = b""
+        for start in range(0, len(roots), batch_size):
+            batch = roots[start:start + batch_size]
+            for item in self.render_comments(batch, reader):
+                yield separator + dumps(item)
+                separator = b","
+
+        yield b"]" if envelope is None else b"]}"
+
+
+async def _iterate_in_thread(iterator):
+    # Каждый кусок готовится в sync потоке (ORM), между кусками event loop свободен
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (chunk := await next_chunk(iterator, done)) is not done:
+        yield chunk
+
+
+@extend_schema_view(
+    get=extend_schema(parameters=TREE_PARAMETERS + FIELDS_PARAMETERS + [STREAM_PARAMETER])
+)
+class CommentListCreateAPIView(
+    CommentListVersionMixin,
+    CommentStreamMixin,
+    CommentFastReadMixin,
+    CommentFieldsMixin,
+    CommentTreeMixin,
+    generics.ListCreateAPIView,
+):
     """
     API view to list all top-level comments (no parent) and create new comments.
     GET: Returns all comments that are not replies
@@ -28,7 +351,10 @@ class CommentListCreateAPIView(generics.ListCreateAPIView):
     queryset = Comment.objects.filter(reply__isnull=True).order_by("-created_at")
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    parser_classes = (MultiPartParser, FormParser, JSONParser)
+    # Только POST: проверяется до разбора тела, reCAPTCHA и bleach
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "comment_write"
+    parser_classes = (MultiPartParser, FormParser, FastJSONParser)
     pagination_class = StandardResultsSetPagination
     filter_backends = [filters.OrderingFilter, filters.SearchFilter]
     ordering_fields = ["created_at", "user__username", "user__email"]
@@ -41,7 +367,14 @@ class CommentListCreateAPIView(generics.ListCreateAPIView):
         return CommentSerializer
 
 
-class CommentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+@extend_schema_view(get=extend_schema(parameters=TREE_PARAMETERS + FIELDS_PARAMETERS))
+class CommentDetailAPIView(
+    CommentVersionMixin,
+    CommentFastReadMixin,
+    CommentFieldsMixin,
+    CommentTreeMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
     """
     API view to retrieve, update, or delete a specific comment.
     GET: Retrieve a comment by ID
@@ -52,6 +385,8 @@ class CommentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Comment.objects.all()
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "comment_write"
 
     def get_serializer_class(self):
         if self.request.method in ["PUT", "PATCH", "POST"]:
@@ -59,6 +394,29 @@ class CommentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         return CommentSerializer
 
 
+@extend_schema_view(get=extend_schema(parameters=TREE_PARAMETERS + FIELDS_PARAMETERS))
+class CommentRepliesAPIView(
+    CommentVersionMixin,
+    CommentFastReadMixin,
+    CommentFieldsMixin,
+    CommentTreeMixin,
+    generics.ListAPIView,
+):
+    """
+    API view to page through direct replies of a comment.
+    GET: Returns replies ordered by creation time, paginated with ?cursor=
+    (use next_cursor from a truncated comment to continue after embedded replies)
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    serializer_class = CommentSerializer
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        return Comment.objects.filter(reply_id=self.kwargs["pk"])
+
+
 class CommentPreviewAPIView(generics.ListAPIView):
     """
     API view to list all top-level comments (no parent) with Redis caching.
@@ -74,15 +432,21 @@ class CommentPreviewAPIView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         cache_key = "comment_preview_list"
 
-        cached_data = cache.get(cache_key)
+        with timed("cache"):
+            cached_data = count_cache_lookup(cache_key, cache.get(cache_key))
         if cached_data is not None:
             return Response(cached_data)
 
         response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)
+        with timed("cache"):
+            cache.set(cache_key, response.data, timeout=300)
         return response
 
 
+class CommentTextPreviewThrottle(TokenBucketThrottle):
+    scope = "comment_preview"
+
+
 @extend_schema(
     request=CommentTextPreviewSerializer,
     responses={200: CommentTextPreviewResponseSerializer},
@@ -90,6 +454,7 @@ class CommentPreviewAPIView(generics.ListAPIView):
 )
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([CommentTextPreviewThrottle])
 def comment_text_preview(request):
     """
     Preview how comment text will look after cleaning and linkification.
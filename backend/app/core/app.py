@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app.core"
-    verbose_name = "Core"
\ No newline at end of file
+    verbose_name = "Core"
+
+    def ready(self):
+        from app.core.timing import install_query_timer
+
+        # Время SQL запросов для ServerTimingMiddleware
+        connection_created.connect(install_query_timer, dispatch_uid="install_query_timer")
\ No newline at end of file
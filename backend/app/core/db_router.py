@@ -0,0 +1,89 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+class RoutingState:
+    """Состояние маршрутизации запросов к БД для текущего запроса/задачи"""
+
+    __slots__ = ("primary", "wrote")
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+def _get_state():
+    state = _state.get()
+    if state is None:
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+def use_primary():
+    """Направляет все последующие чтения текущего контекста на primary"""
+    _get_state().primary = True
+
+
+@contextmanager
+def routing_context(primary=False):
+    """Отдельное состояние маршрутизации на время обработки запроса"""
+    state = RoutingState(primary)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def bind_routing(iterator):
+    """
+    Итератор, который читает iterator в состоянии маршрутизации текущего
+    запроса. StreamingHttpResponse потребляется уже после выхода из
+    routing_context middleware; состояние ставится на каждый шаг отдельно,
+    потому что под ASGI шаги выполняются в разных потоках и контекстах.
+    """
+    # Состояние берется сейчас, а не при первом next() (тело генератора ленивое)
+    return _iterate_with_state(iterator, _get_state())
+
+
+def _iterate_with_state(iterator, state):
+    done = object()
+    while True:
+        token = _state.set(state)
+        try:
+            item = next(iterator, done)
+        finally:
+            _state.reset(token)
+        if item is done:
+            return
+        yield item
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтения идут на случайную реплику из DATABASE_REPLICAS, записи - на default.
+    После записи (и в запросах, закрепленных за primary middleware)
+    чтения тоже идут на default, чтобы лаг репликации не скрывал свежие данные.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or _get_state().primary:
+            return "default"
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _get_state()
+        state.primary = True
+        state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и primary
+        return True
@@ -0,0 +1,135 @@
+"""
+Проверки зависимостей для /health/ready/.
+
+Зависимости (HEALTH_CHECKS) опрашиваются параллельно в пуле потоков, каждая
+не дольше HEALTH_CHECK_TIMEOUT секунд. Сами проверки тоже ограничены этим
+таймаутом (у драйверов), а проверка, предыдущий запуск которой еще не
+завершился, не запускается повторно и сразу считается timeout - зависшая
+зависимость не занимает все потоки пула. Результат хранится в памяти процесса
+HEALTH_CHECK_CACHE_SECONDS секунд: частые пробы Docker/балансировщика
+не создают нагрузку, а одновременные пробы ждут одну проверку.
+Кеш Django для этого не подходит - он сам одна из проверяемых зависимостей.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+def check_database():
+    # Подключение к PostgreSQL ограничено DB_CONNECT_TIMEOUT (OPTIONS["connect_timeout"])
+    connection = connections["default"]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    finally:
+        # Поток пула не обслуживает запросы - подключение (или слот пула) возвращаем сразу
+        connection.close()
+
+
+def check_cache():
+    key = f"health:{uuid.uuid4().hex}"
+    cache.set(key, 1, timeout=10)
+    value = cache.get(key)
+    cache.delete(key)
+    if value != 1:
+        raise RuntimeError("cache returned a different value")
+
+
+def check_channel_layer():
+    channel_layer = get_channel_layer()
+
+    async def roundtrip():
+        channel = await channel_layer.new_channel()
+        await channel_layer.send(channel, {"type": "health.ping"})
+        await channel_layer.receive(channel)
+
+    async def roundtrip_with_timeout():
+        await asyncio.wait_for(roundtrip(), settings.HEALTH_CHECK_TIMEOUT)
+
+    async_to_sync(roundtrip_with_timeout)()
+
+
+def check_broker():
+    from config.celery import app
+
+    timeout = settings.HEALTH_CHECK_TIMEOUT
+    with app.connection_for_write(connect_timeout=timeout) as connection:
+        connection.ensure_connection(max_retries=1, timeout=timeout)
+
+
+CHECKS = {
+    "database": check_database,
+    "cache": check_cache,
+    "channel_layer": check_channel_layer,
+    "broker": check_broker,
+}
+
+
+def _timed(check):
+    started = time.perf_counter()
+    try:
+        check()
+    except Exception as exc:
+        return {
+            "status": "fail",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": f"{type(exc).__name__}: {exc}"[:200],
+        }
+    return {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+class ReadinessProbe:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+        self._running = {}  # имя проверки -> future последнего запуска
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="health")
+
+    def get(self):
+        """(ready, checks, cached)"""
+        with self._lock:
+            age = time.monotonic() - self._checked_at
+            if self._result is not None and age < settings.HEALTH_CHECK_CACHE_SECONDS:
+                return (*self._result, True)
+
+            self._result = self._run()
+            self._checked_at = time.monotonic()
+            return (*self._result, False)
+
+    def reset(self):
+        with self._lock:
+            self._result = None
+            self._running = {}
+
+    def _run(self):
+        timeout = settings.HEALTH_CHECK_TIMEOUT
+        futures = {}
+        for name in settings.HEALTH_CHECKS:
+            future = self._running.get(name)
+            if future is None or future.done():
+                future = self._running[name] = self._executor.submit(_timed, CHECKS[name])
+            futures[name] = future
+        wait(futures.values(), timeout=timeout)
+
+        checks = {}
+        for name, future in futures.items():
+            if future.done():
+                checks[name] = future.result()
+            else:
+                # Зависшая проверка дорабатывает в фоне и до завершения не перезапускается
+                checks[name] = {"status": "timeout", "latency_ms": round(timeout * 1000, 1)}
+        ready = all(check["status"] == "ok" for check in checks.values())
+        return ready, checks
+
+
+readiness_probe = ReadinessProbe()
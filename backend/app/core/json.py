@@ -0,0 +1,102 @@
+"""
+Быстрое JSON кодирование для REST и WebSocket.
+
+При JSON_BACKEND = "orjson" используется orjson (pip install ".[fast]"),
+если он установлен, иначе - стандартный json. Вывод совпадает с JSONRenderer
+DRF: компактные разделители, UTF-8 без \\u-экранирования (кроме U+2028/U+2029),
+datetime, Decimal, UUID и прочие типы кодируются JSONEncoder из DRF.
+"""
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.core.timing import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+if orjson is not None:
+    # datetime отдаем в JSONEncoder DRF (миллисекунды, Z вместо +00:00)
+    ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+_encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def use_orjson():
+    return orjson is not None and settings.JSON_BACKEND == "orjson"
+
+
+def dumps(data):
+    """Кодирует data в UTF-8 JSON (bytes)"""
+    if use_orjson():
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Например, int больше 64 бит - пусть решает стандартный json
+            content = _encoder.encode(data).encode()
+    else:
+        content = _encoder.encode(data).encode()
+
+    # Разделители строк допустимы в JSON, но не в JavaScript
+    if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+        content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+    return content
+
+
+def dumps_text(data):
+    """То же, что dumps, но строкой (для WebSocket text_data)"""
+    return dumps(data).decode()
+
+
+def loads(data):
+    if use_orjson():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using app.core.json.dumps. Falls back to DRF rendering
+    for indented output and non-default COMPACT/UNICODE/STRICT_JSON settings.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        if (
+            self.get_indent(accepted_media_type, renderer_context) is not None
+            or not (self.compact and self.ensure_ascii is False and self.strict)
+            or self.encoder_class is not JSONEncoder
+        ):
+            with timed("render"):
+                return super().render(data, accepted_media_type, renderer_context)
+        with timed("render"):
+            return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser using orjson for UTF-8 request bodies"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if not use_orjson() or encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
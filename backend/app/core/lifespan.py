@@ -0,0 +1,24 @@
+"""
+ASGI lifespan для uvicorn воркеров (config/workers.py).
+
+ASGI_THREADS - размер пула потоков цикла событий для sync_to_async
+с thread_sensitive=False, как в daphne (он читает ту же переменную).
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            threads = os.getenv("ASGI_THREADS")
+            if threads:
+                asyncio.get_running_loop().set_default_executor(
+                    ThreadPoolExecutor(max_workers=int(threads), thread_name_prefix="asgi")
+                )
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
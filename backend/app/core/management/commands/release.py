@@ -0,0 +1,35 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "One-shot release step: apply migrations and create the superuser from "
+        "DJANGO_SUPERUSER_USERNAME/EMAIL/PASSWORD. Runs in a single process "
+        "before web replicas start (entrypoint.sh release)"
+    )
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        call_command("migrate", interactive=False, verbosity=verbosity)
+        self.ensure_superuser()
+
+    def ensure_superuser(self):
+        username = os.getenv("DJANGO_SUPERUSER_USERNAME")
+        if not username:
+            return
+
+        User = get_user_model()
+        if User.objects.filter(username=username).exists():
+            self.stdout.write(f"Superuser {username} exists")
+            return
+
+        User.objects.create_superuser(
+            username,
+            os.getenv("DJANGO_SUPERUSER_EMAIL", ""),
+            os.getenv("DJANGO_SUPERUSER_PASSWORD"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Superuser {username} created"))
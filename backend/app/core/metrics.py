@@ -0,0 +1,138 @@
+"""
+Метрики в формате Prometheus (prometheus_client).
+
+Безопасно для нескольких процессов: если задана переменная окружения
+PROMETHEUS_MULTIPROC_DIR, каждый процесс (воркеры сервера, Celery) пишет
+значения в mmap файлы этой директории, а /metrics собирает их через
+MultiProcessCollector. Директорию нужно очищать при старте контейнера
+(см. entrypoint.sh). Без переменной используется обычный реестр процесса.
+
+Celery воркер отдает свои метрики на порту CELERY_METRICS_PORT.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "commenthub_http_request_duration_seconds",
+    "HTTP request latency by URL route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "commenthub_cache_requests_total",
+    "Cache lookups by key name and result (hit/miss)",
+    ["key", "result"],
+)
+THROTTLED_REQUESTS = Counter(
+    "commenthub_throttled_requests_total",
+    "Write requests rejected by rate limiting",
+    ["scope"],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "commenthub_websocket_connections",
+    "Open WebSocket connections",
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_GROUPS = Gauge(
+    "commenthub_websocket_groups",
+    "Comment thread groups with open connections (summed over processes)",
+    multiprocess_mode="livesum",
+)
+CHANNEL_LAYER_SEND_DURATION = Histogram(
+    "commenthub_channel_layer_send_seconds",
+    "Channel layer group_send latency",
+    ["event"],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_DURATION = Histogram(
+    "commenthub_celery_task_duration_seconds",
+    "Celery task run time by final state",
+    ["task", "state"],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_RETRIES = Counter(
+    "commenthub_celery_task_retries_total",
+    "Celery task retries",
+    ["task"],
+)
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """(content, content_type) для ответа /metrics"""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def count_cache_lookup(key, value):
+    """Учитывает результат cache.get: key - имя ключа без переменных частей"""
+    CACHE_REQUESTS.labels(key, "miss" if value is None else "hit").inc()
+    return value
+
+
+async def timed_group_send(channel_layer, group, message):
+    started = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, message)
+    finally:
+        CHANNEL_LAYER_SEND_DURATION.labels(message.get("type", "")).observe(
+            time.perf_counter() - started
+        )
+
+
+# ============================================
+# CELERY
+# ============================================
+_task_started = {}
+
+
+def task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+def task_retry(request=None, sender=None, **kwargs):
+    CELERY_TASK_RETRIES.labels(getattr(sender, "name", "unknown")).inc()
+
+
+def start_worker_metrics_server(port):
+    """HTTP сервер метрик в главном процессе Celery воркера"""
+    from prometheus_client import start_http_server
+
+    if port:
+        start_http_server(port, registry=get_registry())
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.task_prerun.connect(task_prerun, weak=False, dispatch_uid="metrics_task_prerun")
+    signals.task_postrun.connect(task_postrun, weak=False, dispatch_uid="metrics_task_postrun")
+    signals.task_retry.connect(task_retry, weak=False, dispatch_uid="metrics_task_retry")
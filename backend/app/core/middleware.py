@@ -1,11 +1,31 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import time
 from urllib.parse import parse_qs
 
+from django.conf import settings
 from django.contrib.auth import get_user_model  # <--- Импортируем утилиту
+from django.core.cache import cache
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 
 from channels.db import database_sync_to_async
 
+from app.core.db_router import routing_context
+from app.core.metrics import HTTP_REQUEST_DURATION, count_cache_lookup
+from app.core.throttling import get_ident
+from app.core.timing import collect_timings, format_profile, profile_request, timed
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
 
 @database_sync_to_async
 def get_user_from_token(token_string):
@@ -43,4 +63,242 @@ class JWTAuthMiddleware:
         else:
             scope["user"] = None
 
-        return await self.app(scope, receive, send)
\ No newline at end of file
+        return await self.app(scope, receive, send)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Закрепляет запросы за primary БД, чтобы лаг реплик не скрывал собственные
+    записи пользователя:
+    - небезопасные методы (POST/PUT/PATCH/DELETE) читают с primary;
+    - после записи клиент на REPLICA_PIN_SECONDS читает только с primary.
+
+    Клиент определяется по заголовку Authorization (JWT), session cookie или IP
+    (за nginx - из X-Forwarded-For с учетом NUM_PROXIES, а не REMOTE_ADDR прокси).
+    Пути из REPLICA_READ_POST_PATHS (GraphQL) закрепляются только по факту записи.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        pin_key = self._pin_key(request)
+        primary = (
+            request.method not in self.SAFE_METHODS
+            and not request.path.startswith(tuple(settings.REPLICA_READ_POST_PATHS))
+        )
+        if not primary:
+            with timed("cache"):
+                primary = count_cache_lookup("db_pin", cache.get(pin_key)) is not None
+
+        with routing_context(primary=primary) as state:
+            response = self.get_response(request)
+
+        if state.wrote:
+            with timed("cache"):
+                cache.set(pin_key, 1, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def _pin_key(self, request):
+        credential = (
+            request.headers.get("Authorization")
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            or get_ident(request)
+        )
+        return "db_pin:" + hashlib.sha256(credential.encode()).hexdigest()
+
+
+timing_logger = logging.getLogger("app.timing")
+
+
+class MetricsMiddleware:
+    """
+    Гистограмма длительности запросов по маршруту URL (шаблон из urls.py,
+    а не фактический путь - число серий не растет с числом комментариев).
+    """
+
+    METHODS = ("GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        HTTP_REQUEST_DURATION.labels(
+            request.method if request.method in self.METHODS else "OTHER",
+            match.route if match is not None else "<unmatched>",
+            response.status_code,
+        ).observe(time.perf_counter() - started)
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Время запроса по подсистемам (app.core.timing): db, cache, channels,
+    recaptcha, cloudinary, serializer, render; остальное время - app.
+
+    - строка лога "app.timing" на каждый запрос (DEBUG, а дольше
+      SLOW_REQUEST_MS - WARNING) с длительностями в extra["timings"];
+    - заголовок Server-Timing при SERVER_TIMING_HEADER (виден в DevTools);
+    - доля SLOW_REQUEST_PROFILE_RATE запросов выполняется под cProfile,
+      профиль медленных сохраняется в SLOW_REQUEST_PROFILE_DIR и пишется в лог.
+
+    У потоковых ответов замер заканчивается на отдаче заголовков.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING:
+            return self.get_response(request)
+
+        rate = settings.SLOW_REQUEST_PROFILE_RATE
+        with collect_timings() as timings:
+            if rate and random.random() < rate:
+                with profile_request() as profiler:
+                    response = self.get_response(request)
+            else:
+                profiler = None
+                response = self.get_response(request)
+        total = timings.elapsed()
+
+        metrics = {
+            name: (duration * 1000, timings.counts[name])
+            for name, duration in timings.durations.items()
+        }
+        app_ms = max(0.0, total * 1000 - sum(ms for ms, _ in metrics.values()))
+        total_ms = total * 1000
+
+        if settings.SERVER_TIMING_HEADER:
+            response.headers["Server-Timing"] = ", ".join(
+                [f'{name};dur={ms:.1f};desc="{count}x"' for name, (ms, count) in metrics.items()]
+                + [f"app;dur={app_ms:.1f}", f"total;dur={total_ms:.1f}"]
+            )
+
+        slow = total_ms >= settings.SLOW_REQUEST_MS
+        level = logging.WARNING if slow else logging.DEBUG
+        if timing_logger.isEnabledFor(level):
+            timing_logger.log(
+                level,
+                "%s %s %s total=%.1fms app=%.1fms %s",
+                request.method,
+                request.path,
+                response.status_code,
+                total_ms,
+                app_ms,
+                " ".join(f"{name}={ms:.1f}ms/{count}" for name, (ms, count) in metrics.items()),
+                extra={
+                    "timings": {
+                        "method": request.method,
+                        "path": request.path,
+                        "status": response.status_code,
+                        "total_ms": round(total_ms, 1),
+                        "app_ms": round(app_ms, 1),
+                        **{f"{name}_ms": round(ms, 1) for name, (ms, _) in metrics.items()},
+                        **{f"{name}_count": count for name, (_, count) in metrics.items()},
+                    }
+                },
+            )
+        if slow and profiler is not None:
+            self._dump_profile(request, profiler, total_ms)
+        return response
+
+    def _dump_profile(self, request, profiler, total_ms):
+        directory = settings.SLOW_REQUEST_PROFILE_DIR
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+        path = os.path.join(
+            directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{total_ms:.0f}ms.prof"
+        )
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError:
+            timing_logger.exception("Failed to save profile to %s", path)
+            path = None
+        timing_logger.warning(
+            "Slow request profile %s %s (%.1fms), saved to %s\n%s",
+            request.method,
+            request.path,
+            total_ms,
+            path,
+            format_profile(profiler),
+        )
+
+
+re_accepts_brotli = re.compile(r"\bbr\b")
+
+
+def brotli_sequence(sequence, quality):
+    """Сжимает поток кусками, отдавая каждый кусок клиенту сразу"""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Сжатие ответов API больше COMPRESSION_MIN_SIZE байт.
+
+    Brotli - если клиент его принимает и установлен пакет brotli
+    (COMPRESSION_BROTLI), иначе gzip из GZipMiddleware Django.
+    Сжимаются только текстовые API форматы (JSON и т.п.); HTML с CSRF токенами
+    не сжимается (BREACH). Потоковые ответы сжимаются по мере отдачи.
+    """
+
+    COMPRESSIBLE_TYPES = (
+        "application/json",
+        "application/x-ndjson",
+        "application/javascript",
+        "application/vnd.oai.openapi",
+        "text/plain",
+        "text/csv",
+        "text/css",
+    )
+
+    def process_response(self, request, response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if response.has_header("Content-Encoding") or content_type not in self.COMPRESSIBLE_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        accepts = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if (
+            brotli is None
+            or not settings.COMPRESSION_BROTLI
+            or not re_accepts_brotli.search(accepts)
+            or (response.streaming and response.is_async)
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            response.streaming_content = brotli_sequence(response.streaming_content, quality)
+            del response.headers["Content-Length"]
+        else:
+            compressed = brotli.compress(response.content, quality=quality)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
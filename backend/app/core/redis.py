@@ -0,0 +1,36 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+
+
+_async_clients = weakref.WeakKeyDictionary()
+_sync_clients = {}
+
+
+def get_async_redis(url):
+    """
+    Возвращает асинхронный Redis клиент для текущего event loop.
+
+    Клиенты redis.asyncio привязаны к loop, в котором созданы, поэтому
+    кешируем их отдельно для каждого loop (как это делает channels_redis).
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(url)
+    if client is None:
+        client = clients[url] = aioredis.Redis.from_url(url)
+    return client
+
+
+def get_sync_redis(url, **options):
+    """
+    Возвращает синхронный Redis клиент (один пул соединений на процесс
+    для каждой пары url + options, например socket_timeout).
+    """
+    key = (url, *sorted(options.items()))
+    client = _sync_clients.get(key)
+    if client is None:
+        client = _sync_clients[key] = redis.Redis.from_url(url, **options)
+    return client
@@ -0,0 +1,182 @@
+"""
+Ограничение частоты записи (token bucket на пользователя и на IP).
+
+Каждый scope (THROTTLE_RATES) задает скорость вида "10/min": емкость ведра
+10 запросов, пополнение 10 токенов в минуту. Запрос авторизованного
+пользователя списывает токен из его ведра и из ведра его IP (емкость IP
+больше в THROTTLE_IP_FACTOR раз - за одним NAT бывает несколько
+пользователей). Токены списываются, только если они есть во всех ведрах.
+
+В Redis проверка - один Lua скрипт (одна операция на запрос, атомарно для
+всех процессов); время берется из Redis, а не из часов процессов.
+Если Redis недоступен или не ответил за THROTTLE_REDIS_TIMEOUT, запрос
+пропускается (fail open).
+
+Проверка выполняется до разбора тела и валидации: DRF вызывает throttles
+в initial(), GraphQL мутации - check_rate() первым делом.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from redis import RedisError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from app.core.metrics import THROTTLED_REQUESTS
+from app.core.redis import get_sync_redis
+from app.core.timing import timed
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS - ведра, ARGV - пары (емкость, токенов в секунду) для каждого ведра.
+# Возвращает время ожидания в секундах (строкой: Lua number -> Redis integer
+# отбрасывает дробную часть), "0" - токен списан.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    level = math.min(capacity, level + elapsed * rate)
+    levels[i] = level
+    if level < 1 then
+        wait = math.max(wait, (1 - level) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return '0'
+"""
+
+
+def parse_rate(rate):
+    """'10/min' -> (емкость, токенов в секунду)"""
+    num, period = rate.split("/")
+    num = int(num)
+    return num, num / PERIODS[period[0]]
+
+
+class LocalThrottleStore:
+    """Ведра в памяти процесса (для тестов и разработки без Redis)"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, buckets):
+        with self._lock:
+            now = time.monotonic()
+            levels = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                level, updated_at = self._buckets.get(key, (capacity, now))
+                level = min(capacity, level + (now - updated_at) * rate)
+                levels.append(level)
+                if level < 1:
+                    wait = max(wait, (1 - level) / rate)
+            if wait:
+                return wait
+            for (key, _, _), level in zip(buckets, levels):
+                self._buckets[key] = (level - 1, now)
+            return 0.0
+
+
+class RedisThrottleStore:
+    """Ведра в Redis: hash {tokens, ts} на ведро, TTL - время полного пополнения"""
+
+    def __init__(self, url, timeout, key_prefix="throttle"):
+        self.url = url
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._script = None
+
+    def consume(self, buckets):
+        if self._script is None:
+            # Короткие таймауты: медленный Redis не задерживает запись, а дает
+            # redis.TimeoutError (RedisError) и пропуск запроса
+            client = get_sync_redis(self.url, socket_timeout=self.timeout, socket_connect_timeout=self.timeout)
+            # EVALSHA, при отсутствии скрипта в кеше Redis - EVAL
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        keys = [f"{self.key_prefix}:{key}" for key, _, _ in buckets]
+        args = [value for _, capacity, rate in buckets for value in (capacity, rate)]
+        return float(self._script(keys=keys, args=args))
+
+
+_store = None
+
+
+def get_throttle_store():
+    global _store
+    if _store is None:
+        if settings.THROTTLE_BACKEND == "redis":
+            _store = RedisThrottleStore(settings.THROTTLE_REDIS_URL, settings.THROTTLE_REDIS_TIMEOUT)
+        else:
+            _store = LocalThrottleStore()
+    return _store
+
+
+def check_rate(scope, user, ident):
+    """
+    Списывает токен scope для пользователя и IP.
+    Возвращает 0, если запрос разрешен, иначе сколько секунд ждать.
+    """
+    rate = settings.THROTTLE_RATES.get(scope)
+    if not rate:
+        return 0.0
+
+    capacity, refill = parse_rate(rate)
+    factor = settings.THROTTLE_IP_FACTOR
+    buckets = [(f"{scope}:ip:{ident}", capacity * factor, refill * factor)]
+    if user is not None and user.is_authenticated:
+        buckets.insert(0, (f"{scope}:user:{user.pk}", capacity, refill))
+
+    try:
+        with timed("throttle"):
+            wait = get_throttle_store().consume(buckets)
+    except RedisError:
+        logger.warning("Throttle store unavailable, request allowed", exc_info=True)
+        return 0.0
+
+    if wait:
+        THROTTLED_REQUESTS.labels(scope).inc()
+    return wait
+
+
+def get_ident(request):
+    """IP клиента с учетом NUM_PROXIES (работает и с Django HttpRequest)"""
+    return BaseThrottle().get_ident(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle для изменяющих методов. Scope берется из атрибута класса
+    или из throttle_scope view; безопасные методы (GET, HEAD, OPTIONS) не ограничиваются.
+    """
+
+    scope = None
+
+    def allow_request(self, request, view):
+        scope = self.scope or getattr(view, "throttle_scope", None)
+        if scope is None or request.method in SAFE_METHODS:
+            return True
+        self.wait_seconds = check_rate(scope, request.user, self.get_ident(request))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
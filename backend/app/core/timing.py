@@ -0,0 +1,127 @@
+"""
+Замеры времени запроса по подсистемам.
+
+ServerTimingMiddleware создает на каждый запрос коллектор Timings и кладет
+его в contextvar (он доходит и до sync_to_async потоков). Код подсистем
+оборачивает вызовы в timed("cache") / timed("recaptcha") / ...; SQL замеряется
+execute_wrapper'ом, который ставится на каждое подключение к БД.
+Вложенные замеры не считаются дважды: SQL внутри timed("serializer")
+попадает в db, а serializer получает только собственное время.
+Вне запроса (Celery, relay, команды) коллектора нет, и timed ничего не делает.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+_current = ContextVar("request_timings", default=None)
+_profiler_lock = threading.Lock()
+
+
+class Timings:
+    """Суммарная длительность (сек) и число вызовов по подсистемам"""
+
+    __slots__ = ("started", "durations", "counts", "nested")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        # Время замеров, вложенных в текущий открытый замер
+        self.nested = 0.0
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def measure(self, name):
+        """Замер блока без времени вложенных замеров"""
+        outer_nested, self.nested = self.nested, 0.0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.add(name, elapsed - self.nested)
+            self.nested = outer_nested + elapsed
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def collect_timings():
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет длительность блока к подсистеме name текущего запроса"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+
+    with timings.measure(name):
+        yield
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper для всех подключений (см. install_query_timer)"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    with timings.measure("db"):
+        return execute(sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """Обработчик connection_created: ставит time_query на подключение один раз"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@contextmanager
+def profile_request():
+    """
+    cProfile на время блока. Профилировщик в процессе может быть только один,
+    поэтому занятый профилировщик не ждем - блок выполняется без профиля (None).
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        yield None
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        try:
+            profiler.enable()
+        except ValueError:  # уже работает другой профилировщик (coverage, отладчик)
+            profiler = None
+        try:
+            yield profiler
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    finally:
+        _profiler_lock.release()
+
+
+def format_profile(profiler, limit=25):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,64 @@
+import functools
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+from app.core.health import readiness_probe
+from app.core.metrics import render_metrics
+
+
+@never_cache
+@require_GET
+def liveness(request):
+    """Процесс жив и обрабатывает запросы (зависимости не проверяются)"""
+    return JsonResponse({"status": "ok"})
+
+
+@never_cache
+@require_GET
+def readiness(request):
+    """
+    Готовность принимать трафик: БД, кеш, channel layer и брокер доступны.
+    503, если хотя бы одна проверка не прошла или не уложилась в таймаут.
+    """
+    ready, checks, cached = readiness_probe.get()
+    return JsonResponse(
+        {"status": "ok" if ready else "fail", "cached": cached, "checks": checks},
+        status=200 if ready else 503,
+    )
+
+
+@require_GET
+def metrics(request):
+    """
+    Метрики в формате Prometheus (text exposition format). Требуют
+    Authorization: Bearer <METRICS_TOKEN>; без токена доступны только с DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
+
+
+def lazy_view(dotted_path):
+    """
+    Представление, которое импортируется при первом запросе. Для тяжелых
+    модулей (GraphQL схема): загрузка urls.py не тянет их в каждый процесс.
+    """
+    load = functools.cache(lambda: import_string(dotted_path))
+
+    def view(request, *args, **kwargs):
+        return load()(request, *args, **kwargs)
+
+    # csrf_exempt и т.п. целевого представления известны только после импорта
+    view.csrf_exempt = True
+    return view
@@ -1,8 +1,24 @@
+import math
 import strawberry
 from typing import Optional
+from django.db import transaction
 from graphql import GraphQLError
 from .types import CommentType
 from app.comments.models import Comment
+from app.comments.outbox import record_reply_created
+from app.core.db_router import use_primary
+from app.core.throttling import check_rate, get_ident
+
+
+def check_throttle(info):
+    """Ограничение частоты мутаций (до обращений к БД)"""
+    request = info.context.request
+    wait = check_rate("graphql_mutation", request.user, get_ident(request))
+    if wait:
+        raise GraphQLError(
+            "Слишком много запросов, попробуйте позже",
+            extensions={"code": "THROTTLED", "retryAfter": math.ceil(wait)}
+        )
 
 
 @strawberry.type
@@ -31,12 +47,15 @@ class Mutation:
             GraphQLError: Чистая ошибка без traceback
         """
         user = info.context.request.user
+        # Мутации читают и пишут только primary (без лага реплик)
+        use_primary()
 
         if not user.is_authenticated:
             raise GraphQLError(
                 "Требуется авторизация!",
                 extensions={"code": "UNAUTHORIZED"}
             )
+        check_throttle(info)
 
         reply = None
         if reply_id:
@@ -48,11 +67,16 @@ class Mutation:
                     extensions={"code": "NOT_FOUND"}
                 )
 
-        comment = Comment.objects.create(
-            user=user,
-            text=text,
-            reply=reply
-        )
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                user=user,
+                text=text,
+                reply=reply
+            )
+
+            # Ответы рассылаются в WebSocket через общий outbox (как и в REST)
+            if reply is not None:
+                record_reply_created(comment)
 
         return comment
 
@@ -78,12 +102,15 @@ class Mutation:
             GraphQLError: Чистая ошибка без traceback
         """
         user = info.context.request.user
+        # Мутации читают и пишут только primary (без лага реплик)
+        use_primary()
 
         if not user.is_authenticated:
             raise GraphQLError(
                 "Требуется авторизация!",
                 extensions={"code": "UNAUTHORIZED"}
             )
+        check_throttle(info)
 
         try:
             comment = Comment.objects.get(id=comment_id)
@@ -124,12 +151,15 @@ class Mutation:
             GraphQLError: Чистая ошибка без traceback
         """
         user = info.context.request.user
+        # Мутации читают и пишут только primary (без лага реплик)
+        use_primary()
 
         if not user.is_authenticated:
             raise GraphQLError(
                 "Требуется авторизация!",
                 extensions={"code": "UNAUTHORIZED"}
             )
+        check_throttle(info)
 
         try:
             comment = Comment.objects.get(id=comment_id)
@@ -29,6 +29,9 @@ class CommentType:
     created_at: auto
     updated_at: auto
     user: UserType
+    descendant_count: auto
+    attachment_count: auto
+    last_activity_at: auto
 
     @strawberry.field
     def reply_id(self) -> Optional[int]:
@@ -57,9 +60,9 @@ class CommentType:
     @strawberry.field
     def reply_count(self) -> int:
         """Количество ответов на комментарий"""
-        return self.replies.count()
+        return self.reply_count
 
     @strawberry.field
     def has_attachments(self) -> bool:
         """Есть ли вложения у комментария"""
-        return self.attachments.exists()
\ No newline at end of file
+        return self.attachment_count > 0
\ No newline at end of file
@@ -0,0 +1,7 @@
+from django.views.decorators.csrf import csrf_exempt
+from strawberry.django.views import GraphQLView
+
+from app.graphql.schema import schema
+
+
+graphql_view = csrf_exempt(GraphQLView.as_view(schema=schema, graphiql=True))
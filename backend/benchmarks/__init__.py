@@ -0,0 +1,5 @@
+"""
+Бенчмарки и нагрузочные скрипты CommentHub.
+
+Запуск из каталога backend: `python -m benchmarks.<name> --help`.
+"""
@@ -0,0 +1,117 @@
+"""
+Сравнение ASGI серверов: один процесс daphne против gunicorn с uvicorn
+воркерами (режимы server и asgi в entrypoint.sh).
+
+Скрипт по очереди запускает каждый сервер на свободном порту с текущими
+переменными окружения (та же БД, Redis и настройки, что у приложения), ждет
+/health/live/, нагружает --path конкурентными GET запросами и печатает
+пропускную способность и перцентили задержки:
+
+    python -m benchmarks.asgi_servers --workers 4 --concurrency 64 --duration 20
+    python -m benchmarks.asgi_servers --servers gunicorn --workers 2 --path /health/live/
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.db_connections import percentile, run_client
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(name, port, workers):
+    if name == "daphne":
+        return ["daphne", "-b", "127.0.0.1", "-p", str(port), "config.asgi:application"]
+    return [
+        "gunicorn", "-c", "config/gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers), "config.asgi:application",
+    ]
+
+
+def wait_until_live(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/live/", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def benchmark(name, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        server_command(name, port, args.workers),
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        wait_until_live(base_url, process)
+        url = base_url + args.path
+
+        # Прогрев: подключения к БД, кеши, импорт в каждом воркере
+        warmup = time.perf_counter() + args.warmup
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(run_client, url, warmup, [], [])
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.duration
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(run_client, url, deadline, latencies, errors)
+    finally:
+        # SIGTERM: заодно проверяем, что сервер мягко останавливается
+        process.terminate()
+        try:
+            process.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    label = name if name == "daphne" else f"{name} x{args.workers}"
+    print(
+        "{:<14} {:>8.1f} req/s  p50={:.1f} p95={:.1f} p99={:.1f} ms  errors={}".format(
+            label,
+            len(latencies) / args.duration,
+            percentile(latencies, 50),
+            percentile(latencies, 95),
+            percentile(latencies, 99),
+            len(errors),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="+", choices=["daphne", "gunicorn"], default=["daphne", "gunicorn"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--path", default="/api/comments/")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for name in args.servers:
+        try:
+            benchmark(name, args)
+        except RuntimeError as exc:
+            print(f"{name}: {exc}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Стоимость хранения результатов Celery задач.
+
+Выполняет send_reply_notification_email внутри процесса (task.apply с
+task_store_eager_result - результат пишется так же, как в воркере) в двух
+режимах и печатает пропускную способность и число записей в БД на задачу:
+
+- db: как раньше - результат каждой задачи в TaskResult (django-db, result_extended);
+- current: политика из настроек (ignore_result для уведомлений).
+
+    python -m benchmarks.celery_results --tasks 2000
+    DJANGO_SETTINGS_MODULE=config.settings python -m benchmarks.celery_results
+"""
+import argparse
+import io
+import os
+import time
+from contextlib import contextmanager, redirect_stdout
+
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.test_settings")
+    from django.conf import settings
+
+    # Письма не отправляются: меряем только накладные расходы Celery и БД
+    settings.EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def result_policy(task, mode):
+    from config.celery import database_backend
+
+    saved = task.ignore_result, task.backend, task.app.conf.result_extended
+    if mode == "db":
+        task.ignore_result = False
+        task.backend = database_backend()
+        task.app.conf.result_extended = True
+    try:
+        yield
+    finally:
+        task.ignore_result, task.backend, task.app.conf.result_extended = saved
+
+
+def run(task, mode, count):
+    from django.db import connection
+    from django_celery_results.models import TaskResult
+
+    writes = []
+
+    def count_writes(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+            writes.append(sql)
+        return execute(sql, params, many, context)
+
+    rows_before = TaskResult.objects.count()
+    with result_policy(task, mode), connection.execute_wrapper(count_writes):
+        started = time.perf_counter()
+        for index in range(count):
+            task.apply(kwargs={"user_email": f"user{index}@example.com", "comment_text_short": "Reply"})
+        elapsed = time.perf_counter() - started
+    rows = TaskResult.objects.count() - rows_before
+
+    print(
+        f"{mode:<8} {count / elapsed:>9.1f} tasks/s  {len(writes) / count:>5.2f} writes/task  "
+        f"{rows:>6} TaskResult rows"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", choices=["db", "current"], default=["db", "current"])
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import call_command
+
+    from app.comments.tasks import send_reply_notification_email
+    from config.celery import app
+
+    call_command("migrate", verbosity=0)
+    app.conf.task_store_eager_result = True
+
+    for mode in args.modes:
+        # Прогрев: шаблоны письма, подключение к БД
+        with redirect_stdout(io.StringIO()):
+            run(send_reply_notification_email, mode, 10)
+        run(send_reply_notification_email, mode, args.tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Сравнение CommentSerializer и CommentTreeReader на деревьях комментариев.
+
+Создает дерево из N узлов в SQLite в памяти (настройки config.test_settings),
+затем отдает все корни с полным деревом ответов обоими способами и печатает
+время, число запросов и ускорение. Перед замером проверяет, что JSON совпадает.
+
+    python -m benchmarks.comment_tree --sizes 1000 10000 100000
+"""
+import argparse
+import io
+import os
+import random
+import time
+from datetime import timedelta
+
+
+def build_tree(size, roots, seed=42):
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from app.comments.models import Comment, CommentAttachment
+
+    CommentAttachment.objects.all().delete()
+    Comment.objects.all().delete()
+    User = get_user_model()
+    User.objects.all().delete()
+    users = User.objects.bulk_create(
+        User(username=f"user{i}", email=f"user{i}@example.com") for i in range(50)
+    )
+
+    rng = random.Random(seed)
+    started = timezone.now() - timedelta(days=30)
+    comments = []
+    for pk in range(1, size + 1):
+        # Первые узлы - корни, остальные отвечают на случайный более ранний комментарий
+        parent = None if pk <= roots else rng.randint(1, pk - 1)
+        created_at = started + timedelta(seconds=pk)
+        comments.append(
+            Comment(
+                pk=pk,
+                user=rng.choice(users),
+                text=f"Comment {pk} " + "lorem ipsum " * rng.randint(1, 20),
+                reply_id=parent,
+                created_at=created_at,
+                updated_at=created_at,
+                last_activity_at=created_at,
+            )
+        )
+    Comment.objects.bulk_create(comments, batch_size=2000)
+    CommentAttachment.objects.bulk_create(
+        CommentAttachment(
+            comment_id=pk, file=f"https://example.com/{pk}.png", media_type="image"
+        )
+        for pk in range(1, size + 1, 20)
+    )
+    call_command("rebuild_comment_counters", stdout=io.StringIO())
+
+
+def measure(func):
+    from django.db import connection
+
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+    return result, elapsed, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--roots", type=int, default=25, help="Number of top-level comments")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.test_settings")
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+    from rest_framework.renderers import JSONRenderer
+
+    from app.comments.models import Comment
+    from app.comments.readers import CommentTreeReader
+    from app.comments.serializers import CommentSerializer
+
+    call_command("migrate", verbosity=0)
+    renderer = JSONRenderer()
+
+    print(f"{'nodes':>8} {'serializer s':>13} {'queries':>8} {'reader s':>9} {'queries':>8} {'speedup':>8}")
+    for size in args.sizes:
+        build_tree(size, min(args.roots, size))
+        queryset = Comment.objects.filter(reply__isnull=True).order_by("-created_at")
+
+        expected, serializer_time, serializer_queries = measure(
+            lambda: renderer.render(
+                CommentSerializer(CommentSerializer.optimize_queryset(queryset), many=True).data
+            )
+        )
+        reader = CommentTreeReader()
+        actual, reader_time, reader_queries = measure(
+            lambda: renderer.render(reader.render(reader.prepare(queryset)))
+        )
+        if actual != expected:
+            raise SystemExit(f"Output differs for {size} nodes")
+
+        print(
+            f"{size:>8} {serializer_time:>13.3f} {serializer_queries:>8} "
+            f"{reader_time:>9.3f} {reader_queries:>8} {serializer_time / reader_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
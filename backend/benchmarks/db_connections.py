@@ -0,0 +1,106 @@
+"""
+Нагрузочный тест подключений к PostgreSQL.
+
+Нагружает запущенный сервер конкурентными GET запросами и параллельно
+опрашивает pg_stat_activity, чтобы увидеть число открытых подключений.
+Запустите сервер с DB_POOL=False, затем с DB_POOL=True и сравните отчеты:
+
+    APP_ROLE=web DB_POOL=False daphne config.asgi:application
+    python -m benchmarks.db_connections --url http://localhost:8000/api/comments/
+
+    APP_ROLE=web DB_POOL=True daphne config.asgi:application
+    python -m benchmarks.db_connections --url http://localhost:8000/api/comments/
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def sample_connections(dsn, stop, interval, samples):
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        while not stop.is_set():
+            row = conn.execute(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            ).fetchone()
+            samples.append(row[0])
+            time.sleep(interval)
+
+
+def run_client(url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception:
+            errors.append(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/api/comments/")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--dsn",
+        default="host={} port={} dbname={} user={} password={}".format(
+            os.getenv("DB_HOST", "localhost"),
+            os.getenv("DB_PORT", "5432"),
+            os.getenv("DB_NAME", "comments_db"),
+            os.getenv("DB_USER", "postgres"),
+            os.getenv("DB_PASSWORD", "postgres"),
+        ),
+    )
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    samples, latencies, errors = [], [], []
+    sampler = threading.Thread(
+        target=sample_connections, args=(args.dsn, stop, 0.5, samples), daemon=True
+    )
+    sampler.start()
+
+    deadline = time.perf_counter() + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(run_client, args.url, deadline, latencies, errors)
+
+    stop.set()
+    sampler.join()
+
+    print(f"requests:        {len(latencies)} ok, {len(errors)} errors")
+    print(f"throughput:      {len(latencies) / args.duration:.1f} req/s")
+    print(
+        "latency ms:      p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(
+            percentile(latencies, 50),
+            percentile(latencies, 95),
+            percentile(latencies, 99),
+            max(latencies, default=0.0),
+        )
+    )
+    if samples:
+        print(
+            "db connections:  min={} avg={:.1f} max={}".format(
+                min(samples), statistics.mean(samples), max(samples)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Импорты при старте процессов: web, Celery worker, Celery beat, outbox relay.
+
+Каждая точка входа запускается в отдельном интерпретаторе с -X importtime.
+Печатает время импорта, пиковый RSS, самые дорогие модули и тяжелые
+зависимости, которые этот процесс загрузил:
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --entry beat --top 30
+    python -m benchmarks.importtime --output importtime.json   # сохранить отчет для сравнения
+
+Запускается с теми же переменными окружения, что и приложение
+(DJANGO_SETTINGS_MODULE, SECRET_KEY, ...).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+SETUP = "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')"
+
+ENTRY_POINTS = {
+    # ASGI приложение и urls.py (их загружает первый запрос)
+    "web": "import config.asgi; from django.urls import get_resolver; get_resolver().url_patterns",
+    # Celery после старта импортирует модули задач
+    "worker": "from config.celery import app; import django; django.setup(); app.loader.import_default_modules()",
+    "beat": "from config.celery import app; import django; django.setup()",
+    "relay": "import django; django.setup(); import app.comments.management.commands.relay_outbox",
+}
+
+# Нужны только на отдельных путях (GraphQL, загрузка файлов, очистка HTML)
+HEAVY_MODULES = [
+    "strawberry_django",
+    "strawberry",
+    "app.graphql.schema",
+    "cloudinary",
+    "PIL",
+    "bleach",
+]
+
+REPORT = (
+    "import json, sys, resource; "
+    "print('__REPORT__' + json.dumps([sorted(sys.modules), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))"
+)
+
+
+def run_entry(code):
+    """(модули, пиковый RSS в КБ, [(мкс cumulative, модуль)]) для кода точки входа"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{SETUP}; {code}; {REPORT}"],
+        capture_output=True, text=True, check=True,
+    )
+    report = next(line for line in result.stdout.splitlines() if line.startswith("__REPORT__"))
+    modules, rss = json.loads(report[len("__REPORT__"):])
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Только модули верхнего уровня: их cumulative не пересекаются
+        if not name.startswith("  "):
+            timings.append((int(cumulative), name.strip()))
+    return modules, rss, timings
+
+
+def heavy_modules(modules):
+    loaded = set(modules)
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", nargs="+", choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write a JSON report")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    report = {}
+    for entry in args.entry:
+        modules, rss, timings = run_entry(ENTRY_POINTS[entry])
+        total_ms = sum(cumulative for cumulative, _ in timings) / 1000
+        heavy = heavy_modules(modules)
+        report[entry] = {
+            "import_ms": round(total_ms, 1),
+            "max_rss_kb": rss,
+            "modules": len(modules),
+            "heavy": heavy,
+            "top": [[name, round(cumulative / 1000, 1)] for cumulative, name in sorted(timings, reverse=True)[:args.top]],
+        }
+
+        print(f"{entry}: imports {total_ms:.0f} ms, {len(modules)} modules, max RSS {rss / 1024:.1f} MB")
+        print(f"  heavy: {', '.join(heavy) or '-'}")
+        for name, ms in report[entry]["top"]:
+            print(f"  {ms:>8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
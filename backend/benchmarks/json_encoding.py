@@ -0,0 +1,87 @@
+"""
+Пропускная способность JSON кодирования на реальных деревьях комментариев.
+
+Строит дерево (как benchmarks.comment_tree), получает данные ответа
+GET /api/comments/ через CommentTreeReader и кодирует их JSONRenderer DRF,
+app.core.json со стандартным json и с orjson (если установлен).
+Отдельно замеряет мелкие WebSocket сообщения new_reply.
+
+    python -m benchmarks.json_encoding --sizes 1000 10000 --repeat 5
+"""
+import argparse
+import os
+import time
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--roots", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=20000, help="WebSocket messages to encode")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.test_settings")
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from rest_framework.renderers import JSONRenderer
+
+    from app.comments.models import Comment
+    from app.comments.readers import CommentTreeReader
+    from app.core import json as fast_json
+    from benchmarks.comment_tree import build_tree
+
+    call_command("migrate", verbosity=0)
+    backends = ["json"] + (["orjson"] if fast_json.orjson is not None else [])
+    if fast_json.orjson is None:
+        print('orjson is not installed (pip install ".[fast]"), measuring stdlib only')
+
+    def encoders(data):
+        yield "drf JSONRenderer", lambda: JSONRenderer().render(data)
+        for backend in backends:
+            def encode(backend=backend):
+                settings.JSON_BACKEND = backend
+                return fast_json.FastJSONRenderer().render(data)
+            yield f"FastJSONRenderer/{backend}", encode
+
+    print(f"{'nodes':>8} {'encoder':<24} {'MB':>7} {'ms':>9} {'MB/s':>8}")
+    for size in args.sizes:
+        build_tree(size, min(args.roots, size))
+        reader = CommentTreeReader()
+        data = reader.render(reader.prepare(Comment.objects.filter(reply__isnull=True)))
+
+        expected = None
+        for name, encode in encoders(data):
+            content, elapsed = best_of(encode, args.repeat)
+            if expected is None:
+                expected = content
+            elif content != expected:
+                raise SystemExit(f"{name} output differs for {size} nodes")
+            megabytes = len(content) / 1e6
+            print(f"{size:>8} {name:<24} {megabytes:>7.2f} {elapsed * 1000:>9.1f} {megabytes / elapsed:>8.1f}")
+
+    # Сообщение new_reply в том виде, в каком его отправляет ReplyConsumer
+    message = {"type": "new_reply", "id": "1700000000000-0", "data": {**data[0], "replies": []}}
+    for backend in backends:
+        settings.JSON_BACKEND = backend
+        _, elapsed = best_of(
+            lambda: [fast_json.dumps_text(message) for _ in range(args.messages)], args.repeat
+        )
+        print(f"ws new_reply/{backend}: {args.messages / elapsed:,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
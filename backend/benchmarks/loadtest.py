@@ -0,0 +1,272 @@
+"""
+Локальный нагрузочный стенд: REST, GraphQL и WebSocket внутри процесса.
+
+Запросы проходят весь стек Django (middleware, DRF, strawberry) через
+django.test.Client, WebSocket - через WebsocketCommunicator channels, без
+запущенного сервера. Бэкенды берутся из настроек: по умолчанию
+config.test_settings (SQLite в памяти, локальные кеш и channel layer), с
+DJANGO_SETTINGS_MODULE=config.settings - локальные PostgreSQL и Redis.
+
+Данные создает generate_comments (--generate N веток, для базы в памяти
+обязательно). Для каждого сценария печатает пропускную способность,
+перцентили задержки и среднее число SQL запросов на запрос:
+
+    python -m benchmarks.loadtest --generate 300 --requests 500 --concurrency 4
+    DJANGO_SETTINGS_MODULE=config.settings python -m benchmarks.loadtest --scenarios rest-list ws
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from benchmarks.db_connections import percentile
+
+
+GRAPHQL_QUERY = """
+query Comments($limit: Int, $offset: Int) {
+  comments(limit: $limit, offset: $offset) {
+    id text createdAt replyCount
+    user { username }
+    replyList { id text user { username } }
+  }
+}
+"""
+
+
+class Result:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        count = len(self.latencies)
+        ms = [value * 1000 for value in self.latencies]
+        queries = f"{statistics.mean(self.queries):>8.1f}" if self.queries else f"{'-':>8}"
+        print(
+            f"{self.name:<12} {count:>7} {self.errors:>6} {count / max(self.elapsed, 1e-9):>8.1f} "
+            f"{percentile(ms, 50):>8.1f} {percentile(ms, 95):>8.1f} {percentile(ms, 99):>8.1f} "
+            f"{max(ms, default=0):>8.1f} {queries}"
+        )
+
+
+# ============================================
+# СЦЕНАРИИ HTTP
+# ============================================
+def rest_list(client, context, rng):
+    page = rng.randint(1, context["pages"])
+    return client.get("/api/comments/", {"page": page, "depth": 2, "replies_limit": 10})
+
+
+def rest_detail(client, context, rng):
+    return client.get(
+        f"/api/comments/{rng.choice(context['root_ids'])}/", {"depth": 3, "replies_limit": 20}
+    )
+
+
+def graphql(client, context, rng):
+    return client.post(
+        "/graphql/",
+        {"query": GRAPHQL_QUERY, "variables": {"limit": 20, "offset": rng.randrange(context["roots"])}},
+        content_type="application/json",
+    )
+
+
+HTTP_SCENARIOS = {"rest-list": rest_list, "rest-detail": rest_detail, "graphql": graphql}
+
+
+def run_http(name, scenario, context, requests, concurrency, seed):
+    from django.db import connection
+    from django.test import Client
+
+    result = Result(name)
+    lock = threading.Lock()
+
+    def worker(index, count):
+        client = Client()
+        rng = random.Random(seed + index)
+        queries = []
+
+        def count_query(execute, sql, params, many, ctx):
+            queries.append(sql)
+            return execute(sql, params, many, ctx)
+
+        try:
+            for _ in range(count):
+                queries.clear()
+                with connection.execute_wrapper(count_query):
+                    started = time.perf_counter()
+                    response = scenario(client, context, rng)
+                    content = b"".join(response) if response.streaming else response.content
+                    latency = time.perf_counter() - started
+                failed = response.status_code >= 400 or b'"errors"' in content[:200]
+                with lock:
+                    result.latencies.append(latency)
+                    result.queries.append(len(queries))
+                    result.errors += failed
+        finally:
+            connection.close()
+
+    shares = [requests // concurrency + (index < requests % concurrency) for index in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker, index, count) for index, count in enumerate(shares)]:
+            future.result()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+# ============================================
+# СЦЕНАРИЙ WEBSOCKET
+# ============================================
+async def run_ws(context, messages, clients):
+    """
+    Подключает clients слушателей к одной ветке и публикует messages ответов
+    через publish_reply. Задержка - от публикации до получения всеми слушателями.
+    """
+    from asgiref.sync import sync_to_async
+    from channels.db import database_sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from django.contrib.auth import get_user_model
+
+    from app.comments.consumers import ReplyConsumer
+    from app.comments.events import publish_reply
+
+    user = await database_sync_to_async(get_user_model().objects.first)()
+    root_id = context["root_ids"][0]
+    result = Result("ws")
+    connect = Result("ws-connect")
+
+    async def receive_reply(communicator):
+        while True:
+            message = await communicator.receive_json_from(timeout=5)
+            if message["type"] == "new_reply":
+                return message
+
+    communicators = []
+    for _ in range(clients):
+        communicator = WebsocketCommunicator(ReplyConsumer.as_asgi(), f"/ws/comments/{root_id}/")
+        communicator.scope["user"] = user
+        communicator.scope["url_route"] = {"kwargs": {"comment_name": str(root_id)}}
+        started = time.perf_counter()
+        connected, _ = await communicator.connect()
+        connect.latencies.append(time.perf_counter() - started)
+        connect.errors += not connected
+        communicators.append(communicator)
+
+    started = time.perf_counter()
+    for index in range(messages):
+        sent = time.perf_counter()
+        await sync_to_async(publish_reply)(root_id, {"id": index, "text": "load test"})
+        try:
+            await asyncio.gather(*(receive_reply(communicator) for communicator in communicators))
+        except asyncio.TimeoutError:
+            result.errors += 1
+        result.latencies.append(time.perf_counter() - sent)
+    result.elapsed = time.perf_counter() - started
+    connect.elapsed = sum(connect.latencies)
+
+    for communicator in communicators:
+        await communicator.disconnect()
+    return [connect, result]
+
+
+# ============================================
+# ЗАПУСК
+# ============================================
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.test_settings")
+    from django.conf import settings
+
+    database = settings.DATABASES["default"]
+    if database["ENGINE"].endswith("sqlite3") and database["NAME"] == ":memory:":
+        # У каждого потока свое подключение - база в памяти должна быть общей
+        database["NAME"] = "file:loadtest?mode=memory&cache=shared"
+    # django.test.Client ходит с Host: testserver
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+
+    import django
+
+    django.setup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=[*HTTP_SCENARIOS, "ws"],
+        default=[*HTTP_SCENARIOS, "ws"],
+    )
+    parser.add_argument("--requests", type=int, default=300, help="Requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads per HTTP scenario")
+    parser.add_argument("--ws-clients", type=int, default=20, help="WebSocket listeners of one thread")
+    parser.add_argument("--ws-messages", type=int, default=100)
+    parser.add_argument(
+        "--generate",
+        type=int,
+        default=0,
+        metavar="THREADS",
+        help="Run generate_comments --clear with this many threads before the test",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from app.comments.models import Comment
+
+    call_command("migrate", verbosity=0)
+    if args.generate:
+        call_command(
+            "generate_comments", threads=args.generate, clear=True, seed=args.seed, stdout=io.StringIO()
+        )
+
+    root_ids = list(Comment.objects.filter(reply__isnull=True).values_list("id", flat=True))
+    if not root_ids:
+        raise SystemExit("No comments: pass --generate N or fill the database with generate_comments")
+    page_size = settings.REST_FRAMEWORK.get("PAGE_SIZE") or 25
+    context = {
+        "root_ids": root_ids,
+        "roots": len(root_ids),
+        "pages": max(1, -(-len(root_ids) // page_size)),
+    }
+    print(
+        f"{Comment.objects.count()} comments, {len(root_ids)} threads, "
+        f"database: {settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]}, "
+        f"concurrency: {args.concurrency}"
+    )
+
+    results = []
+    for name in args.scenarios:
+        if name == "ws":
+            with redirect_stdout(io.StringIO()):  # consumer печатает каждое событие
+                results.extend(asyncio.run(run_ws(context, args.ws_messages, args.ws_clients)))
+        else:
+            # Прогрев: первые запросы импортируют модули и наполняют кеши
+            run_http(name, HTTP_SCENARIOS[name], context, min(10, args.requests), 1, args.seed)
+            results.append(
+                run_http(name, HTTP_SCENARIOS[name], context, args.requests, args.concurrency, args.seed)
+            )
+
+    print(
+        f"{'scenario':<12} {'count':>7} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'queries':>8}"
+    )
+    for result in results:
+        result.report()
+
+
+if __name__ == "__main__":
+    main()
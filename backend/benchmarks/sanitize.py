@@ -0,0 +1,99 @@
+"""
+Пропускная способность очистки текста комментариев (app.comments.sanitizer).
+
+Входы по 1500 символов (максимальная длина, которую шлет редактор):
+- typical: абзацы текста с разрешенной разметкой, ссылкой и парой URL;
+- worst: вложенные неразрешенные теги с атрибутами, сущности, незакрытые
+  теги и много URL (дорого и для Cleaner, и для Linker).
+
+Режимы:
+- bleach: bleach.clean() + bleach.linkify() на каждый вызов (как раньше);
+- shared: общий Cleaner/Linker потока (clean_html);
+- miss: sanitize_text на каждый раз новом тексте (промах LRU);
+- hit: sanitize_text на повторяющемся тексте (предпросмотр при паузах ввода).
+
+    python -m benchmarks.sanitize --calls 2000
+"""
+import argparse
+import os
+import time
+
+
+LENGTH = 1500
+
+TYPICAL_CHUNK = (
+    "<p>Отличная статья, <strong>спасибо</strong>! Про индексы есть подробнее "
+    "тут: https://www.postgresql.org/docs/current/indexes.html и в "
+    '<a href="https://example.com/guide" title="guide">этом гайде</a>. '
+    "Пример: <code>SELECT * FROM comments WHERE reply_id IS NULL</code>, "
+    "<i>но</i> лучше с <em>LIMIT</em>.</p><br>"
+)
+
+WORST_CHUNK = (
+    '<div class="x" onclick="alert(1)"><span style="color:red"><script>alert("x")</script>'
+    '<a href="javascript:alert(1)" onmouseover="y">click</a> example.com/a?b=1&amp;c=2 '
+    "<table><tr><td>&lt;b&gt; &#x3C;i&#x3E; www.test.org http://a.io/x</td></tr></table>"
+    "<img src=x onerror=alert(1)><iframe src=//evil.io></iframe><b><i><strong><em>"
+    "<!-- comment --> foo.net bar.org/path <unknown attr=1>"
+)
+
+
+def make_text(chunk, suffix=""):
+    text = chunk * (LENGTH // len(chunk) + 1)
+    return text[: LENGTH - len(suffix)] + suffix
+
+
+def rate(func, texts):
+    started = time.perf_counter()
+    for text in texts:
+        func(text)
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", choices=["bleach", "shared", "miss", "hit"], default=["bleach", "shared", "miss", "hit"])
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.test_settings")
+    import django
+
+    django.setup()
+
+    import bleach
+
+    from app.comments import sanitizer
+
+    def legacy(text):
+        cleaned = bleach.clean(
+            text, tags=sanitizer.ALLOWED_TAGS, attributes=sanitizer.ALLOWED_ATTRIBUTES, strip=True
+        )
+        return bleach.linkify(cleaned, parse_email=False, callbacks=[])
+
+    modes = {
+        "bleach": legacy,
+        "shared": sanitizer.clean_html,
+        "miss": sanitizer.sanitize_text,
+        "hit": sanitizer.sanitize_text,
+    }
+
+    print(f"{'input':<8} {'mode':<8} {'calls/s':>10} {'us/call':>9}")
+    for name, chunk in (("typical", TYPICAL_CHUNK), ("worst", WORST_CHUNK)):
+        sample = make_text(chunk)
+        if sanitizer.clean_html(sample) != legacy(sample):
+            raise SystemExit(f"clean_html output differs from bleach for {name} input")
+
+        for mode in args.modes:
+            sanitizer._cached_clean_html.cache_clear()
+            if mode == "hit":
+                texts = [sample] * args.calls
+            else:
+                # Уникальный хвост: ни один вызов не попадает в кеш
+                texts = [make_text(chunk, f" #{index}") for index in range(args.calls)]
+            calls_per_second = rate(modes[mode], texts)
+            print(f"{name:<8} {mode:<8} {calls_per_second:>10.0f} {1e6 / calls_per_second:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Время старта по режимам entrypoint.sh.
+
+Каждая команда manage.py - отдельный холодный старт Django, поэтому
+прежний старт web реплики (makemigrations x2, migrate x2, collectstatic
+--clear, shell для суперпользователя) измеряется как сумма этих команд и
+сравнивается с release (один процесс) и со стартом серверов без них:
+от запуска процесса до первого ответа /health/live/.
+
+Используются текущие переменные окружения (БД из настроек):
+
+    python -m benchmarks.startup --repeat 3
+    python -m benchmarks.startup --modes release asgi --workers 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.asgi_servers import free_port, wait_until_live
+
+
+SUPERUSER_CHECK = (
+    "from django.contrib.auth import get_user_model; "
+    "get_user_model().objects.filter(username='admin').exists()"
+)
+
+# makemigrations с --dry-run: стоимость та же, файлы миграций не создаются
+LEGACY_STEPS = [
+    ["makemigrations", "users", "--noinput", "--dry-run"],
+    ["makemigrations", "comments", "--noinput", "--dry-run"],
+    ["migrate", "users", "--noinput"],
+    ["migrate", "--noinput"],
+    ["collectstatic", "--noinput", "--clear"],
+    ["shell", "-c", SUPERUSER_CHECK],
+]
+
+SERVERS = {
+    "server": lambda port, workers: [
+        "daphne", "-b", "127.0.0.1", "-p", str(port), "config.asgi:application",
+    ],
+    "asgi": lambda port, workers: [
+        "gunicorn", "-c", "config/gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers), "config.asgi:application",
+    ],
+    "gunicorn": lambda port, workers: [
+        "gunicorn", "config.wsgi:application", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+    ],
+}
+
+
+def manage(args, env):
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "manage.py", *args],
+        env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def time_server(mode, workers, env):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        SERVERS[mode](port, workers), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_live(f"http://127.0.0.1:{port}", process)
+        return time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=40)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--modes", nargs="+", default=["legacy", "release", "server", "asgi", "gunicorn"],
+        choices=["legacy", "release", "server", "asgi", "gunicorn"],
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with tempfile.TemporaryDirectory() as static_root:
+        # collectstatic --clear не должен трогать настоящую STATIC_ROOT
+        env = {**os.environ, "STATIC_ROOT": static_root, "DJANGO_SUPERUSER_USERNAME": ""}
+
+        for mode in args.modes:
+            timings = []
+            for _ in range(args.repeat):
+                if mode == "legacy":
+                    timings.append(sum(manage(step, env) for step in LEGACY_STEPS))
+                elif mode == "release":
+                    timings.append(manage(["release"], env))
+                else:
+                    timings.append(time_server(mode, args.workers, env))
+            print(
+                "{:<10} median={:.2f}s min={:.2f}s max={:.2f}s".format(
+                    mode, statistics.median(timings), min(timings), max(timings)
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ ASGI config for config project.
 """
 
 import os
+
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -10,6 +11,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
+from app.core.lifespan import lifespan
 from app.core.middleware import JWTAuthMiddleware
 from app.comments import routing
 
@@ -17,5 +19,6 @@ application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": JWTAuthMiddleware(URLRouter(routing.websocket_urlpatterns)),
+        "lifespan": lifespan,
     }
-)
\ No newline at end of file
+)
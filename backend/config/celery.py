@@ -4,8 +4,10 @@ import os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 from celery import Celery
-from celery.signals import after_setup_logger
+from celery.signals import after_setup_logger, worker_init
+from django.conf import settings
 
+from app.core.metrics import connect_celery_signals, start_worker_metrics_server
 from .celery_settings import CELERY
 
 logger = logging.getLogger(__name__)
@@ -16,6 +18,27 @@ app.config_from_object(CELERY)
 
 app.autodiscover_tasks()
 
+# Длительность и повторы задач (app.core.metrics)
+connect_celery_signals()
+
+
+def database_backend():
+    """
+    Хранилище django-db (модель TaskResult) для задач, результаты которых нужны:
+    @app.task(ignore_result=False, backend=database_backend())
+    Пишутся статус и результат; имя задачи и аргументы (result_extended)
+    не сохраняются - это лишний объем на каждую запись.
+    """
+    from django_celery_results.backends import DatabaseBackend
+
+    return DatabaseBackend(app=app, url="django-db")
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    start_worker_metrics_server(settings.CELERY_METRICS_PORT)
+
+
 @after_setup_logger.connect
 def setup_loggers(logger, *args, **kwargs):
     formatter = logging.Formatter(
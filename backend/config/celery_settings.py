@@ -1,9 +1,35 @@
 from django.conf import settings
+from kombu import Queue
+
+# Очереди по типам задач: медленный SMTP не задерживает остальные задачи.
+# Воркер слушает очереди из CELERY_WORKER_QUEUES (см. entrypoint.sh)
+CELERY_QUEUES = ("default", "email", "maintenance")
 
 CELERY = {
     "broker_url": settings.CELERY_BROKER_URL,
     "timezone": settings.TIME_ZONE,
-    "result_extended": True,
     "beat_scheduler": settings.CELERY_BEAT_SCHEDULER,
     "result_backend": settings.CELERY_RESULT_BACKEND,
+    # Уведомления и служебные задачи - fire-and-forget, их результаты никто не читает
+    "task_ignore_result": True,
+
+    "task_queues": [Queue(name) for name in CELERY_QUEUES],
+    "task_default_queue": "default",
+    "task_routes": {
+        "app.comments.tasks.send_*": {"queue": "email"},
+        "app.comments.tasks.cleanup_*": {"queue": "maintenance"},
+        # Вложения (PIL, Cloudinary) пока обрабатываются в запросе. Когда они
+        # станут задачами, им нужна своя очередь "media" (маршрут "*.media_*")
+    },
+
+    # Подтверждение после выполнения: задачу умершего воркера получит другой.
+    # Задачи должны быть идемпотентными; неидемпотентные (отправка письма)
+    # объявляются с acks_late=False
+    "task_acks_late": True,
+    "task_reject_on_worker_lost": True,
+    # Долгие задачи: воркер не резервирует лишних, пока занят
+    "worker_prefetch_multiplier": settings.CELERY_PREFETCH_MULTIPLIER,
+    # Для Redis брокера: неподтвержденная задача вернется в очередь через это время,
+    # оно должно быть больше самой долгой задачи
+    "broker_transport_options": {"visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT},
 }
@@ -0,0 +1,40 @@
+"""
+Конфигурация gunicorn для режима asgi (entrypoint.sh):
+
+    gunicorn -c config/gunicorn.conf.py config.asgi:application
+
+Несколько процессов uvicorn (HTTP + WebSocket) вместо одного daphne.
+Мягкая остановка: по SIGTERM воркеры перестают принимать соединения и
+дорабатывают текущие запросы до GUNICORN_GRACEFUL_TIMEOUT секунд
+(stop_grace_period в docker-compose должен быть больше).
+"""
+import os
+
+
+def _int(name, default):
+    return int(os.getenv(name, default))
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# Воркер асинхронный, поэтому одного процесса на ядро достаточно
+workers = _int("GUNICORN_WORKERS", os.cpu_count() or 1)
+worker_class = "config.workers.UvicornWorker"
+
+graceful_timeout = _int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+timeout = _int("GUNICORN_TIMEOUT", 60)
+keepalive = _int("GUNICORN_KEEPALIVE", 5)
+# Перезапуск воркера после N запросов (0 - выключено); jitter разносит перезапуски
+max_requests = _int("GUNICORN_MAX_REQUESTS", 0)
+max_requests_jitter = _int("GUNICORN_MAX_REQUESTS_JITTER", 0)
+
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+def child_exit(server, worker):
+    """Файлы метрик умершего воркера не должны учитываться в livesum метриках"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
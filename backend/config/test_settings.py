@@ -11,8 +11,14 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": ":memory:",  # База в памяти для быстрых тестов
-    }
+    },
+    # Отдельная БД для проверки маршрутизации чтений на реплики
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
 }
+DATABASE_REPLICAS = []
 
 # ============================================
 # ЛОКАЛЬНЫЙ КЕШ (НЕ REDIS)
@@ -33,6 +39,14 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Presence и журнал событий без Redis
+PRESENCE_BACKEND = "local"
+EVENT_LOG_BACKEND = "local"
+
+# Ограничение частоты выключено (ThrottleTest задает скорости сам)
+THROTTLE_BACKEND = "local"
+THROTTLE_RATES = {}
+
 # ============================================
 # CELERY (СИНХРОННЫЙ РЕЖИМ ДЛЯ ТЕСТОВ)
 # ============================================
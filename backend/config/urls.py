@@ -2,13 +2,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.decorators.csrf import csrf_exempt
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from strawberry.django.views import GraphQLView
-from app.graphql.schema import schema
+from app.core.views import lazy_view, liveness, metrics, readiness
 
 
 urlpatterns = [
@@ -23,5 +21,10 @@ urlpatterns = [
 
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="docs"),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(schema=schema, graphiql=True))),
+    # Схема strawberry загружается при первом GraphQL запросе
+    path("graphql/", lazy_view("app.graphql.views.graphql_view")),
+
+    path("metrics", metrics, name="metrics"),
+    path("health/live/", liveness, name="health-live"),
+    path("health/ready/", readiness, name="health-ready"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
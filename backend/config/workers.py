@@ -0,0 +1,17 @@
+"""
+Воркер gunicorn для ASGI режима (entrypoint.sh asgi, см. gunicorn.conf.py).
+
+uvicorn с uvloop/httptools (loop/http "auto" выбирают их, если установлены),
+lifespan включен: на старте config.asgi настраивает пул потоков (ASGI_THREADS).
+"""
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto", "ws": "auto", "lifespan": "on"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # uvicorn сам закрывает оставшиеся соединения (WebSocket получают 1012)
+        # немного раньше, чем gunicorn убьет воркер по graceful_timeout
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout - 2, 1)
@@ -0,0 +1,262 @@
+"""
+Бюджеты SQL запросов для REST маршрутов и GraphQL полей.
+
+Каждый сценарий выполняется на фиксированных деревьях комментариев, число
+запросов и прочитанных строк сравнивается с tests/query_budgets.json.
+Превышение бюджета - ошибка с diff SQL относительно записанного в файле.
+После намеренного изменения файл пересобирается:
+
+    UPDATE_QUERY_BUDGETS=1 python manage.py test tests.test_query_budgets --settings=config.test_settings
+"""
+import difflib
+import json
+import os
+import re
+from pathlib import Path
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.comments.models import Comment, CommentAttachment
+from tests.tests import BaseTestCase, User
+
+
+BUDGETS_PATH = Path(__file__).with_name("query_budgets.json")
+UPDATE_BUDGETS = os.getenv("UPDATE_QUERY_BUDGETS") == "1"
+
+COMMENT_FIELDS = """
+    id text createdAt updatedAt descendantCount attachmentCount lastActivityAt
+    replyId shortText replyCount hasAttachments
+    user { id username email }
+    attachmentsList { id file mediaType }
+    replyList { id text user { username } }
+"""
+
+# (название, метод, путь, тело, нужна авторизация)
+# В путях и телах {wide}, {deep}, {leaf}, {bushy} заменяются id из setUpTestData
+REST_SCENARIOS = [
+    ("GET /api/comments/", "get", "/api/comments/", None, False),
+    ("GET /api/comments/ depth=2", "get", "/api/comments/?depth=2&replies_limit=3", None, False),
+    ("GET /api/comments/ fields", "get", "/api/comments/?fields=id,text,user,replies", None, False),
+    ("GET /api/comments/ stream", "get", "/api/comments/?stream=1", None, False),
+    ("POST /api/comments/", "post", "/api/comments/",
+     {"text": "New <b>reply</b>", "reply": "{leaf}", "recaptcha_token": "token"}, True),
+    ("GET /api/comments/<pk>/", "get", "/api/comments/{deep}/", None, False),
+    ("GET /api/comments/<pk>/ wide", "get", "/api/comments/{wide}/", None, False),
+    ("PATCH /api/comments/<pk>/", "patch", "/api/comments/{leaf}/", {"text": "Edited"}, True),
+    ("DELETE /api/comments/<pk>/", "delete", "/api/comments/{bushy}/", None, True),
+    ("GET /api/comments/<pk>/replies/", "get", "/api/comments/{wide}/replies/", None, False),
+    ("GET /api/comments/preview/", "get", "/api/comments/preview/", None, False),
+    ("POST /api/comments/preview-text/", "post", "/api/comments/preview-text/",
+     {"text": "<script>x</script> see https://example.com"}, True),
+    ("GET /api/comments/health/", "get", "/api/comments/health/", None, True),
+    ("GET /api/user/me/", "get", "/api/user/me/", None, True),
+    ("POST /api/user/register/", "post", "/api/user/register/",
+     {"username": "newbie", "email": "newbie@example.com", "password": "pass12345", "password2": "pass12345"},
+     False),
+]
+
+# (название, запрос, переменные, нужна авторизация)
+GRAPHQL_SCENARIOS = [
+    ("comments", f"{{ comments(limit: 10) {{ {COMMENT_FIELDS} }} }}", None, False),
+    ("comment", f"query($id: Int!) {{ comment(id: $id) {{ {COMMENT_FIELDS} }} }}", {"id": "{deep}"}, False),
+    ("commentReplies", f"query($id: Int!) {{ commentReplies(commentId: $id) {{ {COMMENT_FIELDS} }} }}",
+     {"id": "{wide}"}, False),
+    ("myComments", f"{{ myComments {{ {COMMENT_FIELDS} }} }}", None, True),
+    ("searchComments", f'{{ searchComments(query: "reply", limit: 10) {{ {COMMENT_FIELDS} }} }}', None, False),
+    ("me", "{ me { id username email } }", None, True),
+    ("commentCount", "{ commentCount }", None, False),
+    ("topLevelCommentCount", "{ topLevelCommentCount }", None, False),
+    ("userCommentCount", "{ userCommentCount }", None, True),
+    ("createComment", f'mutation($id: Int) {{ createComment(text: "GQL", replyId: $id) {{ {COMMENT_FIELDS} }} }}',
+     {"id": "{leaf}"}, True),
+    ("updateComment", f'mutation($id: Int!) {{ updateComment(commentId: $id, text: "Edited") {{ {COMMENT_FIELDS} }} }}',
+     {"id": "{leaf}"}, True),
+    ("deleteComment", "mutation($id: Int!) { deleteComment(commentId: $id) }", {"id": "{bushy}"}, True),
+]
+
+
+def normalize_sql(sql):
+    """SQL без переменных частей: списки IN сворачиваются, имена savepoint убираются"""
+    sql = re.sub(r"IN \((?:%s, )*%s\)", "IN (%s, ...)", sql)
+    return re.sub(r'"s\d+_x\d+"', '"<savepoint>"', sql)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper, запоминающий каждый запрос и число строк, которые
+    из него прочитали (fetchone/fetchmany/fetchall курсора)
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        entry = {"sql": normalize_sql(sql), "rows": 0}
+        self.queries.append(entry)
+        cursor = context["cursor"]
+        for name in ("fetchone", "fetchmany", "fetchall"):
+            setattr(cursor, name, self._counting(getattr(cursor.cursor, name), entry))
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def _counting(fetch, entry):
+        def counted(*args):
+            result = fetch(*args)
+            if isinstance(result, list):
+                entry["rows"] += len(result)
+            elif result is not None:
+                entry["rows"] += 1
+            return result
+
+        return counted
+
+    @property
+    def rows(self):
+        return sum(entry["rows"] for entry in self.queries)
+
+
+class QueryBudgetTest(BaseTestCase, APITestCase):
+    """Число запросов и строк не превышает записанного в query_budgets.json"""
+
+    measured = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="budget", email="budget@example.com", password="testpass123"
+        )
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        authors = [cls.user, other]
+
+        # Широкая ветка: 12 прямых ответов
+        wide = Comment.objects.create(user=cls.user, text="Wide root")
+        for index in range(12):
+            Comment.objects.create(user=authors[index % 2], text=f"Wide reply {index}", reply=wide)
+
+        # Глубокая цепочка из 6 ответов
+        deep = parent = Comment.objects.create(user=other, text="Deep root")
+        for level in range(6):
+            parent = Comment.objects.create(
+                user=authors[(level + 1) % 2], text=f"Deep reply {level}", reply=parent
+            )
+
+        # Куст 3 x 3 с вложениями
+        bushy = Comment.objects.create(user=cls.user, text="Bushy root")
+        for index in range(3):
+            child = Comment.objects.create(user=other, text=f"Bushy reply {index}", reply=bushy)
+            CommentAttachment.objects.create(
+                comment=child, file=f"https://example.com/{index}.png", media_type="image"
+            )
+            for nested in range(3):
+                Comment.objects.create(user=cls.user, text=f"Bushy reply {index}.{nested}", reply=child)
+
+        for index in range(5):
+            Comment.objects.create(user=authors[index % 2], text=f"Plain root {index}")
+
+        cls.ids = {"wide": wide.pk, "deep": deep.pk, "leaf": parent.pk, "bushy": bushy.pk}
+
+    def setUp(self):
+        super().setUp()
+        # Письмо уходит в Celery - его запросы не относятся к запросу API
+        email_patcher = patch("app.comments.tasks.send_reply_notification_email.delay")
+        email_patcher.start()
+        self.addCleanup(email_patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if UPDATE_BUDGETS and cls.measured:
+            budgets = load_budgets()
+            budgets.update(cls.measured)
+            BUDGETS_PATH.write_text(
+                json.dumps(dict(sorted(budgets.items())), indent=2, ensure_ascii=False) + "\n"
+            )
+
+    def _fill(self, value):
+        if isinstance(value, str):
+            value = value.format(**self.ids)
+            return int(value) if value.isdigit() else value
+        if isinstance(value, dict):
+            return {key: self._fill(item) for key, item in value.items()}
+        return value
+
+    def _login(self, auth, jwt):
+        self.client.logout()
+        self.client.credentials()
+        if auth and jwt:
+            token = RefreshToken.for_user(self.user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        elif auth:
+            self.client.force_login(self.user)
+
+    def _measure(self, name, request):
+        """Выполняет запрос в savepoint (состояние откатывается) и сверяет бюджет"""
+        recorder = QueryRecorder()
+
+        savepoint = transaction.savepoint()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = request()
+                if response.streaming:
+                    b"".join(response.streaming_content)
+        finally:
+            transaction.savepoint_rollback(savepoint)
+        self.assertLess(response.status_code, 400, f"{name}: {response.status_code}")
+
+        # Savepoint'ы появляются из-за транзакции TestCase (в проде это BEGIN/COMMIT)
+        recorder.queries = [entry for entry in recorder.queries if '"<savepoint>"' not in entry["sql"]]
+        measured = {
+            "queries": len(recorder.queries),
+            "rows": recorder.rows,
+            "sql": [entry["sql"] for entry in recorder.queries],
+        }
+        self.measured[name] = measured
+        if UPDATE_BUDGETS:
+            return
+
+        budget = load_budgets().get(name)
+        if budget is None:
+            self.fail(f"No query budget for {name!r}, run with UPDATE_QUERY_BUDGETS=1")
+        if measured["queries"] > budget["queries"] or measured["rows"] > budget["rows"]:
+            diff = "\n".join(
+                difflib.unified_diff(budget["sql"], measured["sql"], "budget", "current", lineterm="")
+            )
+            self.fail(
+                f"{name}: {measured['queries']} queries / {measured['rows']} rows, "
+                f"budget {budget['queries']} / {budget['rows']}\n{diff}"
+            )
+
+    def test_rest_routes(self):
+        for name, method, path, data, auth in REST_SCENARIOS:
+            with self.subTest(name):
+                self._login(auth, jwt=True)
+
+                def request():
+                    return getattr(self.client, method)(self._fill(path), self._fill(data), format="json")
+
+                self._measure(f"rest {name}", request)
+
+    def test_graphql_fields(self):
+        for name, query, variables, auth in GRAPHQL_SCENARIOS:
+            with self.subTest(name):
+                self._login(auth, jwt=False)
+
+                def request():
+                    response = self.client.post(
+                        "/graphql/", {"query": query, "variables": self._fill(variables)}, format="json"
+                    )
+                    self.assertNotIn("errors", response.json())
+                    return response
+
+                self._measure(f"graphql {name}", request)
+
+
+def load_budgets():
+    if not BUDGETS_PATH.exists():
+        return {}
+    return json.loads(BUDGETS_PATH.read_text())
@@ -2,25 +2,66 @@
 Полный набор тестов для CommentHub
 Переписано с нуля с учетом всех зависимостей
 """
+import asyncio
+import gzip
+import io
 import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
-from django.test import TestCase, override_settings, TransactionTestCase
+import brotli
+from prometheus_client import REGISTRY
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings, TransactionTestCase
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core import mail
-
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from asgiref.sync import async_to_sync
 from channels.testing import WebsocketCommunicator
 from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
 
-from app.comments.models import Comment
+from app.comments.models import Comment, CommentAttachment, OutboxEvent
+from app.comments.outbox import relay_outbox_events
 from app.comments.consumers import ReplyConsumer
-from app.comments.serializers import CommentSerializer, CommentCreateSerializer
+from app.comments.presence import PresenceTracker, LocalPresenceStore
+from app.comments.events import LocalEventLog, publish_reply
+from app.comments.readers import CommentTreeReader
+from app.comments.sanitizer import (
+    ALLOWED_ATTRIBUTES,
+    ALLOWED_TAGS,
+    _cached_clean_html,
+    clean_html,
+    get_sanitizers,
+)
+from app.comments.views import CommentDetailAPIView
+from app.comments.serializers import CommentSerializer, CommentCreateSerializer, CommentTextPreviewSerializer
+from app.core.db_router import routing_context
+from app.core.health import CHECKS as HEALTH_CHECKS, readiness_probe
+from app.core.json import FastJSONParser, FastJSONRenderer, dumps, loads
+from app.core.lifespan import lifespan
+from app.core.middleware import ReplicaRoutingMiddleware
+from app.core.throttling import LocalThrottleStore, RedisThrottleStore
+from app.core.timing import collect_timings, timed
 import app.comments.signals  # Явно импортируем сигналы для тестов
 
 User = get_user_model()
@@ -143,6 +184,193 @@ class CommentModelTest(TestCase):
         self.assertIsNotNone(comment.updated_at)
 
 
+class CommentCountersTest(TestCase):
+    """Тесты денормализованных счетчиков ветки"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpass123"
+        )
+        self.root = Comment.objects.create(user=self.user, text="Root")
+        self.child = Comment.objects.create(user=self.user, text="Child", reply=self.root)
+        self.grandchild = Comment.objects.create(
+            user=self.user, text="Grandchild", reply=self.child
+        )
+
+    def _counters(self, comment):
+        comment.refresh_from_db()
+        return comment.reply_count, comment.descendant_count, comment.attachment_count
+
+    def test_counters_on_create(self):
+        """Создание ответов обновляет счетчики всех предков"""
+        self.assertEqual(self._counters(self.root), (1, 2, 0))
+        self.assertEqual(self._counters(self.child), (1, 1, 0))
+        self.assertEqual(self._counters(self.grandchild), (0, 0, 0))
+        self.assertGreaterEqual(self.root.last_activity_at, self.grandchild.created_at)
+
+    def test_counters_on_delete(self):
+        """Удаление ответа уменьшает счетчики предков на все поддерево"""
+        self.child.refresh_from_db()
+        self.child.delete()
+
+        self.assertEqual(self._counters(self.root), (0, 0, 0))
+        self.grandchild.refresh_from_db()
+        self.assertIsNone(self.grandchild.reply)
+
+    def test_counters_on_move(self):
+        """Перенос ответа в другую ветку переносит счетчики поддерева"""
+        other = Comment.objects.create(user=self.user, text="Other")
+        child = Comment.objects.get(pk=self.child.pk)
+        child.reply = other
+        child.save()
+
+        self.assertEqual(self._counters(self.root), (0, 0, 0))
+        self.assertEqual(self._counters(other), (1, 2, 0))
+
+    def test_attachment_counter(self):
+        """Счетчик вложений"""
+        attachment = CommentAttachment.objects.create(
+            comment=self.child, file="https://example.com/a.png", media_type="image"
+        )
+        self.assertEqual(self._counters(self.child), (1, 1, 1))
+
+        attachment.delete()
+        self.assertEqual(self._counters(self.child), (1, 1, 0))
+
+    def test_rebuild_command(self):
+        """Команда пересчета находит и исправляет рассинхронизацию"""
+        Comment.objects.filter(pk=self.root.pk).update(reply_count=7, descendant_count=0)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_comment_counters", "--check", stdout=io.StringIO())
+
+        call_command("rebuild_comment_counters", stdout=io.StringIO())
+        self.assertEqual(self._counters(self.root), (1, 2, 0))
+        call_command("rebuild_comment_counters", "--check", stdout=io.StringIO())
+
+    def test_ancestor_queries_independent_of_depth(self):
+        """Предки читаются одним запросом: ответ на любой глубине стоит одинаково"""
+        parent = self.grandchild
+        for index in range(10):
+            parent = Comment.objects.create(user=self.user, text=f"Level {index}", reply=parent)
+
+        with CaptureQueriesContext(connection) as shallow:
+            Comment.objects.create(user=self.user, text="Shallow", reply=self.root)
+        with CaptureQueriesContext(connection) as deep:
+            Comment.objects.create(user=self.user, text="Deep", reply=parent)
+
+        self.assertEqual(len(deep), len(shallow))
+        self.assertEqual(self._counters(self.root), (2, 14, 0))
+
+    def test_counters_never_negative(self):
+        """Разошедшиеся счетчики не уходят ниже нуля при удалении"""
+        Comment.objects.filter(pk=self.root.pk).update(reply_count=0, descendant_count=1)
+
+        Comment.objects.get(pk=self.child.pk).delete()
+
+        self.assertEqual(self._counters(self.root), (0, 0, 0))
+
+
+class BulkImportExportTest(TestCase):
+    """Тесты команд export_comments / import_comments"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="testpass123"
+        )
+        root = Comment.objects.create(user=self.user, text="Root")
+        reply = Comment.objects.create(user=self.user, text="Reply", reply=root)
+        Comment.objects.create(user=self.user, text="Nested", reply=reply)
+        CommentAttachment.objects.create(
+            comment=reply, file="https://example.com/a.png", media_type="image"
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _tree(self):
+        return sorted(
+            (c.text, c.reply.text if c.reply else None, c.user.username, c.created_at,
+             c.reply_count, c.descendant_count, c.attachment_count)
+            for c in Comment.objects.select_related("reply", "user")
+        )
+
+    def _roundtrip(self, filename, *import_args):
+        path = os.path.join(self.tmpdir.name, filename)
+        expected = self._tree()
+        call_command("export_comments", path, stdout=io.StringIO())
+
+        Comment.objects.all().delete()
+        out = io.StringIO()
+        call_command("import_comments", path, *import_args, stdout=out)
+
+        self.assertEqual(self._tree(), expected)
+        self.assertIn("rows/s", out.getvalue())
+
+    def test_ndjson_roundtrip(self):
+        """Экспорт и импорт сохраняют дерево, даты, вложения и счетчики"""
+        self._roundtrip("comments.ndjson", "--no-clean", "--batch-size", "1")
+
+    def test_csv_gzip_roundtrip(self):
+        self._roundtrip("comments.csv.gz")
+
+    def test_children_before_parents(self):
+        """Ответы, идущие в файле раньше родителя, ждут его вставки"""
+        path = os.path.join(self.tmpdir.name, "old.ndjson")
+        rows = [
+            {"id": 30, "parent_id": 20, "user": "legacy", "text": "Child"},
+            {"id": 20, "parent_id": 10, "user": "legacy", "text": "Parent"},
+            {"id": 10, "parent_id": None, "user": "legacy", "text": "<script>x</script>Root"},
+            {"id": 40, "parent_id": 99, "user": "legacy", "text": "Orphan"},
+        ]
+        with open(path, "w") as f:
+            f.write("\n".join(json.dumps(row) for row in rows))
+
+        call_command("import_comments", path, "--batch-size", "2", stdout=io.StringIO())
+
+        child = Comment.objects.get(text="Child")
+        self.assertEqual(child.reply.text, "Parent")
+        root = child.reply.reply
+        self.assertEqual(root.text, "xRoot")
+        self.assertEqual(root.descendant_count, 2)
+        self.assertFalse(Comment.objects.filter(text="Orphan").exists())
+        self.assertFalse(User.objects.get(username="legacy").has_usable_password())
+
+        call_command("import_comments", path, "--orphans", "root", stdout=io.StringIO())
+        self.assertIsNone(Comment.objects.get(text="Orphan").reply)
+
+    def test_invalid_row(self):
+        path = os.path.join(self.tmpdir.name, "bad.ndjson")
+        with open(path, "w") as f:
+            f.write('{"id": 1, "user": "a", "text": "ok"}\n{"id": 2, "user": "a"}\n')
+
+        with self.assertRaisesMessage(CommandError, "Row 2"):
+            call_command("import_comments", path, stdout=io.StringIO())
+
+    def test_generate_comments(self):
+        """Синтетические ветки: заданное число корней, глубокие цепочки, счетчики"""
+        options = {"threads": 30, "users": 10, "alpha": 0.8, "attachment_rate": 0.2, "clear": True}
+        call_command("generate_comments", stdout=io.StringIO(), **options)
+        generated = list(Comment.objects.order_by("id").values_list("text", "reply_count"))
+
+        roots = Comment.objects.filter(reply__isnull=True)
+        self.assertEqual(roots.count(), 30)
+        self.assertEqual(
+            sum(roots.values_list("descendant_count", flat=True)) + 30, Comment.objects.count()
+        )
+        self.assertTrue(Comment.objects.filter(reply__reply__reply__isnull=False).exists())
+        self.assertTrue(CommentAttachment.objects.exists())
+        self.assertEqual(User.objects.filter(username__startswith="user").count(), 10)
+
+        # Тот же seed - те же данные
+        call_command("generate_comments", stdout=io.StringIO(), **options)
+        self.assertEqual(
+            list(Comment.objects.order_by("id").values_list("text", "reply_count")), generated
+        )
+
+
 # ============================================
 # ТЕСТЫ СЕРИАЛИЗАТОРОВ
 # ============================================
@@ -200,6 +428,45 @@ class CommentSerializerTest(BaseTestCase, TestCase):
         self.assertIn("<strong>", validated_text)
         self.assertIn("<code>", validated_text)
 
+    def test_sanitizer_matches_bleach(self):
+        """Общий Cleaner/Linker дает тот же результат, что bleach.clean + bleach.linkify"""
+        import bleach
+
+        for text in [
+            "<script>alert('xss')</script>Hello <strong>World</strong>",
+            '<a href="javascript:alert(1)" onclick="x">a</a> see example.com and mail@example.com',
+            "<div><p>Text <unknown>https://example.com/?a=1&b=2</unknown></p></div> &lt;b&gt;",
+        ]:
+            expected = bleach.linkify(
+                bleach.clean(text, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True),
+                parse_email=False,
+                callbacks=[],
+            )
+            self.assertEqual(clean_html(text), expected)
+
+    def test_sanitized_text_cached(self):
+        """Повторный текст (предпросмотр, затем создание) берется из LRU кеша"""
+        text = f"Hello https://example.com {uuid.uuid4()}"
+        hits = _cached_clean_html.cache_info().hits
+
+        first = CommentTextPreviewSerializer(data={"text": text})
+        second = CommentCreateSerializer(data={"text": text, "recaptcha_token": "test-token"})
+
+        self.assertTrue(first.is_valid())
+        self.assertTrue(second.is_valid())
+        self.assertEqual(first.validated_data["text"], second.validated_data["text"])
+        self.assertEqual(_cached_clean_html.cache_info().hits, hits + 1)
+
+    def test_sanitizers_per_thread(self):
+        """Cleaner/Linker переиспользуются в потоке и не делятся между потоками"""
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_sanitizers()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(get_sanitizers(), get_sanitizers())
+        self.assertIsNot(other[0][0], get_sanitizers()[0])
+
 
 # ============================================
 # ТЕСТЫ API
@@ -318,6 +585,911 @@ class CommentAPITest(BaseTestCase, APITestCase):
         self.assertEqual(results[0]["text"], "Parent")
 
 
+@override_settings(
+    THROTTLE_RATES={"comment_write": "2/min", "comment_preview": "2/min", "graphql_mutation": "2/min"},
+    THROTTLE_IP_FACTOR=2,
+)
+class ThrottleTest(BaseTestCase, APITestCase):
+    """Тесты ограничения частоты записи"""
+
+    def setUp(self):
+        super().setUp()
+        self.store = LocalThrottleStore()
+        self.patcher = patch("app.core.throttling.get_throttle_store", return_value=self.store)
+        self.patcher.start()
+        self.user = User.objects.create_user(username="spammer", password="testpass123")
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.patcher.stop()
+        super().tearDown()
+
+    def _post_comment(self, text="Spam"):
+        return self.client.post("/api/comments/", {"text": text, "recaptcha_token": "test-token"})
+
+    def test_create_throttled_before_validation(self):
+        """Лишний POST получает 429 с Retry-After без reCAPTCHA и записи в БД"""
+        for _ in range(2):
+            self.assertEqual(self._post_comment().status_code, status.HTTP_201_CREATED)
+        self.mock_recaptcha.reset_mock()
+
+        response = self._post_comment()
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.mock_recaptcha.assert_not_called()
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_reads_not_throttled(self):
+        """GET не расходует токены"""
+        for _ in range(5):
+            self.assertEqual(self.client.get("/api/comments/").status_code, status.HTTP_200_OK)
+        self.assertEqual(self._post_comment().status_code, status.HTTP_201_CREATED)
+
+    def test_ip_bucket_shared_by_users(self):
+        """Ведро IP ограничивает и других пользователей с того же адреса"""
+        for index in range(2):
+            user = User.objects.create_user(username=f"bot{index}", password="testpass123")
+            self.client.force_authenticate(user)
+            for _ in range(2):
+                self.assertEqual(self._post_comment().status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(User.objects.create_user(username="bot2", password="testpass123"))
+        self.assertEqual(self._post_comment().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Другой IP (NUM_PROXIES не задан - REMOTE_ADDR) - свое ведро
+        response = self.client.post(
+            "/api/comments/", {"text": "Spam", "recaptcha_token": "test-token"}, REMOTE_ADDR="10.0.0.2"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_preview_scope_separate(self):
+        """Предпросмотр текста ограничивается своим scope"""
+        self._post_comment()
+        self._post_comment()
+        for _ in range(2):
+            response = self.client.post("/api/comments/preview-text/", {"text": "Hi"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post("/api/comments/preview-text/", {"text": "Hi"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_graphql_mutation_throttled(self):
+        """Мутация сверх лимита - ошибка THROTTLED без записи"""
+        self.client.force_login(self.user)
+        query = {"query": "mutation { createComment(text: \"GQL\") { id } }"}
+        for _ in range(2):
+            self.assertNotIn("errors", self.client.post("/graphql/", query, format="json").json())
+
+        (error,) = self.client.post("/graphql/", query, format="json").json()["errors"]
+
+        self.assertEqual(error["extensions"]["code"], "THROTTLED")
+        self.assertGreater(error["extensions"]["retryAfter"], 0)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_redis_unavailable_fails_open(self):
+        """Клиент Redis с короткими таймаутами; ошибка Redis пропускает запрос"""
+        self.store = RedisThrottleStore("redis://127.0.0.1:1/0", timeout=0.05)
+        with patch("app.core.throttling.get_throttle_store", return_value=self.store), \
+                self.assertLogs("app.core.throttling", "WARNING"):
+            for _ in range(3):
+                self.assertEqual(self._post_comment().status_code, status.HTTP_201_CREATED)
+
+        connection_kwargs = self.store._script.registered_client.connection_pool.connection_kwargs
+        self.assertEqual(connection_kwargs["socket_timeout"], 0.05)
+        self.assertEqual(connection_kwargs["socket_connect_timeout"], 0.05)
+
+    def test_tokens_refill(self):
+        """Ведро пополняется со скоростью rate и не переполняется"""
+        bucket = [("scope:user:1", 2, 1.0)]
+        with patch("app.core.throttling.time.monotonic", side_effect=[0, 0, 0, 0.5, 1.0, 100]):
+            self.assertEqual(self.store.consume(bucket), 0)
+            self.assertEqual(self.store.consume(bucket), 0)
+            self.assertEqual(self.store.consume(bucket), 1.0)
+            self.assertEqual(self.store.consume(bucket), 0.5)
+            self.assertEqual(self.store.consume(bucket), 0)
+            self.assertEqual(self.store.consume(bucket), 0)
+            self.assertEqual(self.store._buckets["scope:user:1"][0], 1.0)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTest(BaseTestCase, APITestCase):
+    """Тесты маршрутизации чтений на реплики (две SQLite базы)"""
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpass123"
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def _results(self, response):
+        return response.data["results"]
+
+    def test_reads_go_to_replica(self):
+        """Анонимные чтения идут на реплику (которая еще не получила данные)"""
+        Comment.objects.create(user=self.user, text="Only on primary")
+
+        response = self.client.get("/api/comments/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._results(response), [])
+
+    def test_reads_pinned_to_primary_after_write(self):
+        """После записи пользователь видит свой комментарий несмотря на лаг реплики"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.post(
+            "/api/comments/",
+            {"text": "Fresh", "recaptcha_token": "test-token"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get("/api/comments/")
+        self.assertEqual([c["text"] for c in self._results(response)], ["Fresh"])
+
+        # Другой клиент все еще читает с реплики
+        self.client.credentials()
+        response = self.client.get("/api/comments/")
+        self.assertEqual(self._results(response), [])
+
+    def test_anonymous_pin_by_forwarded_ip(self):
+        """Анонимные клиенты за одним прокси закрепляются по X-Forwarded-For, а не по REMOTE_ADDR"""
+        factory = RequestFactory()
+        middleware = ReplicaRoutingMiddleware(lambda request: None)
+
+        def pin_key(client_ip):
+            return middleware._pin_key(
+                factory.get("/api/comments/", REMOTE_ADDR="172.18.0.5", HTTP_X_FORWARDED_FOR=client_ip)
+            )
+
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}):
+            self.assertNotEqual(pin_key("203.0.113.1"), pin_key("203.0.113.2"))
+            self.assertEqual(pin_key("203.0.113.1"), pin_key("203.0.113.1"))
+
+    def test_stream_keeps_primary_pin(self):
+        """Потоковый ответ читает ответы с primary, как и закрепленный запрос"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.client.post("/api/comments/", {"text": "Root", "recaptcha_token": "test-token"})
+        root = Comment.objects.get(text="Root")
+        Comment.objects.create(user=self.user, text="Reply", reply=root)
+
+        response = self.client.get("/api/comments/", {"stream": 1})
+        # Сервер потребляет поток вне состояния маршрутизации запроса
+        # (запись выше закрепила бы за primary и сам тест)
+        with routing_context():
+            data = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual([r["text"] for r in data["results"][0]["replies"]], ["Reply"])
+
+    def test_graphql_queries_read_from_replica(self):
+        """GraphQL запросы (POST) без записи читают с реплики"""
+        Comment.objects.create(user=self.user, text="Only on primary")
+
+        response = self.client.post(
+            "/graphql/", {"query": "{ commentCount }"}, format="json"
+        )
+
+        self.assertEqual(response.json()["data"]["commentCount"], 0)
+
+
+class CommentTreeLimitsTest(BaseTestCase, APITestCase):
+    """Тесты ограничения глубины и ленивой догрузки ответов"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpass123"
+        )
+        self.root = Comment.objects.create(user=self.user, text="Root")
+        self.replies = [
+            Comment.objects.create(user=self.user, text=f"Reply {i}", reply=self.root)
+            for i in range(5)
+        ]
+        Comment.objects.create(user=self.user, text="Nested", reply=self.replies[0])
+
+    def test_full_tree_by_default(self):
+        """Без параметров дерево возвращается целиком"""
+        response = self.client.get(f"/api/comments/{self.root.id}/")
+
+        self.assertEqual(len(response.data["replies"]), 5)
+        self.assertFalse(response.data["has_more"])
+        self.assertIsNone(response.data["next_cursor"])
+        self.assertEqual(response.data["replies"][0]["replies"][0]["text"], "Nested")
+
+    @override_settings(COMMENT_TREE_DEFAULT_DEPTH=1, COMMENT_TREE_DEFAULT_REPLIES_LIMIT=2)
+    def test_configured_default_limits(self):
+        """Ограничения по умолчанию из настроек применяются без параметров, остальное - по курсору"""
+        response = self.client.get(f"/api/comments/{self.root.id}/")
+
+        self.assertEqual([r["text"] for r in response.data["replies"]], ["Reply 0", "Reply 1"])
+        self.assertTrue(response.data["has_more"])
+        self.assertIsNotNone(response.data["next_cursor"])
+        self.assertEqual(response.data["replies"][0]["replies"], [])
+        self.assertTrue(response.data["replies"][0]["has_more"])
+
+    def test_replies_of_missing_comment(self):
+        """Ответы несуществующего комментария - 404, а не пустая страница"""
+        response = self.client.get("/api/comments/999999/replies/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_depth_limit(self):
+        """depth=1 встраивает только прямые ответы"""
+        response = self.client.get(f"/api/comments/{self.root.id}/", {"depth": 1})
+
+        first = response.data["replies"][0]
+        self.assertEqual(first["replies"], [])
+        self.assertTrue(first["has_more"])
+        self.assertIsNone(first["next_cursor"])
+        self.assertEqual(first["reply_count"], 1)
+
+    def test_replies_limit_and_cursor(self):
+        """Усеченный узел отдает курсор, по которому догружаются остальные ответы"""
+        response = self.client.get(
+            "/api/comments/", {"depth": 1, "replies_limit": 2}
+        )
+        root = response.data["results"][0]
+        self.assertEqual([r["text"] for r in root["replies"]], ["Reply 0", "Reply 1"])
+        self.assertTrue(root["has_more"])
+
+        response = self.client.get(
+            f"/api/comments/{self.root.id}/replies/",
+            {"cursor": root["next_cursor"], "page_size": 2, "depth": 0},
+        )
+        self.assertEqual(
+            [r["text"] for r in response.data["results"]], ["Reply 2", "Reply 3"]
+        )
+
+        response = self.client.get(
+            f"/api/comments/{self.root.id}/replies/",
+            {"cursor": response.data["next_cursor"], "page_size": 2},
+        )
+        self.assertEqual([r["text"] for r in response.data["results"]], ["Reply 4"])
+        self.assertIsNone(response.data["next_cursor"])
+
+    def test_invalid_params(self):
+        """Некорректные параметры отклоняются"""
+        response = self.client.get("/api/comments/", {"depth": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            f"/api/comments/{self.root.id}/replies/", {"cursor": "garbage"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CommentFieldsTest(BaseTestCase, APITestCase):
+    """Тесты выборочных полей (?fields=, ?expand=)"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpass123"
+        )
+        self.root = Comment.objects.create(user=self.user, text="Root")
+        Comment.objects.create(user=self.user, text="Reply", reply=self.root)
+
+    def test_fields_trim_response_and_replies(self):
+        """Возвращаются только запрошенные поля, в том числе во вложенных ответах"""
+        response = self.client.get(
+            f"/api/comments/{self.root.id}/", {"fields": "id,created_at,replies"}
+        )
+
+        self.assertEqual(set(response.data), {"id", "created_at", "replies"})
+        self.assertEqual(set(response.data["replies"][0]), {"id", "created_at", "replies"})
+
+    def test_expand_adds_related_fields(self):
+        """expand добавляет связанные поля к fields"""
+        response = self.client.get(
+            "/api/comments/", {"fields": "id", "expand": "user"}
+        )
+
+        result = response.data["results"][0]
+        self.assertEqual(set(result), {"id", "user"})
+        self.assertEqual(result["user"]["username"], "testuser")
+
+    def test_fields_trim_queryset(self):
+        """Без user и attachments не выполняются JOIN пользователей и запросы вложений"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/comments/", {"fields": "id,created_at"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("auth_user", sql)
+        self.assertNotIn("comments_commentattachment", sql)
+        self.assertNotIn('"text"', sql)
+
+    def test_unknown_field(self):
+        """Неизвестные поля отклоняются"""
+        response = self.client.get("/api/comments/", {"fields": "id,password"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get("/api/comments/", {"fields": "id", "expand": "text"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CommentTreeReaderTest(BaseTestCase, APITestCase):
+    """CommentTreeReader должен отдавать тот же JSON, что и CommentSerializer"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpass123"
+        )
+        for i in range(2):
+            root = Comment.objects.create(user=self.user, text=f"Root {i}")
+            CommentAttachment.objects.create(
+                comment=root, file=f"https://example.com/{i}.png", media_type="image"
+            )
+            for j in range(3):
+                reply = Comment.objects.create(user=self.user, text=f"Reply {i}.{j}", reply=root)
+                Comment.objects.create(user=self.user, text="Nested <b>", reply=reply)
+
+    def assertSameJSON(self, queryset, **context):
+        expected = CommentSerializer(queryset, many=True, context=context).data
+        reader = CommentTreeReader(**context)
+        actual = reader.render(reader.prepare(queryset))
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_matches_serializer(self):
+        """Совпадение для разных ограничений дерева и наборов полей"""
+        queryset = Comment.objects.filter(reply__isnull=True).order_by("-created_at")
+        self.assertSameJSON(queryset)
+        self.assertSameJSON(queryset, depth=1)
+        self.assertSameJSON(queryset, depth=0)
+        self.assertSameJSON(queryset, replies_limit=2)
+        self.assertSameJSON(queryset, depth=1, replies_limit=1)
+        self.assertSameJSON(queryset, fields=["id", "has_more", "next_cursor"], replies_limit=2)
+        self.assertSameJSON(queryset, fields=["id", "user", "replies", "attachments"])
+
+    def test_object_permissions_use_model_instance(self):
+        """Объектные права быстрого пути проверяются на экземпляре модели"""
+        class IsAuthor(BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return obj.user == request.user
+
+        root = Comment.objects.filter(reply__isnull=True).first()
+        other = User.objects.create_user(username="other", password="testpass123")
+        with patch.object(CommentDetailAPIView, "permission_classes", [IsAuthor]):
+            self.client.force_authenticate(self.user)
+            self.assertEqual(self.client.get(f"/api/comments/{root.id}/").status_code, status.HTTP_200_OK)
+            self.client.force_authenticate(other)
+            self.assertEqual(
+                self.client.get(f"/api/comments/{root.id}/").status_code, status.HTTP_403_FORBIDDEN
+            )
+
+    def test_api_matches_serializer(self):
+        """Ответы API побайтно совпадают с включенным и выключенным быстрым путем"""
+        root = Comment.objects.filter(reply__isnull=True).first()
+        requests = [
+            ("/api/comments/", {"replies_limit": 2}),
+            (f"/api/comments/{root.id}/", {"depth": 1}),
+            (f"/api/comments/{root.id}/replies/", {"page_size": 2}),
+        ]
+        for url, params in requests:
+            with self.settings(COMMENT_FAST_READS=False):
+                expected = self.client.get(url, params)
+            fast = self.client.get(url, params)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, expected.content)
+
+    def test_one_query_per_level(self):
+        """Дерево загружается запросом на уровень, а не на узел"""
+        queryset = Comment.objects.filter(reply__isnull=True)
+        reader = CommentTreeReader()
+        # корни, ответы, вложенные ответы, вложения корней
+        with self.assertNumQueries(4):
+            reader.render(reader.prepare(queryset))
+
+        response = self.client.get("/api/comments/999999/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTest(BaseTestCase, APITestCase):
+    """Тесты ETag для чтения комментариев"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpass123"
+        )
+        self.root = Comment.objects.create(user=self.user, text="Root")
+        self.reply = Comment.objects.create(user=self.user, text="Reply", reply=self.root)
+
+    def test_not_modified_with_single_query(self):
+        """Совпавший If-None-Match отдает 304 одним запросом, без сериализации"""
+        response = self.client.get("/api/comments/")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertNotIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/comments/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_etag_changes_with_subtree_and_params(self):
+        """Ответ в глубине ветки и другие параметры меняют ETag"""
+        url = f"/api/comments/{self.root.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertNotEqual(self.client.get(url, {"depth": 0})["ETag"], etag)
+
+        Comment.objects.create(user=self.user, text="Nested", reply=self.reply)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["descendant_count"], 2)
+
+        response = self.client.get("/api/comments/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since_ignored(self):
+        """If-Modified-Since не дает 304: секундная точность скрыла бы правку"""
+        url = f"/api/comments/{self.root.id}/replies/"
+        self.client.get(url)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_changes_with_author_profile(self):
+        """Смена username автора ответа меняет ETag ветки и списка"""
+        other = User.objects.create_user(username="author", password="testpass123")
+        Comment.objects.create(user=other, text="Nested", reply=self.reply)
+        url = f"/api/comments/{self.root.id}/"
+        detail_etag = self.client.get(url)["ETag"]
+        list_etag = self.client.get("/api/comments/")["ETag"]
+
+        other.username = "renamed"
+        other.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["replies"][0]["replies"][0]["user"]["username"], "renamed")
+        response = self.client.get("/api/comments/", HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_ignores_unrelated_users(self):
+        """Изменения пользователей вне ветки и вход автора не меняют ETag"""
+        url = f"/api/comments/{self.root.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        stranger = User.objects.create_user(username="stranger", password="testpass123")
+        stranger.username = "renamed"
+        stranger.save()
+        # Обновление last_login при входе (save(update_fields=["last_login"]))
+        self.client.login(username=self.user.username, password="testpass123")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_comment(self):
+        """Для несуществующего комментария валидаторы не выставляются"""
+        response = self.client.get("/api/comments/999999/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("ETag", response)
+
+
+class CompressionStreamingTest(BaseTestCase, APITestCase):
+    """Тесты сжатия ответов и потоковой выдачи списка"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpass123"
+        )
+        for i in range(8):
+            root = Comment.objects.create(user=self.user, text=f"Root {i} " + "text " * 20)
+            Comment.objects.create(user=self.user, text=f"Reply {i}", reply=root)
+
+    def test_stream_matches_buffered_response(self):
+        """Потоковый ответ побайтно совпадает с обычным"""
+        params = {"page_size": 5, "replies_limit": 1}
+        for fast_reads in (True, False):
+            with self.settings(COMMENT_FAST_READS=fast_reads, COMMENT_STREAM_BATCH_SIZE=2):
+                expected = self.client.get("/api/comments/", params).content
+                response = self.client.get("/api/comments/", {**params, "stream": 1})
+
+            self.assertTrue(response.streaming)
+            # Ссылка на следующую страницу сохраняет stream=1
+            streamed = b"".join(response.streaming_content).replace(b"&stream=1", b"")
+            self.assertEqual(streamed, expected)
+            self.assertEqual(json.loads(expected)["count"], 8)
+
+    async def test_stream_under_asgi(self):
+        """Под ASGI поток отдается асинхронным итератором без буферизации"""
+        response = await self.async_client.get("/api/comments/", {"stream": 1})
+
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(json.loads(content)["count"], 8)
+
+    def test_gzip_and_brotli(self):
+        """Большие JSON ответы сжимаются gzip или brotli"""
+        plain = self.client.get("/api/comments/").content
+        self.assertGreater(len(plain), 1024)
+
+        response = self.client.get("/api/comments/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+        response = self.client.get("/api/comments/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain)
+
+        response = self.client.get(
+            "/api/comments/", {"stream": 1}, HTTP_ACCEPT_ENCODING="br"
+        )
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), plain)
+
+    def test_small_responses_not_compressed(self):
+        """Ответы меньше COMPRESSION_MIN_SIZE отдаются как есть"""
+        response = self.client.get("/api/health/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertNotIn("Content-Encoding", response)
+
+
+class FastJSONTest(TestCase):
+    """Быстрый JSON должен кодировать так же, как JSONRenderer DRF"""
+
+    def setUp(self):
+        self.data = {
+            "id": 1,
+            "text": "Привет\u2028мир\u2029 <b>&</b> \"quoted\"",
+            "created_at": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            "day": date(2024, 5, 1),
+            "price": Decimal("12.50"),
+            "uid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+            "nested": [{"a": None, "b": True, "c": 1.5}],
+            1: "int key",
+        }
+
+    def test_matches_drf_renderer(self):
+        """Вывод совпадает для обоих бэкендов"""
+        expected = JSONRenderer().render(self.data)
+        for backend in ("orjson", "json"):
+            with self.settings(JSON_BACKEND=backend):
+                self.assertEqual(dumps(self.data), expected)
+                self.assertEqual(FastJSONRenderer().render(self.data), expected)
+
+    def test_indent_falls_back_to_drf(self):
+        """Запрошенный indent обрабатывается стандартным рендерером"""
+        content = FastJSONRenderer().render(
+            {"a": 1}, "application/json; indent=2", {}
+        )
+        self.assertEqual(content, b'{\n  "a": 1\n}')
+
+    def test_parser(self):
+        """Парсер читает UTF-8 и отклоняет некорректный JSON"""
+        for backend in ("orjson", "json"):
+            with self.settings(JSON_BACKEND=backend):
+                stream = io.BytesIO('{"text": "Привет"}'.encode())
+                self.assertEqual(FastJSONParser().parse(stream), {"text": "Привет"})
+                self.assertEqual(loads(b'[1, "a"]'), [1, "a"])
+
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(io.BytesIO(b'{"text": NaN}'))
+
+
+class ServerTimingTest(BaseTestCase, APITestCase):
+    """Тесты ServerTimingMiddleware и коллектора app.core.timing"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username="timing", email="timing@example.com", password="testpass123"
+        )
+        Comment.objects.create(user=self.user, text="Root")
+
+    def _metrics(self, response):
+        items = [item.strip() for item in response["Server-Timing"].split(",")]
+        return {item.split(";")[0]: item for item in items}
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_header(self):
+        """Заголовок содержит время SQL с числом запросов, рендеринг и итог"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/comments/")
+
+        metrics = self._metrics(response)
+        self.assertIn(f'desc="{len(queries)}x"', metrics["db"])
+        self.assertIn("serializer", metrics)
+        self.assertIn("render", metrics)
+        self.assertIn("app", metrics)
+        self.assertRegex(metrics["total"], r"^total;dur=\d+\.\d$")
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_external_calls_are_timed(self):
+        """reCAPTCHA и кеш попадают в свои метрики"""
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.post(
+            "/api/comments/", {"text": "New", "recaptcha_token": "token"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        metrics = self._metrics(response)
+        self.assertIn("recaptcha", metrics)
+        self.assertIn("cache", metrics)
+
+    @override_settings(SERVER_TIMING_HEADER=True, COMMENT_FAST_READS=False)
+    def test_serializer_timed_without_overlap(self):
+        """Сериализация замеряется и без быстрого пути; SQL внутри нее не считается дважды"""
+        comment = Comment.objects.first()
+        for url in ("/api/comments/", f"/api/comments/{comment.id}/"):
+            self.assertIn("serializer", self._metrics(self.client.get(url)))
+
+        with collect_timings() as timings:
+            with timed("serializer"):
+                time.sleep(0.02)
+                with timed("db"):
+                    time.sleep(0.02)
+        self.assertLess(timings.durations["serializer"], 0.035)
+        self.assertGreaterEqual(timings.durations["db"], 0.02)
+        self.assertLessEqual(sum(timings.durations.values()), timings.elapsed())
+
+    def test_header_disabled_by_default(self):
+        with self.assertLogs("app.timing", "DEBUG") as logs:
+            response = self.client.get("/api/comments/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertIn("GET /api/comments/ 200", logs.output[0])
+        self.assertEqual(logs.records[0].timings["status"], 200)
+
+    def test_slow_request_profile(self):
+        """Медленный запрос из выборки профилируется, профиль сохраняется в файл"""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        with self.settings(
+            SLOW_REQUEST_MS=0, SLOW_REQUEST_PROFILE_RATE=1, SLOW_REQUEST_PROFILE_DIR=tmpdir.name
+        ), self.assertLogs("app.timing", "WARNING") as logs:
+            self.client.get("/api/comments/")
+
+        (profile,) = os.listdir(tmpdir.name)
+        self.assertTrue(profile.endswith(".prof"))
+        self.assertIn("Slow request profile GET /api/comments/", logs.output[-1])
+        self.assertIn("cumulative", logs.output[-1])
+
+
+class MetricsTest(BaseTestCase, APITestCase):
+    """Тесты метрик Prometheus (app.core.metrics)"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username="metrics", email="metrics@example.com", password="testpass123"
+        )
+        Comment.objects.create(user=self.user, text="Root")
+
+    def _value(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_by_route(self):
+        """Запросы учитываются по шаблону маршрута, а не по пути"""
+        labels = {"method": "GET", "route": "api/comments/<int:pk>/", "status": "200"}
+        before = self._value("commenthub_http_request_duration_seconds_count", **labels)
+
+        comment = Comment.objects.get()
+        self.client.get(f"/api/comments/{comment.pk}/")
+        self.client.get(f"/api/comments/{comment.pk}/")
+
+        self.assertEqual(
+            self._value("commenthub_http_request_duration_seconds_count", **labels), before + 2
+        )
+
+    def test_cache_hits_and_misses(self):
+        """Превью: первый запрос - промах кеша, второй - попадание"""
+        hits = self._value("commenthub_cache_requests_total", key="comment_preview_list", result="hit")
+        misses = self._value("commenthub_cache_requests_total", key="comment_preview_list", result="miss")
+
+        self.client.get("/api/comments/preview/")
+        self.client.get("/api/comments/preview/")
+
+        self.assertEqual(
+            self._value("commenthub_cache_requests_total", key="comment_preview_list", result="miss"),
+            misses + 1,
+        )
+        self.assertEqual(
+            self._value("commenthub_cache_requests_total", key="comment_preview_list", result="hit"),
+            hits + 1,
+        )
+
+    def test_celery_task_duration(self):
+        from app.comments.tasks import send_reply_notification_email
+
+        labels = {"task": send_reply_notification_email.name, "state": "SUCCESS"}
+        before = self._value("commenthub_celery_task_duration_seconds_count", **labels)
+        send_reply_notification_email.apply(
+            kwargs={"user_email": "a@example.com", "comment_text_short": "Hi"}
+        )
+        self.assertEqual(
+            self._value("commenthub_celery_task_duration_seconds_count", **labels), before + 1
+        )
+
+    def test_metrics_endpoint(self):
+        """Эндпоинт отдает text exposition format только с токеном (без токена - лишь с DEBUG)"""
+        with self.settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response["Content-Type"].startswith("text/plain"))
+            self.assertIn(b"# TYPE commenthub_http_request_duration_seconds histogram", response.content)
+
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_websocket_gauges(self):
+        """Подключения и группы учитываются при connect и disconnect"""
+        connections = self._value("commenthub_websocket_connections")
+        groups = self._value("commenthub_websocket_groups")
+        sends = self._value("commenthub_channel_layer_send_seconds_count", event="new_reply")
+
+        async def scenario():
+            communicators = []
+            for _ in range(2):
+                communicator = WebsocketCommunicator(ReplyConsumer.as_asgi(), "/ws/comments/7/")
+                communicator.scope["user"] = self.user
+                communicator.scope["url_route"] = {"kwargs": {"comment_name": "7"}}
+                await communicator.connect()
+                communicators.append(communicator)
+
+            opened = (
+                self._value("commenthub_websocket_connections"),
+                self._value("commenthub_websocket_groups"),
+            )
+            for communicator in communicators:
+                await communicator.disconnect()
+            return opened
+
+        tracker = PresenceTracker(LocalPresenceStore(), ttl=30, flush_interval=3600)
+        with patch("app.comments.consumers.get_presence_tracker", return_value=tracker):
+            opened = async_to_sync(scenario)()
+        self.assertEqual(opened, (connections + 2, groups + 1))
+        self.assertEqual(self._value("commenthub_websocket_connections"), connections)
+        self.assertEqual(self._value("commenthub_websocket_groups"), groups)
+
+        publish_reply(7, {"id": 1})
+        self.assertEqual(
+            self._value("commenthub_channel_layer_send_seconds_count", event="new_reply"), sends + 1
+        )
+
+
+@override_settings(HEALTH_CHECKS=["database", "cache", "channel_layer"])
+class HealthCheckTest(TestCase):
+    """Тесты /health/live/ и /health/ready/"""
+
+    def setUp(self):
+        readiness_probe.reset()
+        self.addCleanup(readiness_probe.reset)
+
+    def test_liveness(self):
+        response = self.client.get("/health/live/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_readiness_reports_latency_and_caches(self):
+        """Все зависимости доступны; повторная проба берет результат из памяти"""
+        response = self.client.get("/health/ready/")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(set(data["checks"]), {"database", "cache", "channel_layer"})
+        for check in data["checks"].values():
+            self.assertEqual(check["status"], "ok")
+            self.assertGreaterEqual(check["latency_ms"], 0)
+        self.assertFalse(data["cached"])
+
+        with patch.dict(HEALTH_CHECKS, {"database": MagicMock()}) as checks:
+            self.assertTrue(self.client.get("/health/ready/").json()["cached"])
+            checks["database"].assert_not_called()
+
+    def test_failed_and_slow_dependencies(self):
+        """Ошибка или превышение таймаута дают 503 с описанием"""
+        def broken():
+            raise ConnectionError("connection refused")
+
+        with patch.dict(HEALTH_CHECKS, {"cache": broken, "channel_layer": lambda: time.sleep(0.5)}), \
+                self.settings(HEALTH_CHECK_TIMEOUT=0.1):
+            response = self.client.get("/health/ready/")
+
+        self.assertEqual(response.status_code, 503)
+        checks = response.json()["checks"]
+        self.assertEqual(checks["database"]["status"], "ok")
+        self.assertEqual(checks["cache"]["status"], "fail")
+        self.assertIn("connection refused", checks["cache"]["error"])
+        self.assertEqual(checks["channel_layer"]["status"], "timeout")
+
+    def test_hung_check_not_resubmitted(self):
+        """Пока предыдущий запуск проверки не завершился, она не запускается снова"""
+        release = threading.Event()
+        hung = MagicMock(side_effect=lambda: release.wait(5))
+        self.addCleanup(release.set)
+
+        with patch.dict(HEALTH_CHECKS, {"cache": hung}), self.settings(
+            HEALTH_CHECKS=["cache"], HEALTH_CHECK_TIMEOUT=0.05, HEALTH_CHECK_CACHE_SECONDS=0
+        ):
+            for _ in range(3):
+                response = self.client.get("/health/ready/")
+                self.assertEqual(response.json()["checks"]["cache"]["status"], "timeout")
+            self.assertEqual(hung.call_count, 1)
+
+            release.set()
+            readiness_probe._running["cache"].result(timeout=1)
+            self.assertEqual(self.client.get("/health/ready/").status_code, 200)
+            self.assertEqual(hung.call_count, 2)
+
+
+class AsgiLifespanTest(TestCase):
+    """Lifespan протокол для uvicorn воркеров"""
+
+    @patch.dict(os.environ, {"ASGI_THREADS": "2"})
+    async def test_startup_sizes_thread_pool(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await lifespan({"type": "lifespan"}, receive, send)
+
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        thread_name = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: threading.current_thread().name
+        )
+        self.assertTrue(thread_name.startswith("asgi"))
+
+
+class ImportFootprintTest(TestCase):
+    """Тяжелые зависимости не загружаются при старте процессов"""
+
+    def test_entry_points_skip_heavy_modules(self):
+        from benchmarks.importtime import ENTRY_POINTS, heavy_modules, run_entry
+
+        with patch.dict(os.environ, {"DJANGO_SETTINGS_MODULE": "config.test_settings"}):
+            for entry in ("web", "beat"):
+                with self.subTest(entry):
+                    modules, _, _ = run_entry(ENTRY_POINTS[entry])
+                    self.assertEqual(heavy_modules(modules), [])
+
+
+class ReleaseCommandTest(TestCase):
+    """manage.py release: миграции и суперпользователь одним процессом"""
+
+    @patch.dict(os.environ, {
+        "DJANGO_SUPERUSER_USERNAME": "admin",
+        "DJANGO_SUPERUSER_EMAIL": "admin@example.com",
+        "DJANGO_SUPERUSER_PASSWORD": "adminpass123",
+    })
+    def test_release_creates_superuser_once(self):
+        out = io.StringIO()
+        call_command("release", verbosity=0, stdout=out)
+        call_command("release", verbosity=0, stdout=out)
+
+        admin = User.objects.get(username="admin")
+        self.assertTrue(admin.is_superuser)
+        self.assertTrue(admin.check_password("adminpass123"))
+        self.assertIn("Superuser admin exists", out.getvalue())
+
+
 # ============================================
 # ТЕСТЫ WEBSOCKET
 # ============================================
@@ -390,6 +1562,196 @@ class WebSocketTest(TestCase):
         await communicator.disconnect()
 
 
+class PresenceTest(TestCase):
+    """Тесты счетчика зрителей веток"""
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(
+            ReplyConsumer.as_asgi(),
+            "/ws/comments/1/"
+        )
+        communicator.scope["user"] = user
+        communicator.scope["url_route"] = {"kwargs": {"comment_name": "1"}}
+        await communicator.connect()
+        return communicator
+
+    async def test_presence_counts_are_batched(self):
+        """Счетчик рассылается одним событием за flush"""
+        user = await database_sync_to_async(User.objects.create_user)(
+            username="testuser",
+            password="testpass123"
+        )
+        tracker = PresenceTracker(LocalPresenceStore(), ttl=30, flush_interval=3600)
+
+        with patch("app.comments.consumers.get_presence_tracker", return_value=tracker):
+            first = await self._connect(user)
+            second = await self._connect(user)
+
+            counts = await tracker.flush(get_channel_layer())
+            self.assertEqual(counts, {"comment_1": 2})
+
+            for communicator in (first, second):
+                data = json.loads(await communicator.receive_from())
+                self.assertEqual(data, {"type": "presence", "data": {"viewers": 2}})
+
+            # Повторный flush без изменений ничего не рассылает
+            await tracker.flush(get_channel_layer())
+            self.assertTrue(await first.receive_nothing())
+
+            await second.disconnect()
+            await tracker.flush(get_channel_layer())
+            data = json.loads(await first.receive_from())
+            self.assertEqual(data["data"]["viewers"], 1)
+
+            await first.disconnect()
+            tracker.stop()
+
+    async def test_expired_heartbeats_are_dropped(self):
+        """Записи упавших процессов истекают по TTL"""
+        store = LocalPresenceStore()
+        await store.sync({"comment_1": {"a", "b"}}, {}, now=100, ttl=30)
+
+        counts = await store.sync({"comment_1": {"a"}}, {}, now=200, ttl=30)
+        self.assertEqual(counts, {"comment_1": 1})
+
+
+class EventReplayTest(TestCase):
+    """Тесты догрузки пропущенных событий при переподключении"""
+
+    async def _connect(self, query_string=b""):
+        user = await database_sync_to_async(User.objects.create_user)(
+            username=f"user{len(self.communicators)}",
+            password="testpass123"
+        )
+        communicator = WebsocketCommunicator(
+            ReplyConsumer.as_asgi(),
+            "/ws/comments/1/?" + query_string.decode()
+        )
+        communicator.scope["user"] = user
+        communicator.scope["url_route"] = {"kwargs": {"comment_name": "1"}}
+        self.communicators.append(communicator)
+        await communicator.connect()
+        return communicator
+
+    def setUp(self):
+        self.communicators = []
+        self.event_log = LocalEventLog(maxlen=100, ttl=3600)
+        self.patcher = patch("app.comments.events.get_event_log", return_value=self.event_log)
+        self.patcher.start()
+        self.consumer_patcher = patch(
+            "app.comments.consumers.get_event_log", return_value=self.event_log
+        )
+        self.consumer_patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.consumer_patcher.stop()
+
+    async def test_replay_only_missed_events(self):
+        """После переподключения приходят только пропущенные события"""
+        first_id = await database_sync_to_async(publish_reply)(1, {"id": 10, "text": "First"})
+        await database_sync_to_async(publish_reply)(1, {"id": 11, "text": "Second"})
+        await database_sync_to_async(publish_reply)(1, {"id": 12, "text": "Third"})
+
+        communicator = await self._connect(f"since={first_id}".encode())
+
+        texts = []
+        for _ in range(2):
+            data = json.loads(await communicator.receive_from())
+            self.assertEqual(data["type"], "new_reply")
+            texts.append(data["data"]["text"])
+        self.assertEqual(texts, ["Second", "Third"])
+
+        # Живые события продолжают приходить после догрузки
+        await database_sync_to_async(publish_reply)(1, {"id": 13, "text": "Live"})
+        data = json.loads(await communicator.receive_from())
+        self.assertEqual(data["data"]["text"], "Live")
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    async def test_resync_required_when_history_is_gone(self):
+        """Если журнал уже не содержит since, клиент получает resync_required"""
+        await database_sync_to_async(publish_reply)(1, {"id": 10, "text": "First"})
+
+        communicator = await self._connect(b"since=1-0")
+        data = json.loads(await communicator.receive_from())
+        self.assertEqual(data, {"type": "resync_required"})
+
+        await communicator.disconnect()
+
+
+class OutboxTest(BaseTestCase, APITestCase):
+    """Тесты рассылки ответов через transactional outbox"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpass123"
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.root = Comment.objects.create(user=self.user, text="Root")
+        self.child = Comment.objects.create(user=self.user, text="Child", reply=self.root)
+
+    def _receive_group_messages(self, group, count):
+        channel_layer = get_channel_layer()
+
+        async def receive():
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(group, channel)
+            relay = database_sync_to_async(relay_outbox_events)
+            await relay()
+            return [await channel_layer.receive(channel) for _ in range(count)]
+
+        return async_to_sync(receive)()
+
+    def test_rest_reply_is_published_by_relay(self):
+        """REST ответ записывается в outbox и публикуется relay в группу корня"""
+        with patch("app.comments.events.get_channel_layer") as mock_layer:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+            response = self.client.post(
+                "/api/comments/",
+                {"text": "Nested", "reply": self.child.id, "recaptcha_token": "test-token"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            # В процессе запроса ничего не публикуется
+            mock_layer.assert_not_called()
+
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+        (message,) = self._receive_group_messages(f"comment_{self.root.id}", 1)
+        self.assertEqual(message["type"], "new_reply")
+        self.assertEqual(message["reply"]["text"], "Nested")
+        self.assertIn("event_id", message)
+        self.assertEqual(OutboxEvent.objects.count(), 0)
+
+    def test_graphql_reply_uses_outbox(self):
+        """GraphQL мутация создания ответа тоже пишет событие в outbox"""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            "/graphql/",
+            {
+                "query": "mutation($id: Int) { createComment(text: \"GQL\", replyId: $id) { id } }",
+                "variables": {"id": self.root.id},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("errors", response.json())
+
+        (message,) = self._receive_group_messages(f"comment_{self.root.id}", 1)
+        self.assertEqual(message["reply"]["text"], "GQL")
+
+    def test_relay_skips_deleted_comments(self):
+        """События удаленных комментариев отбрасываются"""
+        OutboxEvent.objects.create(comment_id=999999, event_type="new_reply")
+        self.assertEqual(relay_outbox_events(), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 0)
+
+
 # ============================================
 # ТЕСТЫ EMAIL УВЕДОМЛЕНИЙ
 # ============================================
@@ -465,6 +1827,52 @@ class EmailNotificationTest(BaseTestCase, APITestCase):
         self.assertIn("Новый ответ", mail.outbox[0].subject)
         self.assertIn("Test reply", mail.outbox[0].body)
 
+    def test_task_routes(self):
+        """Задачи попадают в очереди своего типа"""
+        from app.comments.tasks import send_reply_notification_email
+        from config.celery import app
+
+        routes = {
+            "app.comments.tasks.send_reply_notification_email": "email",
+            "app.comments.tasks.cleanup_failed_email_tasks": "maintenance",
+            "app.comments.tasks.unknown_task": "default",
+        }
+        for task_name, queue in routes.items():
+            with self.subTest(task_name):
+                self.assertEqual(app.amqp.router.route({}, task_name)["queue"].name, queue)
+        self.assertEqual(set(app.amqp.queues), {"default", "email", "maintenance"})
+        self.assertTrue(app.conf.task_acks_late)
+        self.assertEqual(app.conf.worker_prefetch_multiplier, 1)
+        # Письмо не должно уйти повторно после потери воркера
+        self.assertFalse(send_reply_notification_email.acks_late)
+
+    def test_result_policy(self):
+        """Результаты уведомлений не пишутся в БД, задачи с database_backend() - пишутся"""
+        from django_celery_results.models import TaskResult
+
+        from app.comments.tasks import send_reply_notification_email
+        from config.celery import app, database_backend
+
+        def stored_result():
+            return 42
+
+        stored = app.task(name="tests.stored_result", ignore_result=False, backend=database_backend())(
+            stored_result
+        )
+
+        # Результаты eager задач пишутся в хранилище так же, как в воркере
+        self.addCleanup(setattr, app.conf, "task_store_eager_result", app.conf.task_store_eager_result)
+        app.conf.task_store_eager_result = True
+
+        send_reply_notification_email.apply(
+            kwargs={"user_email": "test@example.com", "comment_text_short": "Reply"}
+        )
+        self.assertFalse(TaskResult.objects.exists())
+
+        result = stored.apply()
+        self.assertEqual(TaskResult.objects.get(task_id=result.id).status, "SUCCESS")
+        self.assertFalse(app.conf.result_extended)
+
 
 # ============================================
 # ТЕСТЫ КЕШИРОВАНИЯ
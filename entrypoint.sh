@@ -13,6 +13,12 @@ echo -e "${GREEN}========================================${NC}"
 
 cd /app/backend
 
+# Каталог метрик prometheus_client должен существовать до первого запуска
+# Django: config импортирует app.core.metrics, который сразу открывает в нем файлы
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # 1. Ожидание доступности порта базы данных
 wait_for_db() {
     echo -e "${YELLOW}⏳ Waiting for PostgreSQL port...${NC}"
@@ -26,73 +32,109 @@ wait_for_db() {
 # 2. Ожидание готовности таблиц (нужно для Celery Beat/Worker)
 wait_for_migrations() {
     echo -e "${YELLOW}⏳ Waiting for migrations to complete...${NC}"
-    until python manage.py check --database default > /dev/null 2>&1; do
-      echo -e "${YELLOW}   Migrations are not ready yet - sleeping${NC}"
+    until output=$(python manage.py migrate --check 2>&1); do
+      # Последняя строка: непримененная миграция или ошибка запуска Django
+      echo -e "${YELLOW}   Migrations are not ready yet - sleeping${NC} ($(echo "$output" | tail -n 1))"
       sleep 2
     done
     echo -e "${GREEN}✅ Migrations are ready!${NC}"
 }
 
-# 3. Запуск миграций в правильном порядке
-run_migrations() {
-    echo -e "${YELLOW}🔄 Checking and running migrations...${NC}"
-    python manage.py makemigrations users --noinput
-    python manage.py makemigrations comments --noinput
-    python manage.py migrate users --noinput
-    python manage.py migrate --noinput
+# 3. Миграции и суперпользователь одним процессом Django (manage.py release)
+run_release() {
+    echo -e "${YELLOW}🔄 Applying migrations...${NC}"
+    python manage.py release
+}
+
+# Метрики процессов прошлого запуска (prometheus_client multiprocess) не нужны
+reset_metrics_dir() {
+    if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+        rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+        mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    fi
 }
 
-collect_static() {
-    echo -e "${YELLOW}📦 Collecting static files...${NC}"
-    python manage.py collectstatic --noinput --clear
+# Статика собирается при сборке образа (Dockerfile) в $STATIC_ROOT;
+# release копирует ее в общий том, который раздает nginx
+export_static() {
+    if [ -n "$STATIC_EXPORT_DIR" ]; then
+        echo -e "${YELLOW}📦 Exporting static files...${NC}"
+        find "$STATIC_EXPORT_DIR" -mindepth 1 -delete
+        cp -a "$STATIC_ROOT/." "$STATIC_EXPORT_DIR/"
+    fi
 }
 
-create_superuser() {
-    if [ -n "$DJANGO_SUPERUSER_USERNAME" ]; then
-        echo -e "${YELLOW}👤 Checking superuser...${NC}"
-        python manage.py shell << END
-from django.contrib.auth import get_user_model
-User = get_user_model()
-if not User.objects.filter(username='$DJANGO_SUPERUSER_USERNAME').exists():
-    User.objects.create_superuser('$DJANGO_SUPERUSER_USERNAME', '$DJANGO_SUPERUSER_EMAIL', '$DJANGO_SUPERUSER_PASSWORD')
-    print("✅ Superuser created!")
-else:
-    print("ℹ️ Superuser exists")
-END
+# Без отдельного release контейнера (docker run ... server) миграции
+# можно применить перед стартом: RELEASE_ON_START=True
+release_on_start() {
+    if [ "$RELEASE_ON_START" = "True" ]; then
+        run_release
     fi
 }
 
 MODE=${1:-server}
 
 case "$MODE" in
+    release)
+        echo -e "${GREEN}📋 Mode: release (migrations, superuser, static)${NC}"
+        wait_for_db
+        run_release
+        export_static
+        echo -e "${GREEN}✅ Release complete${NC}"
+        ;;
+
     server)
         echo -e "${GREEN}🚀 Mode: $MODE (Daphne ASGI)${NC}"
         wait_for_db
-        run_migrations
-        collect_static
-        create_superuser
+        release_on_start
+        reset_metrics_dir
         # ИСПОЛЬЗУЕМ DAPHNE ДЛЯ WEBSOCKET!
         exec daphne -b 0.0.0.0 -p 8000 config.asgi:application
         ;;
     
+    asgi)
+        echo -e "${GREEN}🚀 Mode: $MODE (gunicorn + uvicorn workers)${NC}"
+        wait_for_db
+        release_on_start
+        reset_metrics_dir
+        # Несколько ASGI процессов (HTTP + WebSocket), настройки в config/gunicorn.conf.py
+        exec gunicorn -c config/gunicorn.conf.py config.asgi:application
+        ;;
+
     gunicorn)
         echo -e "${GREEN}🚀 Mode: $MODE${NC}"
         wait_for_db
-        run_migrations
-        collect_static
-        create_superuser
+        release_on_start
+        reset_metrics_dir
         exec gunicorn config.wsgi:application --bind 0.0.0.0:8000 --workers 4
         ;;
     
     celery_worker)
         echo -e "${GREEN}⚙️ Mode: celery_worker${NC}"
+        export APP_ROLE=worker
         wait_for_db
         wait_for_migrations
-        exec celery -A config worker --loglevel=info
+        reset_metrics_dir
+        # Очереди и параллелизм задаются на сервис: медленные очереди (email)
+        # обслуживает отдельный воркер и не задерживают остальные
+        exec celery -A config worker --loglevel=info \
+            --queues "${CELERY_WORKER_QUEUES:-default,email,maintenance}" \
+            --concurrency "${CELERY_WORKER_CONCURRENCY:-$(nproc)}" \
+            --pool "${CELERY_WORKER_POOL:-prefork}" \
+            --hostname "${CELERY_WORKER_NAME:-worker}@%h"
         ;;
     
+    outbox_relay)
+        echo -e "${GREEN}📡 Mode: outbox_relay${NC}"
+        export APP_ROLE=worker
+        wait_for_db
+        wait_for_migrations
+        exec python manage.py relay_outbox
+        ;;
+
     celery_beat)
         echo -e "${GREEN}⚙️ Mode: celery_beat${NC}"
+        export APP_ROLE=beat
         wait_for_db
         wait_for_migrations
         rm -f celerybeat-schedule